@@ -0,0 +1,2 @@
+#!/usr/bin/python
+# ex:set fileencoding=utf-8:
@@ -0,0 +1,47 @@
+#!/usr/bin/python
+# ex:set fileencoding=utf-8:
+
+"""
+compares the line-by-line igc parser with the bulk parser
+
+    python -m benchmarks.parse --hours 10 --rate 1
+"""
+
+from __future__ import unicode_literals
+
+import argparse
+import timeit
+
+from io import BytesIO
+
+import numpy as np
+
+from paragliding.parsers import Flight
+
+from .synthetic import igc
+
+
+def parse(data, bulk):
+    return Flight(BytesIO(data), "benchmark.igc", bulk=bulk)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the igc parsers')
+    parser.add_argument('--hours', type=float, default=10.0, help='duration of the flight')
+    parser.add_argument('--rate', type=float, default=1.0, help='fixes per second')
+    parser.add_argument('--repeat', type=int, default=3, help='number of runs')
+    args = parser.parse_args()
+
+    data = igc(args.hours, args.rate)
+    size = len(data) / 1e6
+
+    lines = parse(data, False)
+    bulk = parse(data, True)
+    for column in ('seconds', 'lat', 'lon', 'barheight', 'gpsheight', 'valid'):
+        assert np.array_equal(getattr(lines, column), getattr(bulk, column)), column
+    assert lines.time == bulk.time
+
+    print("%d fixes, %.1f MB" % (bulk.datapoints, size))
+    for name, mode in (("lines", False), ("bulk", True)):
+        best = min(timeit.repeat(lambda: parse(data, mode), number=1, repeat=args.repeat))
+        print("%-6s %8.3f s %8.1f MB/s" % (name, best, size / best))
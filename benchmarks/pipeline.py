@@ -0,0 +1,220 @@
+#!/usr/bin/python
+# ex:set fileencoding=utf-8:
+
+"""
+times and memory-profiles every stage of the flight pipeline and of the
+flight log export on synthetic flights, optionally comparing the results
+with a stored baseline
+
+    python -m benchmarks.pipeline --hours 1 12 --rate 1 5 --output results.json
+    python -m benchmarks.pipeline --hours 1 12 --rate 1 5 --baseline results.json
+"""
+
+from __future__ import unicode_literals
+
+import argparse
+import json
+import platform
+import sys
+import timeit
+
+from io import BytesIO
+
+import numpy as np
+
+from paragliding import analytics
+from paragliding import geodesy
+from paragliding.kml import write_kmz
+from paragliding.parsers import FREE_DISTANCE_TURNPOINTS
+from paragliding.parsers import LOD_COARSE_TOLERANCE
+from paragliding.parsers import Flight
+from paragliding.parsers import FlightLog
+from paragliding.smoothing import averages
+from paragliding.smoothing import binom
+
+from .synthetic import igc
+
+try:
+    import tracemalloc
+except ImportError:  # pragma: no cover
+    tracemalloc = None
+
+
+# a stage is slower (or uses more memory) than the baseline, if it exceeds
+# it by this fraction. differences below NOISE seconds are ignored
+TOLERANCE = 0.25
+NOISE = 0.01
+
+
+def copy(flight):
+    # a new flight without the cached trig terms, distances and analytics
+    return Flight.from_fixes(
+        flight.fixes, flight.name,
+        location=flight.location, pilot=flight.pilot, glider=flight.glider, date=flight.date,
+    )
+
+
+def flight_stages(data):
+    """
+    returns the stages of a single flight as (name, function)
+    """
+    flight = Flight(BytesIO(data), "benchmark.igc")
+
+    def kmz():
+        write_kmz(BytesIO(), "benchmark.kml", flight.iter_document())
+
+    return [
+        ("read_igc", lambda: Flight(BytesIO(data), "benchmark.igc")),
+        ("averages", lambda: averages(flight.gpsheight, 20, binom)),
+        ("trig", lambda: geodesy.trig(flight.lat, flight.lon)),
+        ("analytics", lambda: analytics.Analytics(flight.seconds, flight.gpsheight, flight.get_trig())),
+        ("calc_turning_points", lambda: copy(flight).calc_turning_points(FREE_DISTANCE_TURNPOINTS)),
+        ("calc_fai_triangle", lambda: copy(flight).calc_fai_triangle()),
+        ("iter_document", lambda: "".join(copy(flight).iter_document())),
+        ("iter_document_simplified", lambda: "".join(copy(flight).iter_document(tolerance=LOD_COARSE_TOLERANCE))),
+        ("write_kmz", kmz),
+    ]
+
+
+def log_stages(data, flights):
+    """
+    returns the stages of the export of a flight log with ``flights``
+    copies of the flight
+    """
+    flight = Flight(BytesIO(data), "benchmark.igc")
+
+    def log():
+        result = FlightLog()
+        for n in range(flights):
+            result.add_flight(copy(flight))
+        return result
+
+    def make_tree():
+        log().make_tree()
+
+    def kmz():
+        write_kmz(BytesIO(), "flights.kml", log().iter_document())
+
+    def lod():
+        log().write_lod_kmz(BytesIO())
+
+    return [
+        ("flightlog_make_tree", make_tree),
+        ("flightlog_write_kmz", kmz),
+        ("flightlog_write_lod_kmz", lod),
+    ]
+
+
+def measure(function, repeat):
+    """
+    returns the times of the runs and the peak of the memory allocated by
+    one run (None without tracemalloc)
+    """
+    times = timeit.repeat(function, number=1, repeat=repeat)
+    peak = None
+    if tracemalloc is not None:
+        tracemalloc.start()
+        try:
+            function()
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+    return times, peak
+
+
+def run(hours, rates, repeat=3, flights=5, stages=None, report=None):
+    """
+    returns the results of all stages for every duration and rate
+    """
+    results = []
+    for duration in hours:
+        for rate in rates:
+            data = igc(duration, rate)
+            fixes = Flight(BytesIO(data), "benchmark.igc").datapoints
+            for name, function in flight_stages(data) + log_stages(data, flights):
+                if stages and name not in stages:
+                    continue
+                times, peak = measure(function, repeat)
+                result = {
+                    'key': "%s@%gh-%gHz" % (name, duration, rate),
+                    'stage': name,
+                    'hours': duration,
+                    'rate': rate,
+                    'fixes': fixes,
+                    'bytes': len(data),
+                    'seconds': min(times),
+                    'runs': times,
+                    'peak_memory': peak,
+                }
+                results.append(result)
+                if report is not None:
+                    report(result)
+    return results
+
+
+def environment():
+    return {
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'platform': platform.platform(),
+        'processor': platform.processor(),
+    }
+
+
+def compare(results, baseline, tolerance=TOLERANCE, noise=NOISE):
+    """
+    returns the regressions against the baseline results as a list of
+    (key, measure, baseline, value)
+    """
+    reference = dict((result['key'], result) for result in baseline)
+    regressions = []
+    for result in results:
+        base = reference.get(result['key'])
+        if base is None:
+            continue
+        if result['seconds'] > base['seconds'] * (1 + tolerance) and result['seconds'] - base['seconds'] > noise:
+            regressions.append((result['key'], 'seconds', base['seconds'], result['seconds']))
+        if result['peak_memory'] and base.get('peak_memory') and \
+                result['peak_memory'] > base['peak_memory'] * (1 + tolerance):
+            regressions.append((result['key'], 'peak_memory', base['peak_memory'], result['peak_memory']))
+    return regressions
+
+
+def report(result):
+    peak = "%10.1f MB" % (result['peak_memory'] / 1e6) if result['peak_memory'] is not None else "%13s" % "-"
+    sys.stdout.write("%-45s %8d fixes %10.4f s %s\n" % (result['key'], result['fixes'], result['seconds'], peak))
+    sys.stdout.flush()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the stages of the flight pipeline')
+    parser.add_argument('--hours', type=float, nargs='+', default=[1.0], help='durations of the flights')
+    parser.add_argument('--rate', type=float, nargs='+', default=[1.0], help='fixes per second')
+    parser.add_argument('--repeat', type=int, default=3, help='number of runs per stage')
+    parser.add_argument('--flights', type=int, default=5, help='number of flights in the flight log')
+    parser.add_argument('--stage', action='append', help='run only this stage (repeatable)')
+    parser.add_argument('--output', metavar='<file>', help='write the results as json')
+    parser.add_argument('--baseline', metavar='<file>', help='compare with the results in this file')
+    parser.add_argument(
+        '--tolerance', type=float, default=TOLERANCE,
+        help='allowed slowdown (fraction) before a stage counts as regression',
+    )
+    args = parser.parse_args()
+
+    results = run(args.hours, args.rate, args.repeat, args.flights, args.stage, report)
+
+    if args.output:
+        with open(args.output, 'w') as file_obj:
+            json.dump({'environment': environment(), 'results': results}, file_obj, indent=2, sort_keys=True)
+
+    if args.baseline:
+        with open(args.baseline) as file_obj:
+            baseline = json.load(file_obj)
+        regressions = compare(results, baseline['results'], args.tolerance)
+        for key, name, base, value in regressions:
+            sys.stdout.write("REGRESSION %s %s: %g -> %g (%+.0f%%)\n" % (
+                key, name, base, value, (value / base - 1) * 100,
+            ))
+        if regressions:
+            sys.exit(1)
+        sys.stdout.write("no regressions against %s\n" % args.baseline)
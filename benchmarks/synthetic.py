@@ -0,0 +1,59 @@
+#!/usr/bin/python
+# ex:set fileencoding=utf-8:
+
+from __future__ import unicode_literals
+
+import numpy as np
+
+
+HEADER = (
+    "AXXX001 synthetic flight\r\n"
+    "HFDTE%(date)s\r\n"
+    "HOPLTPILOT:%(pilot)s\r\n"
+    "HOGTYGLIDERTYPE:%(glider)s\r\n"
+    "HPSITSITE:%(site)s\r\n"
+)
+
+
+def coordinate(value, degrees, positive, negative):
+    hemisphere = positive if value >= 0 else negative
+    value = abs(value)
+    deg = int(value)
+    mmin = int(round((value - deg) * 60000))
+    if mmin == 60000:
+        deg, mmin = deg + 1, 0
+    return "%0*d%05d%s" % (degrees, deg, mmin, hemisphere)
+
+
+def igc(hours=1.0, rate=1.0, seed=0, lat=47.0, lon=11.0, start=36000, date="150716",
+        pilot="Synthetic Pilot", glider="Synthetic Glider", site="Synthetic Site"):
+    """
+    generates an igc file (as bytes) with a random walk of ``hours`` duration,
+    sampled with ``rate`` fixes per second
+    """
+    random = np.random.RandomState(seed)
+    n = int(hours * 3600 * rate)
+
+    heading = np.cumsum(random.normal(0, 0.1, n))
+    speed = 8.0 + random.normal(0, 1, n)
+    vario = np.sin(np.arange(n) / (600. * rate)) * 2.0 + random.normal(0, 0.5, n)
+
+    north = np.cumsum(np.cos(heading) * speed / rate)
+    east = np.cumsum(np.sin(heading) * speed / rate)
+    height = np.clip(1500 + np.cumsum(vario / rate), 200, 5000)
+
+    lats = lat + north / 111195.
+    lons = lon + east / (111195. * np.cos(np.radians(lat)))
+    seconds = (start + np.arange(n) / rate).astype(int) % 86400
+
+    lines = [HEADER % dict(date=date, pilot=pilot, glider=glider, site=site)]
+    for i in range(n):
+        s = seconds[i]
+        lines.append("B%02d%02d%02d%s%sA%05d%05d000\r\n" % (
+            s // 3600, s // 60 % 60, s % 60,
+            coordinate(lats[i], 2, "N", "S"),
+            coordinate(lons[i], 3, "E", "W"),
+            height[i] - 30,
+            height[i],
+        ))
+    return "".join(lines).encode("latin1")
@@ -0,0 +1,204 @@
+#!/usr/bin/python
+# ex:set fileencoding=utf-8:
+
+from __future__ import unicode_literals
+
+import numpy as np
+
+from . import geodesy
+from . import instrument
+from .smoothing import averages
+from .smoothing import binom
+from .smoothing import moving
+
+
+# fixes of the binomial filter applied to the gps altitude
+HEIGHT_SMOOTHING = 20
+
+# a thermal is a climb of at least THERMAL_CLIMB (m/s, averaged over
+# THERMAL_WINDOW seconds), which lasts THERMAL_MIN_DURATION seconds.
+# climbs interrupted for less than THERMAL_GAP seconds are merged
+THERMAL_CLIMB = 0.5
+THERMAL_WINDOW = 20.0
+THERMAL_MIN_DURATION = 30.0
+THERMAL_GAP = 20.0
+
+# one record per thermal or glide, start and end are indices of fixes
+SEGMENT_DTYPE = np.dtype([
+    ('start', np.int64),
+    ('end', np.int64),
+    ('duration', np.float64),
+    ('gain', np.float64),
+    ('climb', np.float64),
+    ('distance', np.float64),
+    ('glide', np.float64),
+])
+
+
+def gradient(values, seconds):
+    """
+    rate of change per second at every fix, from the neighbouring fixes
+    (central differences, one-sided at the ends). fixes without elapsed
+    time get 0
+    """
+    if len(values) < 2:
+        return np.zeros(len(values))
+    delta = np.gradient(np.asarray(values, dtype=np.float64))
+    steps = np.gradient(np.asarray(seconds, dtype=np.float64))
+    result = np.zeros(len(values))
+    np.divide(delta, steps, out=result, where=steps > 0)
+    return result
+
+
+def headings(lat, lon, cos):
+    """
+    initial bearing (degree, clockwise from north) from every fix to the
+    next one, the last fix keeps the heading of the previous one. the
+    arguments are the terms of geodesy.trig
+    """
+    if len(lat) < 2:
+        return np.zeros(len(lat))
+    dlon = lon[1:] - lon[:-1]
+    y = np.sin(dlon) * cos[1:]
+    x = cos[:-1] * np.sin(lat[1:]) - np.sin(lat[:-1]) * cos[1:] * np.cos(dlon)
+    result = np.degrees(np.arctan2(y, x)) % 360.0
+    return np.concatenate((result, result[-1:]))
+
+
+def runs(mask):
+    """
+    returns the first and last index of every run of True values
+    """
+    edges = np.diff(np.concatenate(([0], mask.astype(np.int8), [0])))
+    return np.flatnonzero(edges == 1), np.flatnonzero(edges == -1) - 1
+
+
+def segments(starts, ends, seconds, height, distances):
+    """
+    returns the figures of the segments [start, end] as SEGMENT_DTYPE.
+    distances is the cumulative ground distance at every fix
+    """
+    result = np.zeros(len(starts), dtype=SEGMENT_DTYPE)
+    result['start'] = starts
+    result['end'] = ends
+    result['duration'] = seconds[ends] - seconds[starts]
+    result['gain'] = height[ends] - height[starts]
+    result['distance'] = distances[ends] - distances[starts]
+    np.divide(result['gain'], result['duration'], out=result['climb'], where=result['duration'] > 0)
+    # the glide ratio is infinite without loss of height
+    result['glide'] = np.inf
+    sink = result['gain'] < 0
+    result['glide'][sink] = result['distance'][sink] / -result['gain'][sink]
+    return result
+
+
+class Analytics(object):
+    """
+    the derived quantities of a flight: per fix the smoothed gps altitude
+    (m), the ground speed (m/s), the vertical speed (m/s), the glide ratio
+    and the heading (degree) and the flight split into thermals and glides
+    (SEGMENT_DTYPE)
+    """
+
+    __slots__ = (
+        'seconds',
+        'smooth_height',
+        'deltas',
+        'distances',
+        'speed',
+        'vario',
+        'glide',
+        'heading',
+        'thermals',
+        'glides',
+    )
+
+    def __init__(self, seconds, gpsheight, trig):
+        lat, lon, cos = trig
+        self.seconds = seconds = np.asarray(seconds, dtype=np.float64)
+        with instrument.stage('smoothing'):
+            self.smooth_height = averages(gpsheight, HEIGHT_SMOOTHING, binom)
+        # change of the smoothed height per segment between two fixes
+        self.deltas = np.diff(self.smooth_height)
+
+        legs = geodesy.haversine(lat[:-1], lon[:-1], cos[:-1], lat[1:], lon[1:], cos[1:])
+        self.distances = np.concatenate(([0.0], np.cumsum(legs)))[:len(seconds)]
+
+        self.speed = gradient(self.distances, seconds)
+        self.vario = gradient(self.smooth_height, seconds)
+        self.glide = np.full(len(seconds), np.inf)
+        sink = self.vario < 0
+        self.glide[sink] = self.speed[sink] / -self.vario[sink]
+        self.heading = headings(lat, lon, cos)
+
+        self.thermals, self.glides = self.segment()
+
+    def segment(self, climb=THERMAL_CLIMB, window=THERMAL_WINDOW, min_duration=THERMAL_MIN_DURATION,
+                gap=THERMAL_GAP):
+        """
+        returns the thermals and the glides between them
+        """
+        seconds = self.seconds
+        empty = np.zeros(0, dtype=SEGMENT_DTYPE)
+        if len(seconds) < 2:
+            return empty, empty
+
+        # the window in fixes from the median time step
+        step = np.median(np.diff(seconds))
+        fixes = int(round(window / step)) if step > 0 else 1
+        starts, ends = runs(averages(self.vario, fixes, moving) >= climb)
+
+        # climbs with short interruptions are one thermal
+        if len(starts):
+            split = seconds[starts[1:]] - seconds[ends[:-1]] >= gap
+            starts = starts[np.concatenate(([True], split))]
+            ends = ends[np.concatenate((split, [True]))]
+        lasting = seconds[ends] - seconds[starts] >= min_duration
+        starts = starts[lasting]
+        ends = ends[lasting]
+
+        # glides connect the thermals, the take-off and the landing
+        glide_starts = np.concatenate(([0], ends))
+        glide_ends = np.concatenate((starts, [len(seconds) - 1]))
+        nonempty = glide_ends > glide_starts
+
+        height = self.smooth_height
+        return (
+            segments(starts, ends, seconds, height, self.distances),
+            segments(glide_starts[nonempty], glide_ends[nonempty], seconds, height, self.distances),
+        )
+
+    @property
+    def climbs(self):
+        """
+        mean climb rate (m/s) of the segments with elapsed time
+        """
+        steps = np.diff(self.seconds)
+        return self.deltas[steps > 0] / steps[steps > 0]
+
+    def as_dict(self):
+        """
+        returns the figures of the flight and of the thermals and glides,
+        an infinite glide ratio is None
+        """
+        def value(number):
+            number = number.item()
+            return number if np.isfinite(number) else None
+
+        def rows(array):
+            return [
+                dict((name, value(array[name][n])) for name in SEGMENT_DTYPE.names)
+                for n in range(len(array))
+            ]
+
+        climbs = self.climbs
+        return {
+            'max_speed': float(self.speed.max()) if len(self.speed) else 0.0,
+            'max_climb': float(climbs.max()) if len(climbs) else 0.0,
+            'max_sink': float(climbs.min()) if len(climbs) else 0.0,
+            'distance': float(self.distances[-1]) if len(self.distances) else 0.0,
+            'thermal_time': float(self.thermals['duration'].sum()),
+            'thermal_gain': float(self.thermals['gain'].sum()),
+            'thermals': rows(self.thermals),
+            'glides': rows(self.glides),
+        }
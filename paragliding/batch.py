@@ -0,0 +1,349 @@
+#!/usr/bin/python
+# ex:set fileencoding=utf-8:
+
+from __future__ import unicode_literals
+
+import hashlib
+import io
+import json
+import numpy as np
+import os
+import traceback
+import zlib
+
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import as_completed
+from datetime import datetime
+from itertools import chain
+from pytz import utc
+
+from . import kml
+from .parsers import Flight
+from .parsers import FlightLog
+from .parsers import VARIO_RESOLUTION
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+# results cached with an other version are not used. increase it, when
+# the parsing or the rendering changes the output
+CONVERTER_VERSION = 1
+
+
+def variant(palette=None, resolution=None, tolerance=None):
+    """
+    returns a hashable key of the arguments of Flight.iter_kml
+    """
+    return (tuple(palette) if palette else None, resolution, tolerance)
+
+
+class RenderedFlight(object):
+    """
+    a flight converted by a worker process: the header information, the
+    bounds and the kml folder of every variant (palette, resolution,
+    tolerance), compressed. it replaces the flight in a FlightLog
+    """
+
+    __slots__ = (
+        'location',
+        'pilot',
+        'glider',
+        'date',
+        'name',
+        'boundaries',
+        'start',
+        'fragments',
+    )
+
+    def __init__(self, info, fragments):
+        self.location = info['location']
+        self.pilot = info['pilot']
+        self.glider = info['glider']
+        self.date = info['date']
+        self.name = info['name']
+        self.boundaries = tuple(info['bounds'])
+        # entries cached before the take-off was stored have none
+        self.start = tuple(info['takeoff']) if info.get('takeoff') else None
+        self.fragments = fragments
+
+    @classmethod
+    def render(cls, flight, variants, fragments=None):
+        """
+        renders the variants of the flight, which are not in fragments
+        """
+        fragments = dict(fragments or {})
+        for key in variants:
+            key = variant(*key)
+            if key not in fragments:
+                data = ''.join(flight.iter_kml(*key)).encode('utf-8')
+                fragments[key] = zlib.compress(data)
+        return cls(describe(flight), fragments)
+
+    def bounds(self):
+        return self.boundaries
+
+    def takeoff(self):
+        return self.start
+
+    def __str__(self):
+        return self.name or "Trajectory"
+
+    def __repr__(self):
+        return "<%s: '%s' at 0x%x>" % (self.__class__.__name__, str(self), id(self))
+
+    def iter_kml(self, palette=None, resolution=None, tolerance=None):
+        """
+        yields the rendered kml folder of the flight
+        """
+        key = variant(palette, resolution, tolerance)
+        if key not in self.fragments:
+            raise ValueError("%s was not rendered with %r" % (self, key))
+        return iter([zlib.decompress(self.fragments[key]).decode('utf-8')])
+
+    def iter_document(self, palette=None, resolution=VARIO_RESOLUTION, tolerance=None):
+        """
+        yields the flight as a complete kml document
+        """
+        return kml.document(str(self), chain(
+            Flight.iter_styles(palette, resolution),
+            self.iter_kml(palette, resolution, tolerance),
+        ))
+
+
+def describe(flight):
+    """
+    returns the header information and the bounds of the flight
+    """
+    return {
+        'location': flight.location,
+        'pilot': flight.pilot,
+        'glider': flight.glider,
+        'date': flight.date,
+        'name': flight.name,
+        'bounds': flight.bounds(),
+        'takeoff': flight.takeoff(),
+    }
+
+
+class ResultCache(object):
+    """
+    stores the decoded fixes, the header information and the rendered
+    variants of igc files in a directory. the entries are keyed by the
+    content of the file and the version of the converter, so changed files
+    are converted again and unchanged files are taken from the cache, even
+    if they were renamed or moved
+    """
+
+    def __init__(self, directory, version=CONVERTER_VERSION):
+        self.directory = directory
+        self.version = version
+
+    def key(self, filename, blocksize=2**20):
+        """
+        returns the key of the file (sha1 of the content and the version)
+        """
+        digest = hashlib.sha1()
+        with open(filename, 'rb') as file_obj:
+            for block in iter(lambda: file_obj.read(blocksize), b''):
+                digest.update(block)
+        return "%s-%d" % (digest.hexdigest(), self.version)
+
+    def path(self, key, name=''):
+        return os.path.join(self.directory, key[:2], key, name)
+
+    def write(self, key, name, data):
+        """
+        writes the file atomically, so concurrent workers and interrupted
+        runs never leave a partial entry
+        """
+        path = self.path(key)
+        if not os.path.isdir(path):
+            try:
+                os.makedirs(path)
+            except OSError:
+                # created by an other worker
+                if not os.path.isdir(path):
+                    raise
+        temp = self.path(key, '.%s.%d' % (name, os.getpid()))
+        with open(temp, 'wb') as file_obj:
+            file_obj.write(data)
+        os.rename(temp, self.path(key, name))
+
+    def read(self, key, name):
+        try:
+            with open(self.path(key, name), 'rb') as file_obj:
+                return file_obj.read()
+        except IOError:
+            return None
+
+    def fragment_name(self, name, arguments):
+        # the name of the flight is rendered into the kml
+        key = json.dumps([name, arguments])
+        return "%s.kml.z" % hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+    def load_info(self, key):
+        data = self.read(key, 'flight.json')
+        if data is None:
+            return None
+        info = json.loads(data.decode('utf-8'))
+        if info['date'] is not None:
+            info['date'] = datetime.strptime(info['date'], "%Y-%m-%d").replace(tzinfo=utc)
+        return info
+
+    def load_fragments(self, key, name, variants):
+        """
+        returns the cached variants of the flight with the name
+        """
+        fragments = {}
+        for arguments in variants:
+            arguments = variant(*arguments)
+            data = self.read(key, self.fragment_name(name, arguments))
+            if data is not None:
+                fragments[arguments] = data
+        return fragments
+
+    def load_flight(self, key, name):
+        """
+        returns the flight from the cached fixes or None
+        """
+        info = self.load_info(key)
+        data = self.read(key, 'fixes.npy')
+        if info is None or data is None:
+            return None
+        fixes = np.load(io.BytesIO(data))
+        return Flight.from_fixes(
+            fixes, name,
+            location=info['location'],
+            pilot=info['pilot'],
+            glider=info['glider'],
+            date=info['date'],
+        )
+
+    def store(self, key, flight, rendered):
+        """
+        stores the fixes of the flight and the rendered variants
+        """
+        if self.read(key, 'flight.json') is None:
+            buf = io.BytesIO()
+            np.save(buf, flight.fixes)
+            self.write(key, 'fixes.npy', buf.getvalue())
+            info = describe(flight)
+            info['date'] = info['date'].strftime("%Y-%m-%d") if info['date'] else None
+            self.write(key, 'flight.json', json.dumps(info).encode('utf-8'))
+        for arguments, data in rendered.fragments.items():
+            name = self.fragment_name(rendered.name, arguments)
+            if not os.path.exists(self.path(key, name)):
+                self.write(key, name, data)
+
+
+def find_igc_files(directory):
+    """
+    returns the paths of all igc files in the directory and its
+    subdirectories
+    """
+    result = []
+    for path, dirs, files in os.walk(directory):
+        for file in sorted(files):
+            if file[-4:] == ".igc":
+                result.append(os.path.join(path, file))
+    return result
+
+
+def convert(filename, variants, cache=None):
+    """
+    parses and renders the igc file, returns the flight and the traceback
+    of an error instead. this runs in the worker processes.
+
+    with a cache directory the results are reused: the flight is assembled
+    from the cached variants, missing variants are rendered from the cached
+    fixes and only new or changed files are parsed
+    """
+    name = os.path.basename(filename)
+    try:
+        if cache is None:
+            return RenderedFlight.render(parse(filename, name), variants), None
+
+        cache = ResultCache(cache)
+        key = cache.key(filename)
+        # the name is taken from the file, which may have been renamed
+        title = name[:-4] if name[-4:] == ".igc" else name
+        fragments = cache.load_fragments(key, title, variants)
+        if len(fragments) == len(set(variant(*arguments) for arguments in variants)):
+            info = cache.load_info(key)
+            if info is not None:
+                info['name'] = title
+                return RenderedFlight(info, fragments), None
+
+        flight = cache.load_flight(key, name) or parse(filename, name)
+        rendered = RenderedFlight.render(flight, variants, fragments)
+        cache.store(key, flight, rendered)
+        return rendered, None
+    except Exception:
+        return None, traceback.format_exc()
+
+
+def parse(filename, name):
+    flight = Flight(filename, name)
+    # a flight log needs the date and the bounds of every flight
+    if flight.date is None or not flight.datapoints:
+        raise ValueError("%s contains no dated fixes" % filename)
+    return flight
+
+
+def iter_converted(filenames, variants, workers=None, cache=None):
+    """
+    yields (filename, flight, error) in the order of completion. the files
+    are converted by ``workers`` processes (one per cpu by default) or in
+    this process with workers=0
+    """
+    if workers == 0:
+        for filename in filenames:
+            flight, error = convert(filename, variants, cache)
+            yield filename, flight, error
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = dict(
+            (executor.submit(convert, filename, variants, cache), filename)
+            for filename in filenames
+        )
+        for future in as_completed(futures):
+            try:
+                flight, error = future.result()
+            except Exception:
+                # e.g. a worker was killed
+                flight, error = None, traceback.format_exc()
+            yield futures[future], flight, error
+
+
+def convert_all(filenames, variants=((None, VARIO_RESOLUTION, None),), workers=None, progress=None, cache=None):
+    """
+    converts the igc files in parallel and returns a FlightLog with the
+    rendered flights (in the order of the files) and the errors as a list
+    of (filename, traceback). a file, which can not be converted, is
+    skipped.
+
+    every flight is rendered with the given variants (palette, resolution,
+    tolerance), which can be used with FlightLog.iter_document and
+    FlightLog.write_lod_kmz. progress(done, total, filename, error) is
+    called after every file. results are reused from and stored in the
+    ``cache`` directory (see ResultCache)
+    """
+    flights = {}
+    errors = []
+    for done, (filename, flight, error) in enumerate(iter_converted(filenames, variants, workers, cache), 1):
+        if error is None:
+            flights[filename] = flight
+        else:
+            logger.warning("could not convert %s", filename)
+            errors.append((filename, error))
+        if progress is not None:
+            progress(done, len(filenames), filename, error)
+
+    log = FlightLog()
+    for filename in filenames:
+        if filename in flights:
+            log.add_flight(flights[filename])
+    errors.sort()
+    return log, errors
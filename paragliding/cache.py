@@ -0,0 +1,72 @@
+#!/usr/bin/python
+# ex:set fileencoding=utf-8:
+
+from __future__ import unicode_literals
+
+from collections import OrderedDict
+
+
+class LRUCache(object):
+    """
+    least recently used cache for numpy arrays with a budget in bytes
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self.data = OrderedDict()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __repr__(self):
+        return "<%s: %d items, %d/%d bytes, %d hits, %d misses, %d evictions>" % (
+            self.__class__.__name__, len(self), self.nbytes, self.max_bytes,
+            self.hits, self.misses, self.evictions,
+        )
+
+    def __len__(self):
+        return len(self.data)
+
+    def __contains__(self, key):
+        return key in self.data
+
+    def get(self, key, default=None):
+        try:
+            value = self.data.pop(key)
+        except KeyError:
+            self.misses += 1
+            return default
+        self.data[key] = value
+        self.hits += 1
+        return value
+
+    def set(self, key, value):
+        """
+        stores the value and evicts the least recently used values, until
+        it fits into the budget. values larger than the budget are not stored
+        """
+        if key in self.data:
+            self.nbytes -= self.data.pop(key).nbytes
+        if value.nbytes > self.max_bytes:
+            return
+        while self.nbytes + value.nbytes > self.max_bytes:
+            self.nbytes -= self.data.popitem(last=False)[1].nbytes
+            self.evictions += 1
+        self.data[key] = value
+        self.nbytes += value.nbytes
+
+    def clear(self):
+        self.data.clear()
+        self.nbytes = 0
+
+    def stats(self):
+        return {
+            'items': len(self),
+            'bytes': self.nbytes,
+            'max_bytes': self.max_bytes,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+        }
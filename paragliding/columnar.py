@@ -0,0 +1,108 @@
+#!/usr/bin/python
+# ex:set fileencoding=utf-8:
+
+from __future__ import unicode_literals
+
+import json
+import numpy as np
+import os
+
+from datetime import datetime
+from pytz import utc
+
+from . import igc
+
+
+# archives written with an other version can not be read
+FORMAT_VERSION = 2
+
+# fixes.npy holds the fixes (igc.FIX_DTYPE) of all flights, which follow
+# each other. offsets.npy holds the index of the first fix of every flight
+# (and the number of fixes at the end), flights.json the header information
+FIXES = "fixes.npy"
+OFFSETS = "offsets.npy"
+METADATA = "flights.json"
+
+
+def write(directory, flights):
+    """
+    writes the flights, given as (fixes, info) with the fixes as
+    igc.FIX_DTYPE and info as dict (name, location, pilot, glider, date),
+    into the directory. the fixes are copied into the memory-mapped file
+    one flight at a time
+    """
+    flights = list(flights)
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+
+    offsets = np.zeros(len(flights) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(fixes) for fixes, info in flights])
+
+    path = os.path.join(directory, FIXES)
+    if offsets[-1]:
+        fixes = np.lib.format.open_memmap(path, mode="w+", dtype=igc.FIX_DTYPE, shape=(int(offsets[-1]),))
+        for (data, info), start, end in zip(flights, offsets[:-1], offsets[1:]):
+            fixes[start:end] = data
+        fixes.flush()
+        del fixes
+    else:
+        # empty files can not be mapped
+        np.save(path, np.empty(0, dtype=igc.FIX_DTYPE))
+
+    np.save(os.path.join(directory, OFFSETS), offsets)
+
+    metadata = []
+    for fixes, info in flights:
+        info = dict(info)
+        info['date'] = info['date'].strftime("%Y-%m-%d") if info.get('date') else None
+        metadata.append(info)
+    with open(os.path.join(directory, METADATA), "w") as file_obj:
+        json.dump({
+            'version': FORMAT_VERSION,
+            'flights': metadata,
+        }, file_obj)
+
+
+class Archive(object):
+    """
+    the flights of a directory written by write. the fixes of all flights
+    are memory-mapped (mmap=True) or loaded at once. the fixes of a flight
+    are a slice of them, so flights are used without parsing igc files and
+    without copying their fixes
+    """
+
+    def __init__(self, directory, mmap=True):
+        with open(os.path.join(directory, METADATA)) as file_obj:
+            metadata = json.load(file_obj)
+        if metadata['version'] != FORMAT_VERSION:
+            raise ValueError("%s has version %s, expected %s" % (directory, metadata['version'], FORMAT_VERSION))
+
+        self.directory = directory
+        self.info = metadata['flights']
+        for info in self.info:
+            if info['date'] is not None:
+                info['date'] = datetime.strptime(info['date'], "%Y-%m-%d").replace(tzinfo=utc)
+
+        self.offsets = np.load(os.path.join(directory, OFFSETS))
+        mode = "r" if mmap and self.offsets[-1] else None
+        self.data = np.load(os.path.join(directory, FIXES), mmap_mode=mode)
+        if self.data.dtype != igc.FIX_DTYPE:
+            raise ValueError("%s has fixes of %s, expected %s" % (directory, self.data.dtype, igc.FIX_DTYPE))
+
+    def __len__(self):
+        return len(self.info)
+
+    def column(self, name, i=None):
+        """
+        returns the column of all flights or of the flight i (a view)
+        """
+        if i is None:
+            return self.data[name]
+        return self.data[name][self.offsets[i]:self.offsets[i + 1]]
+
+    def fixes(self, i):
+        """
+        returns the fixes of the flight i as igc.FIX_DTYPE (a read-only view
+        of the memory-mapped file)
+        """
+        return self.data[self.offsets[i]:self.offsets[i + 1]]
@@ -0,0 +1,209 @@
+#!/usr/bin/python
+# ex:set fileencoding=utf-8:
+
+from __future__ import unicode_literals
+
+import numpy as np
+
+
+# FAI earth-radius in meter
+R = 6371000.0
+
+
+def trig(lat, lon):
+    """
+    returns the precomputed terms (latitude and longitude in radians and the
+    cosine of the latitude) used by haversine
+    """
+    lat = np.radians(lat)
+    lon = np.radians(lon)
+    return lat, lon, np.cos(lat)
+
+
+def haversine(latx, lonx, cosx, laty, lony, cosy):
+    """
+    great circle distance on the FAI sphere between the points x and y,
+    given by the terms from trig. all arguments are broadcasted
+    """
+    sinlat = np.sin((latx - laty) / 2)
+    sinlon = np.sin((lonx - lony) / 2)
+
+    return 2 * R * np.arcsin(np.sqrt(
+        sinlat * sinlat + sinlon * sinlon * cosx * cosy
+    ))
+
+
+# WGS84 ellipsoid: semi-major axis (m) and flattening
+WGS84_A = 6378137.0
+WGS84_F = 1 / 298.257223563
+WGS84_B = WGS84_A * (1 - WGS84_F)
+
+# iterations of vincenty's formula, near-antipodal points may not converge
+VINCENTY_ITERATIONS = 200
+VINCENTY_TOLERANCE = 1e-12
+
+
+def take(terms, index):
+    return tuple(term[index] for term in terms)
+
+
+class DistanceModel(object):
+    """
+    distances between points given by terms, which are computed once per
+    point from the terms of geodesy.trig. the terms are broadcasted, so
+    pairs, rows and matrices are computed in one call.
+
+    ``scale`` bounds the distance of the model relative to the FAI sphere,
+    which is used by the optimizers for their bounds
+    """
+    name = None
+    scale = 1.0
+
+    def terms(self, trig):
+        raise NotImplementedError
+
+    def distance(self, x, y):
+        raise NotImplementedError
+
+    def pairwise(self, terms, x, y):
+        """
+        returns the matrix of distances between the points x and y
+        """
+        return self.distance(
+            tuple(term[x][:, None] for term in terms),
+            tuple(term[y][None, :] for term in terms),
+        )
+
+    def between(self, lat1, lon1, lat2, lon2):
+        """
+        returns the distances between points given in degree
+        """
+        return self.distance(
+            self.terms(trig(np.asarray(lat1, dtype=np.float64), np.asarray(lon1, dtype=np.float64))),
+            self.terms(trig(np.asarray(lat2, dtype=np.float64), np.asarray(lon2, dtype=np.float64))),
+        )
+
+
+class Sphere(DistanceModel):
+    """
+    great circle distance on the FAI sphere (haversine)
+    """
+    name = "fai"
+
+    def terms(self, trig):
+        return trig
+
+    def distance(self, x, y):
+        return haversine(*(x + y))
+
+
+class Chord(DistanceModel):
+    """
+    straight distance through the FAI sphere between the points (ECEF).
+    it is cheaper than haversine and never longer than the great circle
+    distance d, which exceeds it by less than d**3 / (24 * R**2), e.g.
+    1 m for 100 km
+    """
+    name = "chord"
+
+    def terms(self, trig):
+        lat, lon, cos = trig
+        return cos * np.cos(lon), cos * np.sin(lon), np.sin(lat)
+
+    def distance(self, x, y):
+        dx = x[0] - y[0]
+        dy = x[1] - y[1]
+        dz = x[2] - y[2]
+        return R * np.sqrt(dx * dx + dy * dy + dz * dz)
+
+    @staticmethod
+    def arc(chord):
+        """
+        returns the great circle distance of a chord
+        """
+        return 2 * R * np.arcsin(np.minimum(np.asarray(chord) / (2 * R), 1.0))
+
+    @staticmethod
+    def factor(chord):
+        """
+        returns a factor, which turns chords up to ``chord`` into upper
+        bounds of their great circle distance
+        """
+        chord = float(chord)
+        if chord <= 0:
+            return 1.0
+        return float(Chord.arc(chord)) / chord
+
+
+class WGS84(DistanceModel):
+    """
+    geodesic distance on the WGS84 ellipsoid (vincenty's inverse formula).
+    the line element of the ellipsoid is at most a**2 / b / R times the one
+    of the FAI sphere, which bounds the distances relative to it
+    """
+    name = "wgs84"
+    scale = WGS84_A ** 2 / WGS84_B / R
+
+    def terms(self, trig):
+        lat, lon, cos = trig
+        # reduced latitude
+        reduced = np.arctan((1 - WGS84_F) * np.tan(lat))
+        return lon, np.sin(reduced), np.cos(reduced)
+
+    def distance(self, x, y):
+        lon1, sin1, cos1 = x
+        lon2, sin2, cos2 = y
+        L = lon2 - lon1
+        sin1, cos1, sin2, cos2, L = np.broadcast_arrays(sin1, cos1, sin2, cos2, L)
+
+        f = WGS84_F
+        lam = L.astype(np.float64)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            for n in range(VINCENTY_ITERATIONS):
+                sinlam = np.sin(lam)
+                coslam = np.cos(lam)
+                sinsig = np.hypot(cos2 * sinlam, cos1 * sin2 - sin1 * cos2 * coslam)
+                cossig = sin1 * sin2 + cos1 * cos2 * coslam
+                sig = np.arctan2(sinsig, cossig)
+                # coincident points have no azimuth
+                sinalpha = np.where(sinsig > 0, cos1 * cos2 * sinlam / sinsig, 0.0)
+                cos2alpha = 1 - sinalpha * sinalpha
+                # equatorial lines have cos2alpha = 0
+                cos2sigm = np.where(cos2alpha > 0, cossig - 2 * sin1 * sin2 / cos2alpha, 0.0)
+                C = f / 16 * cos2alpha * (4 + f * (4 - 3 * cos2alpha))
+                previous = lam
+                lam = L + (1 - C) * f * sinalpha * (
+                    sig + C * sinsig * (cos2sigm + C * cossig * (-1 + 2 * cos2sigm * cos2sigm))
+                )
+                if np.all(np.abs(lam - previous) < VINCENTY_TOLERANCE):
+                    break
+
+        u2 = cos2alpha * (WGS84_A ** 2 - WGS84_B ** 2) / WGS84_B ** 2
+        A = 1 + u2 / 16384 * (4096 + u2 * (-768 + u2 * (320 - 175 * u2)))
+        B = u2 / 1024 * (256 + u2 * (-128 + u2 * (74 - 47 * u2)))
+        dsig = B * sinsig * (cos2sigm + B / 4 * (
+            cossig * (-1 + 2 * cos2sigm * cos2sigm)
+            - B / 6 * cos2sigm * (-3 + 4 * sinsig * sinsig) * (-3 + 4 * cos2sigm * cos2sigm)
+        ))
+        return WGS84_B * A * (sig - dsig)
+
+
+FAI = Sphere()
+CHORD = Chord()
+
+MODELS = dict((model.name, model) for model in (FAI, CHORD, WGS84()))
+
+
+def get_model(model=None):
+    """
+    returns the distance model by its name ('fai', 'wgs84', 'chord') or
+    the model itself. the FAI sphere is the default
+    """
+    if model is None:
+        return FAI
+    if isinstance(model, DistanceModel):
+        return model
+    try:
+        return MODELS[model]
+    except KeyError:
+        raise ValueError("unknown distance model %r, one of %s" % (model, ', '.join(sorted(MODELS))))
@@ -0,0 +1,239 @@
+#!/usr/bin/python
+# ex:set fileencoding=utf-8:
+
+from __future__ import unicode_literals
+
+import mmap
+import numpy as np
+
+
+# A B-record is fixed-width, only the first 35 bytes are decoded:
+# B HHMMSS DDMMmmm N DDDMMmmm E V PPPPP GGGGG
+B_RECORD_LENGTH = 35
+
+# the buffer is decoded in chunks of this size, which bounds the memory
+# used for temporary arrays independent of the file size
+CHUNK_SIZE = 4 * 2**20
+
+DIGITS = b"0123456789"
+ALTITUDE = b"0123456789-"
+
+B_RECORD_FIELDS = [
+    (0, 1, b"B"),
+    (1, 7, DIGITS),  # time
+    (7, 14, DIGITS),  # latitude
+    (14, 15, b"NS"),
+    (15, 23, DIGITS),  # longitude
+    (23, 24, b"WE"),
+    (24, 25, b"AV"),
+    (25, 30, ALTITUDE),  # pressure altitude
+    (30, 35, ALTITUDE),  # gps altitude
+]
+
+# coordinates are stored with the resolution of the igc file (1/1000 minute)
+COORDINATE_SCALE = 60000
+
+# a packed fix uses 17 bytes. altitudes exceeding the int16 range are clipped
+FIX_DTYPE = np.dtype([
+    ('time', np.int32),
+    ('lat', np.int32),
+    ('lon', np.int32),
+    ('barheight', np.int16),
+    ('gpsheight', np.int16),
+    ('valid', np.bool_),
+])
+
+
+def as_buffer(data):
+    """
+    returns a uint8 view on bytes (or a text string, which is encoded as latin1)
+    """
+    if isinstance(data, np.ndarray):
+        return data
+    if not isinstance(data, (bytes, bytearray, memoryview)):
+        data = data.encode("latin1")
+    return np.frombuffer(data, dtype=np.uint8)
+
+
+def map_file(filename=None, fileno=None):
+    """
+    returns a read-only uint8 view on a memory-mapped file. the mapping is
+    released with the last reference to the returned array
+    """
+    if fileno is None:
+        with open(filename, "rb") as file_obj:
+            return map_file(fileno=file_obj.fileno())
+    try:
+        data = mmap.mmap(fileno, 0, access=mmap.ACCESS_READ)
+    except ValueError:
+        # empty files can not be mapped
+        return as_buffer(b"")
+    return np.frombuffer(data, dtype=np.uint8)
+
+
+def buffer(file_or_filename):
+    """
+    returns a uint8 view on the content of a file without copying it, if
+    possible: files on disk are memory-mapped and in-memory files are
+    exposed through their buffer
+    """
+    if not hasattr(file_or_filename, "read"):
+        return map_file(file_or_filename)
+
+    # uploaded files (django) are stored on disk or wrap an in-memory file
+    if hasattr(file_or_filename, "temporary_file_path"):
+        return map_file(file_or_filename.temporary_file_path())
+    file_obj = getattr(file_or_filename, "file", file_or_filename)
+
+    if hasattr(file_obj, "getbuffer"):
+        return as_buffer(file_obj.getbuffer())
+    try:
+        return map_file(fileno=file_obj.fileno())
+    except (AttributeError, IOError, OSError, ValueError):
+        return as_buffer(file_obj.read())
+
+
+def chunks(buf, size=CHUNK_SIZE):
+    """
+    splits the buffer into views of about ``size`` bytes, which end on
+    a line break
+    """
+    start = 0
+    while start < len(buf):
+        end = start + size
+        while end < len(buf):
+            newline = np.flatnonzero(buf[end:end + 4096] == ord("\n"))
+            if len(newline):
+                end += newline[0] + 1
+                break
+            end += 4096
+        yield buf[start:end]
+        start = end
+
+
+def line_starts(buf):
+    """
+    returns the offsets of all lines in the buffer
+    """
+    starts = np.flatnonzero(buf == ord("\n")) + 1
+    if len(buf):
+        starts = np.concatenate(([0], starts[starts < len(buf)]))
+    return starts
+
+
+def b_record_starts(buf, starts=None):
+    """
+    returns the offsets of all lines in the buffer, which are valid B-records
+    """
+    if starts is None:
+        starts = line_starts(buf)
+
+    starts = starts[starts + B_RECORD_LENGTH <= len(buf)]
+    starts = starts[buf[starts] == ord("B")]
+
+    # a line shorter than 35 bytes always contains its newline within the
+    # window, which never passes the character checks below
+    valid = np.ones(len(starts), dtype=np.bool_)
+    for first, last, chars in B_RECORD_FIELDS[1:]:
+        lookup = np.zeros(256, dtype=np.bool_)
+        lookup[np.frombuffer(chars, dtype=np.uint8)] = True
+        for i in range(first, last):
+            valid &= lookup[buf[starts + i]]
+    return starts[valid]
+
+
+def _number(buf, starts, first, last):
+    digits = buf[starts[:, None] + np.arange(first, last)].astype(np.int32)
+    negative = (digits == ord("-")).any(axis=1)
+    digits -= ord("0")
+    digits[digits < 0] = 0
+    value = digits.dot(10 ** np.arange(last - first - 1, -1, -1, dtype=np.int32))
+    value[negative] *= -1
+    return value
+
+
+def decode_into(buf, starts, fixes):
+    """
+    decodes the B-records at ``starts`` into the structured array ``fixes``.
+    the time is stored in seconds since midnight
+    """
+    fixes['time'] = (
+        _number(buf, starts, 1, 3) * 3600
+        + _number(buf, starts, 3, 5) * 60
+        + _number(buf, starts, 5, 7)
+    )
+
+    fixes['lat'] = _number(buf, starts, 7, 9) * COORDINATE_SCALE + _number(buf, starts, 9, 14)
+    fixes['lat'][buf[starts + 14] == ord("S")] *= -1
+
+    fixes['lon'] = _number(buf, starts, 15, 18) * COORDINATE_SCALE + _number(buf, starts, 18, 23)
+    fixes['lon'][buf[starts + 23] == ord("W")] *= -1
+
+    fixes['valid'] = buf[starts + 24] == ord("A")
+    fixes['barheight'] = altitude(_number(buf, starts, 25, 30))
+    fixes['gpsheight'] = altitude(_number(buf, starts, 30, 35))
+
+
+def altitude(value):
+    info = np.iinfo(FIX_DTYPE['gpsheight'])
+    return np.clip(value, info.min, info.max)
+
+
+def rollover(time):
+    """
+    adds a day to all times after the clock jumped back (inplace)
+    """
+    days = np.cumsum(time[1:] < time[:-1], dtype=time.dtype)
+    time[1:] += days * 86400
+    return time
+
+
+def read_igc(buf, chunk_size=CHUNK_SIZE):
+    """
+    returns the H-records and the decoded B-records (FIX_DTYPE) from the
+    buffer. the time is given in seconds since midnight of the first fix,
+    rolling over into the next day when the clock jumps back.
+
+    the buffer is scanned twice: the first pass locates the records, the
+    second decodes them into a preallocated array
+    """
+    buf = as_buffer(buf)
+
+    headers = []
+    records = []
+    for chunk in chunks(buf, chunk_size):
+        starts = line_starts(chunk)
+        headers.extend(read_headers(chunk, starts))
+        records.append(b_record_starts(chunk, starts).astype(np.int32))
+
+    fixes = np.empty(sum(len(starts) for starts in records), dtype=FIX_DTYPE)
+    position = 0
+    for chunk, starts in zip(chunks(buf, chunk_size), records):
+        decode_into(chunk, starts, fixes[position:position + len(starts)])
+        position += len(starts)
+
+    rollover(fixes['time'])
+    return headers, fixes
+
+
+def decode_b_records(buf, chunk_size=CHUNK_SIZE):
+    """
+    decodes all B-records in the buffer into a structured array (FIX_DTYPE)
+    """
+    return read_igc(buf, chunk_size)[1]
+
+
+def read_headers(buf, starts=None):
+    """
+    returns all H-records from the buffer as stripped strings
+    """
+    buf = as_buffer(buf)
+    if starts is None:
+        starts = line_starts(buf)
+    starts = starts[buf[starts] == ord("H")]
+    ends = np.append(np.flatnonzero(buf == ord("\n")), len(buf))
+    ends = ends[np.searchsorted(ends, starts)]
+    return [
+        buf[start:end].tobytes().decode("latin1").strip()
+        for start, end in zip(starts, ends)
+    ]
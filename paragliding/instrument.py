@@ -0,0 +1,198 @@
+#!/usr/bin/python
+# ex:set fileencoding=utf-8:
+
+from __future__ import unicode_literals
+
+import threading
+
+from collections import OrderedDict
+from timeit import default_timer
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+# hooks receiving the events of all threads (e.g. a metrics client)
+HOOKS = []
+
+# hooks of the current thread, e.g. a Recorder of a request
+local = threading.local()
+
+
+class Hook(object):
+    """
+    receives the durations of the stages and the counters. subclasses are
+    registered with add_hook (all threads) or used as context manager
+    (current thread)
+    """
+
+    def timer(self, name, seconds):
+        pass
+
+    def count(self, name, value):
+        pass
+
+    def __enter__(self):
+        if not hasattr(local, 'hooks'):
+            local.hooks = []
+        local.hooks.append(self)
+        return self
+
+    def __exit__(self, *args):
+        local.hooks.remove(self)
+
+
+class LoggingHook(Hook):
+    """
+    logs every event
+    """
+
+    def __init__(self, log=logger, level=logging.DEBUG):
+        self.log = log
+        self.level = level
+
+    def timer(self, name, seconds):
+        self.log.log(self.level, "%s: %.3f ms", name, seconds * 1e3)
+
+    def count(self, name, value):
+        self.log.log(self.level, "%s: %+d", name, value)
+
+
+class Recorder(Hook):
+    """
+    sums the durations and counters, e.g. of a request
+    """
+
+    def __init__(self):
+        self.timers = OrderedDict()
+        self.counters = OrderedDict()
+
+    def timer(self, name, seconds):
+        total, calls = self.timers.get(name, (0.0, 0))
+        self.timers[name] = (total + seconds, calls + 1)
+
+    def count(self, name, value):
+        self.counters[name] = self.counters.get(name, 0) + value
+
+    def as_dict(self):
+        return {
+            'timers': dict((name, total) for name, (total, calls) in self.timers.items()),
+            'counters': dict(self.counters),
+        }
+
+    def server_timing(self):
+        """
+        returns the timers as value of a Server-Timing header
+        """
+        return ', '.join(
+            "%s;dur=%.1f" % (name, total * 1e3)
+            for name, (total, calls) in self.timers.items()
+        )
+
+    def summary(self):
+        return ', '.join(
+            ["%s %.1f ms" % (name, total * 1e3) for name, (total, calls) in self.timers.items()]
+            + ["%s %d" % (name, value) for name, value in self.counters.items()]
+        )
+
+
+def add_hook(hook):
+    HOOKS.append(hook)
+
+
+def remove_hook(hook):
+    HOOKS.remove(hook)
+
+
+def active():
+    """
+    returns the hooks receiving events in this thread
+    """
+    hooks = getattr(local, 'hooks', None)
+    if hooks:
+        return HOOKS + hooks
+    return HOOKS
+
+
+def count(name, value=1):
+    for hook in active():
+        hook.count(name, value)
+
+
+class Timer(object):
+    __slots__ = ('name', 'hooks', 'start')
+
+    def __init__(self, name, hooks):
+        self.name = name
+        self.hooks = hooks
+
+    def __enter__(self):
+        self.start = default_timer()
+        return self
+
+    def __exit__(self, *args):
+        seconds = default_timer() - self.start
+        for hook in self.hooks:
+            hook.timer(self.name, seconds)
+
+
+class NullTimer(object):
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+
+NULL_TIMER = NullTimer()
+
+
+def stage(name):
+    """
+    returns a context manager, which reports its duration as the stage
+    ``name``. without hooks it does nothing
+    """
+    hooks = active()
+    if not hooks:
+        return NULL_TIMER
+    return Timer(name, list(hooks))
+
+
+def timed(name, iterator):
+    """
+    reports the time spent in producing the items of the iterator (e.g.
+    rendering the chunks of a document) as the stage ``name``
+    """
+    if not active():
+        return iterator
+    return _timed(name, iter(iterator))
+
+
+def _timed(name, iterator):
+    while True:
+        with stage(name):
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+        yield item
+
+
+def recording(recorder, iterator, finished=None):
+    """
+    yields the items of the iterator with the recorder active while they
+    are produced, e.g. a streamed response after the view returned.
+    finished(recorder) is called after the last item
+    """
+    iterator = iter(iterator)
+    while True:
+        with recorder:
+            try:
+                item = next(iterator)
+            except StopIteration:
+                break
+        yield item
+    if finished is not None:
+        finished(recorder)
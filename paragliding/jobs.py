@@ -0,0 +1,143 @@
+#!/usr/bin/python
+# ex:set fileencoding=utf-8:
+
+from __future__ import unicode_literals
+
+import functools
+import io
+import threading
+
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import ThreadPoolExecutor
+
+from .kml import write_kmz
+from .parsers import FREE_DISTANCE_TURNPOINTS
+from .parsers import Flight
+from .parsers import VARIO_RESOLUTION
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+PENDING = "pending"
+DONE = "done"
+FAILED = "failed"
+
+
+def convert(path, name, resolution=VARIO_RESOLUTION, tolerance=None):
+    """
+    returns the kmz file of the igc file at path, which is memory-mapped,
+    and the summary of the flight (see Flight.summary) without the free
+    distance, which is measured by a job of its own. this runs in the
+    workers
+    """
+    flight = Flight(path, name)
+    if not flight.datapoints:
+        raise ValueError("%s contains no fixes" % name)
+    buf = io.BytesIO()
+    write_kmz(buf, flight.name + '.kml', flight.iter_document(
+        resolution=resolution,
+        tolerance=tolerance,
+    ))
+    return buf.getvalue(), flight.summary(turnpoints=None)
+
+
+def measure(path, name, turnpoints=FREE_DISTANCE_TURNPOINTS):
+    """
+    returns the free distance (m) of the igc file at path. this runs in
+    the workers
+    """
+    flight = Flight(path, name)
+    return float(flight.calc_turning_points(turnpoints)[0])
+
+
+class JobQueue(object):
+    """
+    converts igc files in a local pool of processes (or threads), so a
+    request only submits the job. the queue keeps no state of the jobs:
+    the result is passed to a callback, which stores it (e.g. in the
+    database), so every process can answer for every job. a pool, which
+    is broken by a dead worker, is replaced. the jobs are lost, when the
+    process ends (see the requeue_tracks command)
+    """
+
+    def __init__(self, workers=None, processes=True):
+        executor = ProcessPoolExecutor if processes else ThreadPoolExecutor
+        self.factory = functools.partial(executor, max_workers=workers)
+        self.executor = self.factory()
+        self.lock = threading.Lock()
+        self.closed = False
+        # the callbacks run one after another in a thread of the queue,
+        # never in the thread, which submitted the job
+        self.callbacks = ThreadPoolExecutor(max_workers=1)
+
+    def submit(self, finished, path, name, resolution=VARIO_RESOLUTION, tolerance=None, measured=None):
+        """
+        submits the igc file at path (only the path is sent to the worker).
+        finished(result, error) is called with the result of convert or
+        the error message, when the job is finished. the free distance is
+        measured after the conversion, so the kmz file is stored before:
+        measured(distance, error) is called with the result of measure
+        """
+        then = None
+        if measured is not None:
+            then = lambda: self.run(measured, name, measure, (path, name))
+        return self.run(finished, name, convert, (path, name, resolution, tolerance), then)
+
+    def run(self, finished, name, job, args, then=None):
+        """
+        submits job(*args) and calls finished(result, error) and then(),
+        if the job succeeded
+        """
+        executor = self.executor
+        try:
+            future = executor.submit(job, *args)
+        except RuntimeError:
+            # a worker died and broke the pool (BrokenProcessPool), the
+            # pool is replaced once
+            self.replace(executor)
+            future = self.executor.submit(job, *args)
+        future.add_done_callback(lambda future: self.callbacks.submit(self.finish, future, finished, name, then))
+        return future
+
+    def finish(self, future, finished, name, then=None):
+        if future.cancelled():
+            result, error = None, "cancelled"
+        elif future.exception() is not None:
+            result, error = None, "%s" % future.exception()
+        else:
+            result, error = future.result(), None
+
+        if error is None:
+            logger.debug("job %s done", name)
+        else:
+            logger.warning("job %s failed: %s", name, error)
+        try:
+            finished(result, error)
+        except Exception:
+            logger.exception("storing the result of job %s failed", name)
+            return
+        if error is None and then is not None:
+            try:
+                then()
+            except Exception:
+                logger.exception("submitting the next job of %s failed", name)
+
+    def replace(self, executor):
+        """
+        replaces the (broken) executor by a new one, unless the queue was
+        shut down or the executor was replaced already
+        """
+        with self.lock:
+            if self.closed:
+                raise RuntimeError("the job queue is shut down")
+            if self.executor is executor:
+                logger.warning("replacing the broken pool of the job queue")
+                executor.shutdown(wait=False)
+                self.executor = self.factory()
+
+    def shutdown(self, wait=True):
+        with self.lock:
+            self.closed = True
+        self.executor.shutdown(wait=wait)
+        self.callbacks.shutdown(wait=wait)
@@ -0,0 +1,154 @@
+#!/usr/bin/python
+# ex:set fileencoding=utf-8:
+
+from __future__ import unicode_literals
+
+from xml.sax.saxutils import escape
+from xml.sax.saxutils import quoteattr
+
+import time
+
+from zipfile import ZipFile
+from zipfile import ZipInfo
+from zipfile import ZIP_DEFLATED
+
+from . import instrument
+
+
+XMLNS = "http://earth.google.com/kml/2.2"
+
+HEADER = '<?xml version="1.0" encoding="UTF-8"?>\n<kml xmlns="%s"><Document>' % XMLNS
+FOOTER = '</Document></kml>'
+
+# number of fixes rendered into one chunk
+CHUNK_SIZE = 1000
+
+
+def element(tag, text=None, **attrs):
+    """
+    returns an element with escaped text content
+    """
+    attrs = ''.join(' %s=%s' % (k, quoteattr(v)) for k, v in sorted(attrs.items()))
+    if text is None:
+        return '<%s%s />' % (tag, attrs)
+    return '<%s%s>%s</%s>' % (tag, attrs, escape("%s" % text), tag)
+
+
+def coordinates(lon, lat, height, size=CHUNK_SIZE):
+    """
+    yields the content of a coordinates-element in chunks
+    """
+    for i in range(0, len(lon), size):
+        yield (' ' if i else '') + ' '.join([
+            "%.8f,%.8f,%d" % data
+            for data in zip(lon[i:i + size], lat[i:i + size], height[i:i + size])
+        ])
+
+
+def region(north, south, east, west, min_pixels=128, max_pixels=-1):
+    """
+    returns a region with a level of detail
+    """
+    return (
+        '<Region><LatLonAltBox>'
+        + element('north', "%.6f" % north)
+        + element('south', "%.6f" % south)
+        + element('east', "%.6f" % east)
+        + element('west', "%.6f" % west)
+        + '</LatLonAltBox><Lod>'
+        + element('minLodPixels', min_pixels)
+        + element('maxLodPixels', max_pixels)
+        + '</Lod></Region>'
+    )
+
+
+def network_link(name, href, region=''):
+    """
+    returns a network link, which loads the file ``href`` when its region
+    becomes visible
+    """
+    return (
+        '<NetworkLink>'
+        + element('name', name)
+        + region
+        + '<Link>'
+        + element('href', href)
+        + element('viewRefreshMode', "onRegion")
+        + '</Link></NetworkLink>'
+    )
+
+
+def document(name, chunks):
+    """
+    wraps the chunks into a kml document
+    """
+    yield HEADER
+    yield element('name', name)
+    for chunk in chunks:
+        yield chunk
+    yield FOOTER
+
+
+class Pipe(object):
+    """
+    file-like object, which collects everything written to it until it
+    is read with pop
+    """
+
+    def __init__(self):
+        self.data = []
+
+    def write(self, data):
+        self.data.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def pop(self):
+        data = b''.join(self.data)
+        self.data = []
+        return data
+
+
+def zipinfo(name):
+    info = ZipInfo(name, date_time=time.localtime()[:6])
+    info.compress_type = ZIP_DEFLATED
+    return info
+
+
+def write_kmz(file_or_filename, name, chunks):
+    """
+    writes the chunks into the entry ``name`` of a new kmz file
+    """
+    write_entries(file_or_filename, [(name, chunks)])
+
+
+def write_entries(file_or_filename, entries):
+    """
+    writes a kmz file with several entries, given as (name, chunks). the
+    first entry is the document opened by the viewer
+    """
+    with ZipFile(file_or_filename, 'w', ZIP_DEFLATED) as zipfile:
+        for name, chunks in entries:
+            with zipfile.open(zipinfo(name), 'w') as entry:
+                for chunk in instrument.timed('render', chunks):
+                    with instrument.stage('compress'):
+                        entry.write(chunk.encode('utf-8'))
+
+
+def stream_kmz(name, chunks):
+    """
+    yields the compressed kmz file while the chunks are generated
+    """
+    pipe = Pipe()
+    # ZipFile writes data descriptors, as the pipe is not seekable
+    with ZipFile(pipe, 'w', ZIP_DEFLATED) as zipfile:
+        with zipfile.open(zipinfo(name), 'w') as entry:
+            for chunk in instrument.timed('render', chunks):
+                with instrument.stage('compress'):
+                    entry.write(chunk.encode('utf-8'))
+                data = pipe.pop()
+                if data:
+                    yield data
+    yield pipe.pop()
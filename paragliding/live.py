@@ -0,0 +1,292 @@
+#!/usr/bin/python
+# ex:set fileencoding=utf-8:
+
+from __future__ import unicode_literals
+
+import numpy as np
+import os
+
+from . import geodesy
+from . import igc
+from .analytics import HEIGHT_SMOOTHING
+from .analytics import gradient
+from .optimize import pairwise
+from .parsers import FREE_DISTANCE_TURNPOINTS
+from .parsers import Flight
+from .smoothing import averages
+from .smoothing import binom
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+# initial capacity (fixes) of the buffers of a live flight
+CAPACITY = 4096
+
+# number of distances computed at once, when new fixes are added to the
+# best distance
+DISTANCE_BLOCK = 2**20
+
+
+class Buffer(object):
+    """
+    an array, which grows at the end in amortized O(1) per element by
+    doubling its capacity
+    """
+
+    def __init__(self, dtype, capacity=CAPACITY, shape=()):
+        self.data = np.empty((max(1, capacity),) + tuple(shape), dtype=dtype)
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    @property
+    def values(self):
+        return self.data[:self.size]
+
+    def reserve(self, size):
+        if size > len(self.data):
+            capacity = len(self.data)
+            while capacity < size:
+                capacity *= 2
+            data = np.empty((capacity,) + self.data.shape[1:], dtype=self.data.dtype)
+            data[:self.size] = self.data[:self.size]
+            self.data = data
+
+    def extend(self, values):
+        self.reserve(self.size + len(values))
+        self.data[self.size:self.size + len(values)] = values
+        self.size += len(values)
+
+    def resize(self, size):
+        """
+        grows (uninitialized) or shrinks the array to size elements
+        """
+        self.reserve(size)
+        self.size = size
+
+
+class Reader(object):
+    """
+    decodes an igc file, which grows while it is read. only complete lines
+    are decoded, the rest is kept until the next call. the times continue
+    over the calls, rolling over into the next day when the clock jumps
+    back (see igc.read_igc)
+    """
+
+    def __init__(self):
+        self.offset = 0
+        self.pending = b""
+        self.last = None
+        self.days = 0
+
+    def read(self, file_or_filename):
+        """
+        returns the H-records and the fixes appended to the file since the
+        last call. a file, which shrank, is read again from the start
+        """
+        if hasattr(file_or_filename, "read"):
+            return self.read_file(file_or_filename)
+        with open(file_or_filename, "rb") as file_obj:
+            return self.read_file(file_obj)
+
+    def read_file(self, file_obj):
+        file_obj.seek(0, os.SEEK_END)
+        if file_obj.tell() < self.offset:
+            logger.warning("%s was truncated, reading it again", getattr(file_obj, "name", file_obj))
+            self.__init__()
+        file_obj.seek(self.offset)
+        data = file_obj.read()
+        self.offset += len(data)
+        return self.feed(data)
+
+    def feed(self, data, final=False):
+        """
+        decodes the complete lines of the data appended to the previous
+        data. with final=True an unterminated last line is decoded as well
+        """
+        buf = self.pending + data
+        end = len(buf) if final else buf.rfind(b"\n") + 1
+        self.pending = buf[end:]
+
+        buf = igc.as_buffer(buf[:end])
+        starts = igc.line_starts(buf)
+        headers = igc.read_headers(buf, starts)
+        records = igc.b_record_starts(buf, starts)
+        fixes = np.empty(len(records), dtype=igc.FIX_DTYPE)
+        igc.decode_into(buf, records, fixes)
+
+        if len(fixes):
+            time = fixes['time'].copy()
+            previous = np.concatenate(([time[0] if self.last is None else self.last], time[:-1]))
+            days = self.days + np.cumsum(time < previous, dtype=time.dtype)
+            fixes['time'] = time + days * 86400
+            self.last = time[-1]
+            self.days = days[-1]
+        return headers, fixes
+
+
+class LiveFlight(Flight):
+    """
+    a flight read from a growing igc file during live tracking. new fixes
+    are appended to growing buffers. the smoothed altitude, the vario and
+    the best free distance are updated for the new fixes only, instead of
+    being computed again for the whole flight
+    """
+
+    __slots__ = (
+        'reader',
+        'buffers',
+        'turnpoints',
+        'scores',
+        'back',
+        'scored',
+    )
+
+    def __init__(self, name, turnpoints=FREE_DISTANCE_TURNPOINTS, capacity=CAPACITY, **kwargs):
+        super(LiveFlight, self).__init__(None, name, **kwargs)
+        self.reader = Reader()
+        self.buffers = {
+            'fixes': Buffer(igc.FIX_DTYPE, capacity),
+            'trig': Buffer(np.float64, capacity, (3,)),
+            'smooth_height': Buffer(np.float64, capacity),
+            'vario': Buffer(np.float64, capacity),
+        }
+        legs = turnpoints + 1
+        self.turnpoints = turnpoints
+        # scores[j, leg] is the best distance with leg legs ending in fix j
+        # and back[j, leg] the previous fix of that path
+        self.scores = Buffer(np.float64, capacity, (legs + 1,))
+        self.back = Buffer(np.intp, capacity, (legs,))
+        self.scored = 0
+
+    def update(self, file_or_filename):
+        """
+        reads the fixes appended to the file, returns their number
+        """
+        offset = self.reader.offset
+        headers, fixes = self.reader.read(file_or_filename)
+        if self.reader.offset < offset:
+            # the file was replaced
+            self.reset()
+        return self.append(headers, fixes)
+
+    def feed(self, data, final=False):
+        """
+        adds the igc data (bytes appended to the file), returns the number
+        of new fixes
+        """
+        return self.append(*self.reader.feed(data, final))
+
+    def reset(self):
+        for buf in self.buffers.values():
+            buf.resize(0)
+        self.scores.resize(0)
+        self.back.resize(0)
+        self.scored = 0
+        self.fixes = self.buffers['fixes'].values
+
+    def append(self, headers, fixes):
+        for line in headers:
+            self.read_header(line)
+        if not len(fixes):
+            return 0
+
+        old = self.datapoints
+        self.buffers['fixes'].extend(fixes)
+        self.fixes = self.buffers['fixes'].values
+        self.buffers['trig'].extend(np.column_stack(geodesy.trig(
+            fixes['lat'] / float(igc.COORDINATE_SCALE),
+            fixes['lon'] / float(igc.COORDINATE_SCALE),
+        )))
+        self.update_vario(old)
+
+        # derived values of the whole flight are computed again on demand
+        self._trig = None
+        self._analytics = None
+        self.distances.clear()
+        return len(fixes)
+
+    def get_trig(self):
+        if self._trig is None:
+            trig = self.buffers['trig'].values
+            self._trig = trig[:, 0], trig[:, 1], trig[:, 2]
+        return self._trig
+
+    def update_vario(self, old):
+        """
+        smooths the altitude of the fixes from old on. the fixes within
+        half a window before them changed as well, they were smoothed with
+        the shorter windows used at the end of the data
+        """
+        size = HEIGHT_SMOOTHING
+        start = max(0, old - size // 2)
+        # enough fixes before start, that they are smoothed with the full
+        # window, as in the whole flight
+        first = max(0, start - size)
+        smooth = averages(self.gpsheight[first:], size, binom)
+        buf = self.buffers['smooth_height']
+        buf.resize(self.datapoints)
+        buf.values[start:] = smooth[start - first:]
+
+        # the gradient uses the neighbours of every fix
+        start = max(0, start - 1)
+        first = max(0, start - 1)
+        vario = self.buffers['vario']
+        vario.resize(self.datapoints)
+        vario.values[start:] = gradient(buf.values[first:], self.seconds[first:])[start - first:]
+
+    @property
+    def smooth_height(self):
+        return self.buffers['smooth_height'].values
+
+    @property
+    def vario(self):
+        """
+        the climb rate (m/s) of the smoothed altitude at every fix
+        """
+        return self.buffers['vario'].values
+
+    def update_scores(self, block=DISTANCE_BLOCK):
+        """
+        extends the dynamic programming of optimize.forward to the new
+        fixes: each one costs O(turnpoints * fixes), so a flight, which is
+        read at once, is better scored with Flight.calc_turning_points
+        """
+        n = self.datapoints
+        legs = self.turnpoints + 1
+        trig = self.get_trig()
+        self.scores.resize(n)
+        self.back.resize(n)
+        scores = self.scores.values
+        back = self.back.values
+
+        step = max(1, block // max(1, n))
+        for a in range(self.scored, n, step):
+            b = min(a + step, n)
+            D = pairwise(trig, np.arange(b), np.arange(a, b))
+            # paths end in a later fix than they come from
+            D[np.arange(b)[:, None] > np.arange(a, b)] = -np.inf
+            scores[a:b, 0] = 0.0
+            for leg in range(legs):
+                S = scores[:b, leg][:, None] + D
+                back[a:b, leg] = S.argmax(axis=0)
+                scores[a:b, leg + 1] = S[back[a:b, leg], np.arange(b - a)]
+        self.scored = n
+
+    def best_distance(self):
+        """
+        returns the current maximum free distance with up to turnpoints
+        turning points and the indices of the start, the turning points and
+        the end (see Flight.calc_turning_points)
+        """
+        if not self.datapoints:
+            return 0.0, ()
+        self.update_scores()
+        scores = self.scores.values
+        legs = self.turnpoints + 1
+        path = [int(scores[:, legs].argmax())]
+        for leg in range(legs - 1, -1, -1):
+            path.append(int(self.back.values[path[-1], leg]))
+        return float(scores[path[0], legs]), tuple(path[::-1])
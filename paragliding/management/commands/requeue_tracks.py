@@ -0,0 +1,46 @@
+#!/usr/bin/python
+# ex:set fileencoding=utf-8:
+
+from __future__ import unicode_literals
+
+from django.core.management.base import BaseCommand
+
+import os
+
+from ...jobs import DONE
+from ...jobs import FAILED
+from ...jobs import PENDING
+from ...jobs import convert
+from ...jobs import measure
+from ...models import Track
+from ...views import job_options
+
+
+class Command(BaseCommand):
+    help = (
+        "runs the jobs of the pending tracks and measures the free distance of the done "
+        "tracks without it. the jobs of the server are lost, when it is restarted: run "
+        "this after the restart"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--failed', action='store_true', help="run the jobs of the failed tracks too")
+
+    def handle(self, *args, **options):
+        status = [PENDING, FAILED] if options['failed'] else [PENDING]
+        for track in Track.objects.filter(status__in=status):
+            name = os.path.basename(track.igc.name)
+            try:
+                result, error = convert(track.igc.path, name, **job_options()), None
+            except Exception as e:
+                result, error = None, "%s" % e
+            track.finish_job(result, error)
+            self.stdout.write("%s: %s" % (name, track.status))
+
+        for track in Track.objects.filter(status=DONE, distance__isnull=True):
+            name = os.path.basename(track.igc.name)
+            try:
+                track.finish_distance(measure(track.igc.path, name))
+            except Exception as e:
+                track.finish_distance(error="%s" % e)
+            self.stdout.write("%s: %s m" % (name, track.distance))
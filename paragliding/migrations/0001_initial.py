@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.conf import settings
+from django.db import migrations
+from django.db import models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Track',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('igc', models.FileField(upload_to='paragliding/tracks/%Y/%m/', verbose_name='IGC File')),
+                ('name', models.CharField(blank=True, max_length=255, verbose_name='name')),
+                ('uploaded', models.DateTimeField(auto_now_add=True, verbose_name='uploaded')),
+                ('date', models.DateField(blank=True, db_index=True, null=True, verbose_name='date')),
+                ('site', models.CharField(blank=True, db_index=True, max_length=255, verbose_name='site')),
+                ('pilot', models.CharField(blank=True, db_index=True, max_length=255, verbose_name='pilot')),
+                ('glider', models.CharField(blank=True, db_index=True, max_length=255, verbose_name='glider')),
+                ('duration', models.PositiveIntegerField(db_index=True, default=0, verbose_name='duration (s)')),
+                ('max_altitude', models.IntegerField(db_index=True, default=0, verbose_name='maximum altitude (m)')),
+                ('max_climb', models.FloatField(db_index=True, default=0.0, verbose_name='maximum climb rate (m/s)')),
+                ('distance', models.FloatField(db_index=True, default=0.0, verbose_name='free distance (m)')),
+                ('north', models.FloatField(blank=True, db_index=True, null=True, verbose_name='north')),
+                ('south', models.FloatField(blank=True, db_index=True, null=True, verbose_name='south')),
+                ('east', models.FloatField(blank=True, db_index=True, null=True, verbose_name='east')),
+                ('west', models.FloatField(blank=True, db_index=True, null=True, verbose_name='west')),
+                ('user', models.ForeignKey(
+                    blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL,
+                    related_name='+', to=settings.AUTH_USER_MODEL,
+                )),
+            ],
+            options={
+                'verbose_name': 'track',
+                'verbose_name_plural': 'tracks',
+                'ordering': ('-date', '-id'),
+            },
+        ),
+        migrations.AddIndex(
+            model_name='track',
+            index=models.Index(fields=['site', 'date'], name='paragliding_site_date'),
+        ),
+        migrations.AddIndex(
+            model_name='track',
+            index=models.Index(fields=['pilot', 'date'], name='paragliding_pilot_date'),
+        ),
+    ]
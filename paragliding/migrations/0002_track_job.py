@@ -0,0 +1,33 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations
+from django.db import models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('paragliding', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='track',
+            name='status',
+            field=models.CharField(
+                choices=[('pending', 'pending'), ('done', 'done'), ('failed', 'failed')],
+                default='pending', max_length=16, verbose_name='status',
+            ),
+        ),
+        migrations.AddField(
+            model_name='track',
+            name='error',
+            field=models.TextField(blank=True, verbose_name='error'),
+        ),
+        migrations.AddField(
+            model_name='track',
+            name='kmz',
+            field=models.FileField(blank=True, upload_to='paragliding/kmz/%Y/%m/', verbose_name='KMZ File'),
+        ),
+    ]
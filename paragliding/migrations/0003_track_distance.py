@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations
+from django.db import models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('paragliding', '0002_track_job'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='track',
+            name='distance',
+            field=models.FloatField(blank=True, db_index=True, null=True, verbose_name='free distance (m)'),
+        ),
+    ]
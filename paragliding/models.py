@@ -1,30 +1,159 @@
 #!/usr/bin/python
 # ex:set fileencoding=utf-8:
 
-#from __future__ import unicode_literals
-
-#from django.conf import settings
-#from django.contrib.auth import get_user_model
-#from django.db import models
-#from django.utils.translation import ugettext_lazy as _
-#from django.utils.encoding import python_2_unicode_compatible
-
-
-#@python_2_unicode_compatible
-#class Track(models.Model):
-#    """
-#    Track model
-#    """
-#    user = models.ForeignKey(settings.AUTH_USER_MODEL, blank=False, null=False, related_name="+", on_delete=models.CASCADE)
-#    igc = models.FileField(
-#        null=False,
-#        blank=False,
-#        verbose_name=_("IGC File"),
-#    )
-#
-#    class Meta:
-#        verbose_name = _('track')
-#        verbose_name_plural = _('tracks')
-#
-#    def __str__(self):
-#        return '%s' % self.igc
+from __future__ import unicode_literals
+
+import os
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import models
+from django.utils.translation import gettext_lazy as _
+
+from .jobs import DONE
+from .jobs import FAILED
+from .jobs import PENDING
+from .parsers import Flight
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+# fields of the summary, which are taken from Flight.summary as they are
+SUMMARY_FIELDS = ('duration', 'max_altitude', 'max_climb', 'distance', 'north', 'south', 'east', 'west')
+
+
+class Track(models.Model):
+    """
+    Track model: the uploaded igc file and the summary of the flight,
+    which is computed once by the conversion job, so tracks are listed and
+    filtered without reading the igc files. the free distance is measured
+    by a job of its own after the conversion (None until then). the state
+    and the result of the job are stored with the track, so every process
+    of the server can answer for the job
+    """
+    JOB_STATUS = (
+        (PENDING, _("pending")),
+        (DONE, _("done")),
+        (FAILED, _("failed")),
+    )
+
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL, blank=True, null=True, related_name="+", on_delete=models.SET_NULL,
+    )
+    igc = models.FileField(
+        null=False,
+        blank=False,
+        upload_to="paragliding/tracks/%Y/%m/",
+        verbose_name=_("IGC File"),
+    )
+    name = models.CharField(_("name"), max_length=255, blank=True)
+    uploaded = models.DateTimeField(_("uploaded"), auto_now_add=True)
+
+    # summary
+    date = models.DateField(_("date"), blank=True, null=True, db_index=True)
+    site = models.CharField(_("site"), max_length=255, blank=True, db_index=True)
+    pilot = models.CharField(_("pilot"), max_length=255, blank=True, db_index=True)
+    glider = models.CharField(_("glider"), max_length=255, blank=True, db_index=True)
+    duration = models.PositiveIntegerField(_("duration (s)"), default=0, db_index=True)
+    max_altitude = models.IntegerField(_("maximum altitude (m)"), default=0, db_index=True)
+    max_climb = models.FloatField(_("maximum climb rate (m/s)"), default=0.0, db_index=True)
+    distance = models.FloatField(_("free distance (m)"), blank=True, null=True, db_index=True)
+    north = models.FloatField(_("north"), blank=True, null=True, db_index=True)
+    south = models.FloatField(_("south"), blank=True, null=True, db_index=True)
+    east = models.FloatField(_("east"), blank=True, null=True, db_index=True)
+    west = models.FloatField(_("west"), blank=True, null=True, db_index=True)
+
+    # conversion job
+    status = models.CharField(_("status"), max_length=16, choices=JOB_STATUS, default=PENDING)
+    error = models.TextField(_("error"), blank=True)
+    kmz = models.FileField(
+        blank=True,
+        upload_to="paragliding/kmz/%Y/%m/",
+        verbose_name=_("KMZ File"),
+    )
+
+    class Meta:
+        verbose_name = _('track')
+        verbose_name_plural = _('tracks')
+        ordering = ('-date', '-id')
+        indexes = [
+            models.Index(fields=['site', 'date'], name='paragliding_site_date'),
+            models.Index(fields=['pilot', 'date'], name='paragliding_pilot_date'),
+        ]
+
+    def __str__(self):
+        return '%s' % (self.name or self.igc)
+
+    def save(self, *args, **kwargs):
+        if not self.name and self.igc:
+            name = os.path.basename(self.igc.name)
+            self.name = name[:-4] if name[-4:] == ".igc" else name
+        super(Track, self).save(*args, **kwargs)
+
+    def summarize(self):
+        """
+        reads the stored igc file (memory-mapped) and sets the summary of
+        the flight, e.g. to index tracks again. new tracks are summarized by
+        their conversion job
+        """
+        flight = Flight(self.igc.path, os.path.basename(self.igc.name))
+        if flight.datapoints:
+            self.set_summary(flight.summary())
+
+    def set_summary(self, summary):
+        """
+        sets the fields of the summary (see Flight.summary), a free distance
+        of None keeps the measured one
+        """
+        self.date = summary['date']
+        self.site = summary['location'] or ''
+        self.pilot = summary['pilot'] or ''
+        self.glider = summary['glider'] or ''
+        for field in SUMMARY_FIELDS:
+            if field != 'distance' or summary[field] is not None:
+                setattr(self, field, summary[field])
+
+    @property
+    def kmz_filename(self):
+        name = os.path.basename(self.igc.name)
+        return (name[:-4] if name[-4:] == ".igc" else name) + '.kmz'
+
+    def job(self):
+        """
+        returns the state of the conversion job
+        """
+        return {
+            'id': self.pk,
+            'name': os.path.basename(self.igc.name),
+            'status': self.status,
+            'error': self.error or None,
+        }
+
+    def finish_job(self, result=None, error=None):
+        """
+        stores the result of the conversion job, the kmz file and the
+        summary of the flight, or its error
+        """
+        fields = ['status', 'error']
+        if error is None:
+            kmz, summary = result
+            self.kmz.save(self.kmz_filename, ContentFile(kmz), save=False)
+            self.set_summary(summary)
+            self.status = DONE
+            fields += ['kmz', 'date', 'site', 'pilot', 'glider'] + list(SUMMARY_FIELDS)
+        else:
+            self.status = FAILED
+            self.error = error
+        self.save(update_fields=fields)
+
+    def finish_distance(self, distance=None, error=None):
+        """
+        stores the free distance measured by the job after the conversion.
+        the track stays done without it, if the measurement failed
+        """
+        if error is None:
+            self.distance = distance
+            self.save(update_fields=['distance'])
+        else:
+            logger.warning("measuring the free distance of %s failed: %s", self, error)
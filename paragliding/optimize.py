@@ -0,0 +1,358 @@
+#!/usr/bin/python
+# ex:set fileencoding=utf-8:
+
+from __future__ import unicode_literals
+
+import numpy as np
+
+from .geodesy import CHORD
+from .geodesy import Chord
+from .geodesy import get_model
+from .geodesy import haversine
+from .geodesy import take
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+# number of fixes, which are optimized exactly by dynamic programming, and
+# number of cells used to bound the remaining fixes
+MAX_CANDIDATES = 1500
+MAX_CELLS = 750
+
+# more candidates are optimized with rows bounded by nested spatial clusters
+# of CLUSTER_SIZE fixes, joined by CLUSTER_BRANCHING per level: BLOCK
+# columns are processed at once and at most MAX_PAIRS distances are
+# computed at once
+CLUSTER_SIZE = 32
+CLUSTER_BRANCHING = 4
+BLOCK = 64
+MAX_PAIRS = 2**20
+
+# tolerance (m) for rounding errors when comparing bounds
+EPSILON = 1e-6
+
+
+def pairwise(trig, x, y):
+    """
+    returns the matrix of distances between the fixes x and y
+    """
+    lat, lon, cos = trig
+    return haversine(
+        lat[x][:, None], lon[x][:, None], cos[x][:, None],
+        lat[y][None, :], lon[y][None, :], cos[y][None, :],
+    )
+
+
+def forward(D, legs):
+    """
+    dynamic programming over an upper triangular distance matrix: returns
+    the best distances of paths with 0..legs legs ending in every point
+    and the back pointers
+    """
+    m = len(D)
+    upper = np.triu(np.ones((m, m), dtype=np.bool_))
+
+    F = np.zeros((legs + 1, m))
+    back = np.zeros((legs, m), dtype=np.intp)
+    for leg in range(legs):
+        S = np.where(upper, F[leg][:, None] + D, -np.inf)
+        back[leg] = S.argmax(axis=0)
+        F[leg + 1] = S[back[leg], np.arange(m)]
+    return F, back
+
+
+def backward(D, legs):
+    """
+    the mirrored forward pass: the best distances of paths with 0..legs
+    legs starting in every point
+    """
+    m = len(D)
+    lower = np.tril(np.ones((m, m), dtype=np.bool_))
+
+    B = np.zeros((legs + 1, m))
+    for leg in range(legs):
+        B[leg + 1] = np.where(lower, B[leg][:, None] + D.T, -np.inf).max(axis=0)
+    return B
+
+
+def best_path(D, legs):
+    """
+    returns the maximum distance and the points of a path with ``legs`` legs
+    through the points in their order
+    """
+    return backtrack(*forward(D, legs))
+
+
+def backtrack(F, back):
+    """
+    returns the maximum distance and the path of the forward pass
+    """
+    legs = len(back)
+    path = [int(F[legs].argmax())]
+    for leg in range(legs - 1, -1, -1):
+        path.append(int(back[leg][path[-1]]))
+    return F[legs][path[0]], path[::-1]
+
+
+def through(U, legs):
+    """
+    returns the maximum distance of all paths using a point
+    """
+    F, back = forward(U, legs)
+    B = backward(U, legs)
+    # a path uses the point as its n-th point: n legs before and legs - n after
+    return np.max(F + B[::-1], axis=0)
+
+
+def dedupe(trig, fixes):
+    """
+    returns the fixes without those at the position of the previous one.
+    a path through a run of equal positions can use its first fix instead,
+    so the result is unchanged
+    """
+    lat, lon = trig[0][fixes], trig[1][fixes]
+    keep = np.ones(len(fixes), dtype=np.bool_)
+    keep[1:] = (lat[1:] != lat[:-1]) | (lon[1:] != lon[:-1])
+    return fixes[keep]
+
+
+def cluster_labels(trig, size):
+    """
+    returns the cluster of every point: the points are sorted into strips
+    of longitude and each strip into runs of ``size`` points by latitude,
+    so clusters with consecutive labels are close to each other
+    """
+    lat, lon, cos = trig
+    m = len(lat)
+    count = -(-m // size)
+    per_strip = int(np.ceil(np.sqrt(count)))
+
+    strip = np.empty(m, dtype=np.intp)
+    strip[np.argsort(lon * cos, kind='mergesort')] = np.arange(m) // (size * per_strip)
+    labels = np.empty(m, dtype=np.intp)
+    labels[np.lexsort((lat, strip))] = np.arange(m) // size
+    return labels
+
+
+class Clusters(object):
+    """
+    nested spatial clusters of the points: on the finest level ``size``
+    points, every coarser level joins ``branching`` clusters. every cluster
+    has a center (the point closest to its mean position) and the radius
+    of its points around the center
+    """
+
+    def __init__(self, model, terms, trig, size=CLUSTER_SIZE, branching=CLUSTER_BRANCHING):
+        m = len(trig[0])
+        labels = cluster_labels(trig, size)
+        self.branching = branching
+        self.labels = []
+        while True:
+            self.labels.insert(0, labels)
+            if labels.max() < branching:
+                break
+            labels = labels // branching
+        self.counts = [int(labels.max()) + 1 for labels in self.labels]
+
+        # the points of every finest cluster in their order
+        fine = self.labels[-1]
+        self.members = np.lexsort((np.arange(m), fine))
+        self.first = np.searchsorted(fine[self.members], np.arange(self.counts[-1]))
+
+        x, y = trig[1] * trig[2], trig[0]
+        self.centers = []
+        self.radius = []
+        for labels, count in zip(self.labels, self.counts):
+            n = np.bincount(labels, minlength=count)
+            offset = (
+                (x - (np.bincount(labels, x, count) / n)[labels]) ** 2
+                + (y - (np.bincount(labels, y, count) / n)[labels]) ** 2
+            )
+            order = np.lexsort((offset, labels))
+            centers = order[np.searchsorted(labels[order], np.arange(count))]
+            radius = np.zeros(count)
+            np.maximum.at(radius, labels, model.distance(take(terms, centers[labels]), terms))
+            self.centers.append(centers)
+            self.radius.append(radius)
+
+
+def forward_clustered(model, terms, trig, legs, block=BLOCK, max_pairs=MAX_PAIRS, **kwargs):
+    """
+    the forward pass (see forward) for many points, which can not be
+    bounded by cells of consecutive points (e.g. a flight along a ridge or
+    circling at one place).
+
+    the points before a block of columns are grouped into nested spatial
+    clusters (see Clusters). the best path from a cluster to a column is at
+    most the best path to one of its points plus the distance of the center
+    to the column plus the radius. the clusters are split from the coarsest
+    level on, as long as they can exceed the best path found for the column,
+    and only the points of the remaining finest clusters are evaluated. at
+    most max_pairs pairs of clusters (or points) and columns are bounded at
+    once
+    """
+    m = len(trig[0])
+    clusters = Clusters(model, terms, trig, **kwargs)
+    depth = len(clusters.counts)
+
+    F = np.zeros((legs + 1, m))
+    back = np.zeros((legs, m), dtype=np.intp)
+    for leg in range(legs):
+        w = F[leg]
+        # best point of every cluster before the block, and the number of
+        # points of the finest clusters before the block
+        wmax = [np.full(count, -np.inf) for count in clusters.counts]
+        best_row = [np.zeros(count, dtype=np.intp) for count in clusters.counts]
+        seen = np.zeros(clusters.counts[-1], dtype=np.intp)
+        for a in range(0, m, block):
+            b = min(a + block, m)
+            cols = np.arange(a, b)
+            S = np.where(cols[:, None] <= cols, w[a:b, None] + model.pairwise(terms, cols, cols), -np.inf)
+            rows = a + S.argmax(axis=0)
+            best = S[rows - a, np.arange(b - a)]
+
+            stack = []
+            if a:
+                c = np.repeat(np.arange(clusters.counts[0]), b - a)
+                j = np.tile(np.arange(b - a), clusters.counts[0])
+                stack.append((0, c, j))
+            while stack:
+                level, c, j = stack.pop()
+                if len(c) > max_pairs:
+                    half = len(c) // 2
+                    stack.append((level, c[half:], j[half:]))
+                    stack.append((level, c[:half], j[:half]))
+                    continue
+                if level == depth:
+                    _evaluate(model, terms, w, clusters, seen, c, j, a, best, rows, max_pairs)
+                    continue
+
+                c, j = c[wmax[level][c] > -np.inf], j[wmax[level][c] > -np.inf]
+                # the best point of the cluster is a lower bound
+                i = best_row[level][c]
+                value = w[i] + model.distance(take(terms, i), take(terms, a + j))
+                np.maximum.at(best, j, value)
+                hit = value == best[j]
+                rows[j[hit]] = i[hit]
+
+                upper = wmax[level][c] + model.distance(
+                    take(terms, clusters.centers[level][c]), take(terms, a + j),
+                ) + clusters.radius[level][c]
+                keep = upper > best[j] + EPSILON
+                c, j = c[keep], j[keep]
+                if level + 1 < depth:
+                    c = (c[:, None] * clusters.branching + np.arange(clusters.branching)).ravel()
+                    j = np.repeat(j, clusters.branching)
+                    valid = c < clusters.counts[level + 1]
+                    c, j = c[valid], j[valid]
+                stack.append((level + 1, c, j))
+
+            F[leg + 1, a:b] = best
+            back[leg, a:b] = rows
+
+            # the points of the block join their clusters
+            for level in range(depth):
+                group = clusters.labels[level][a:b]
+                np.maximum.at(wmax[level], group, w[a:b])
+                hit = w[a:b] == wmax[level][group]
+                best_row[level][group[hit]] = cols[hit]
+            np.add.at(seen, clusters.labels[-1][a:b], 1)
+    return F, back
+
+
+def _evaluate(model, terms, w, clusters, seen, c, j, a, best, rows, max_pairs):
+    # the points of the finest clusters c before the block, max_pairs at once
+    ends = np.cumsum(seen[c])
+    splits = np.searchsorted(ends, np.arange(max_pairs, ends[-1] if len(ends) else 0, max_pairs))
+    for c, j in zip(np.split(c, splits), np.split(j, splits)):
+        lengths = seen[c]
+        pair = np.repeat(np.arange(len(c)), lengths)
+        start = np.cumsum(lengths) - lengths
+        i = clusters.members[clusters.first[c[pair]] + np.arange(len(pair)) - start[pair]]
+        j = j[pair]
+        value = w[i] + model.distance(take(terms, i), take(terms, a + j))
+        np.maximum.at(best, j, value)
+        hit = value == best[j]
+        rows[j[hit]] = i[hit]
+
+
+def path_distance(model, trig, path):
+    """
+    returns the length of the path through the fixes with the model
+    """
+    terms = model.terms(take(trig, np.asarray(path)))
+    return float(model.distance(take(terms, slice(None, -1)), take(terms, slice(1, None))).sum())
+
+
+def free_distance(trig, turnpoints, max_candidates=MAX_CANDIDATES, max_cells=MAX_CELLS, model=None):
+    """
+    returns the maximum free distance over the fixes (as terms from
+    geodesy.trig) with up to ``turnpoints`` turnpoints and the indices of
+    the start, turnpoints and end. the distances are measured with the
+    model (see geodesy.get_model, the FAI sphere by default).
+
+    the result is exact: the fixes are grouped into cells of consecutive
+    fixes, each represented by its middle fix and a radius containing all
+    fixes of the cell. the best path through the representatives is a lower
+    bound of the result, adding the radii to the distances gives an upper
+    bound of every path through a cell. cells, which can not reach the lower
+    bound, are dropped until the remaining fixes are few enough to be
+    optimized exactly.
+
+    the cells are compared with the cheaper chords (geodesy.Chord), which
+    are turned into upper bounds of the model's distances. the path of the
+    lower bound is measured with the model, so only the remaining fixes
+    are optimized with the precise distances
+    """
+    model = get_model(model)
+    legs = turnpoints + 1
+    candidates = dedupe(trig, np.arange(len(trig[0])))
+
+    if len(candidates) == 0:
+        return 0.0, []
+
+    chords = CHORD.terms(trig)
+    size = -(-len(candidates) // max_cells)
+    while len(candidates) > max_candidates:
+        cell = np.arange(len(candidates)) // size
+        starts = np.arange(0, len(candidates), size)
+        middle = candidates[np.minimum(starts + size // 2, len(candidates) - 1)]
+
+        x = middle[cell]
+        radius = Chord.arc(np.maximum.reduceat(CHORD.distance(
+            take(chords, x), take(chords, candidates),
+        ), starts))
+
+        D = CHORD.pairwise(chords, middle, middle)
+        path = best_path(D, legs)[1]
+        lower = path_distance(model, trig, middle[path])
+        upper = through(model.scale * (
+            D * Chord.factor(D.max()) + radius[:, None] + radius[None, :]
+        ), legs)
+
+        # cells, which can only tie with the lower bound, are dropped as
+        # well, unless they hold the path of the lower bound
+        keep = upper > lower + EPSILON
+        keep[path] = True
+        logger.debug(
+            "%d candidates, %d cells of %d fixes: %.1f m, kept %d cells",
+            len(candidates), len(middle), size, lower, keep.sum(),
+        )
+
+        candidates = candidates[keep[cell]]
+        # halve the cells, as long as their number stays bounded
+        refined = max(size // 2, -(-len(candidates) // (2 * max_cells)))
+        if keep.all() and refined >= size:
+            break
+        size = refined
+
+    terms = model.terms(take(trig, candidates))
+    fixes = np.arange(len(candidates))
+    if len(candidates) <= max_candidates:
+        distance, path = best_path(model.pairwise(terms, fixes, fixes), legs)
+    else:
+        # the candidates could not be reduced (e.g. a local flight), the
+        # rows of the dynamic programming are bounded instead
+        distance, path = backtrack(*forward_clustered(model, terms, take(trig, candidates), legs))
+    return distance, [int(candidates[i]) for i in path]
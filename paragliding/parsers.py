@@ -7,20 +7,46 @@ import numpy as np
 import re
 import xml.etree.ElementTree as ET
 
-from itertools import combinations
+from itertools import chain
 
 from datetime import datetime
 from datetime import timedelta
 from pytz import utc
 
-from .utils import averages
-from .utils import moving
-from .utils import binom
+from . import analytics
+from . import columnar
+from . import geodesy
+from . import igc
+from . import instrument
+from . import kml
+from . import optimize
+from . import scoring
+from . import simplify
+from . import spatial
+from .cache import LRUCache
+from .utils import colors
 
 import logging
 logger = logging.getLogger(__name__)
 
 
+# bin size (m/s) of the climb rate, when consecutive segments are merged
+VARIO_RESOLUTION = 0.1
+
+# level of detail export: tolerance (m) and climb rate bins (m/s) of the
+# coarse flights and size of a flight's region on the screen (pixel), where
+# the fine flight is loaded
+LOD_COARSE_TOLERANCE = 50.0
+LOD_COARSE_RESOLUTION = 0.5
+LOD_PIXELS = 1024
+
+# memory budget (bytes) of the distance rows cached per flight
+DISTANCE_CACHE_SIZE = 64 * 2**20
+
+# number of turning points of the free distance in Flight.summary
+FREE_DISTANCE_TURNPOINTS = 3
+
+
 class FlightLog(ET.ElementTree):
 
     def __init__(self):
@@ -28,19 +54,112 @@ class FlightLog(ET.ElementTree):
         self.document = ET.SubElement(root, 'Document')
         self.tree = None
         self.flights = []
+        # the flights by the cells they cross and their take-off sites
+        self.index = spatial.GridIndex()
+        self.sites = spatial.Sites()
         name = ET.SubElement(self.document, 'name')
         name.text = "Flights"
         super(FlightLog, self).__init__(element=root)
 
     def add_flight(self, flight):
+        key = len(self.flights)
         self.flights.append(flight)
+        self.tree = None
+
+        if getattr(flight, 'fixes', None) is not None:
+            if len(flight.fixes):
+                self.index.insert(key, flight.bounds(), flight.lat, flight.lon)
+        else:
+            # a rendered flight only has its bounds
+            self.index.insert(key, flight.bounds())
+
+        takeoff = flight.takeoff()
+        if takeoff is not None:
+            self.sites.add(key, takeoff[0], takeoff[1], flight.location)
+
+    def site(self, key, names=None):
+        """
+        returns the location of the flight ``key`` (its index) from its
+        header or the site of its take-off (see spatial.Sites)
+        """
+        if self.flights[key].location:
+            return self.flights[key].location
+        if names is None:
+            names = self.sites.site_names()
+        return names.get(key, "Unknown")
+
+    def flights_in(self, north, south, east, west, exact=True):
+        """
+        returns the flights passing through the bounding box. with exact
+        a fix has to be inside, otherwise the flight crosses a cell of the
+        index overlapping the box
+        """
+        result = []
+        for key in self.index.query(north, south, east, west):
+            flight = self.flights[key]
+            if exact and getattr(flight, 'fixes', None) is not None:
+                lat = flight.lat
+                lon = flight.lon
+                if not ((lat >= south) & (lat <= north) & (lon >= west) & (lon <= east)).any():
+                    continue
+            result.append(flight)
+        return result
+
+    def flights_near(self, lat, lon, radius, exact=True):
+        """
+        returns the flights passing within radius (m) of the point. with
+        exact a fix has to be within the radius
+        """
+        point = geodesy.trig(np.array([lat]), np.array([lon]))
+        result = []
+        for key in self.index.query_radius(lat, lon, radius):
+            flight = self.flights[key]
+            if exact and getattr(flight, 'fixes', None) is not None:
+                trig = flight.get_trig()
+                if geodesy.haversine(point[0], point[1], point[2], *trig).min() > radius:
+                    continue
+            result.append(flight)
+        return result
+
+    def write_columns(self, directory):
+        """
+        writes the fixes and header information of all flights into a
+        binary archive (see columnar.write)
+        """
+        columnar.write(directory, [(flight.fixes, flight.info()) for flight in self.flights])
+
+    @classmethod
+    def read_columns(cls, directory, mmap=True):
+        """
+        returns a flight log with the flights of a binary archive. their
+        fixes are views of the memory-mapped archive
+        """
+        archive = columnar.Archive(directory, mmap)
+        log = cls()
+        for i in range(len(archive)):
+            log.add_flight(Flight.from_archive(archive, i))
+        return log
 
     def make_tree(self):
+        with instrument.stage('make_tree'):
+            folders = ET.fromstring('<Document>' + ''.join(self.iter_folders()) + '</Document>')
+        for folder in folders:
+            self.document.append(folder)
+
+    def group(self):
+        """
+        groups the flights by year, location and date. the tree is kept
+        until a flight is added
+        """
+        if self.tree is not None:
+            return self.tree
+
+        names = self.sites.site_names()
         self.tree = {}
-        for flight in self.flights:
+        for key, flight in enumerate(self.flights):
 
             year = flight.date.strftime('%Y')
-            location = flight.location
+            location = self.site(key, names)
             date = flight.date.strftime('%d.%m')
 
             if not year in self.tree:
@@ -53,21 +172,85 @@ class FlightLog(ET.ElementTree):
                 self.tree[year][location][date] = []
 
             self.tree[year][location][date].append(flight)
+        return self.tree
+
+    def iter_document(self, palette=None, resolution=VARIO_RESOLUTION, tolerance=None):
+        """
+        yields the flight log as a complete kml document
+        """
+        return kml.document("Flights", chain(
+            Flight.iter_styles(palette, resolution),
+            self.iter_folders(palette, resolution, tolerance),
+        ))
 
-        for location in sorted(self.tree.keys()):
-            l_folder = ET.SubElement(self.document, 'Folder')
-            name = ET.SubElement(l_folder, 'name')
-            name.text = location
-            for year in sorted(self.tree[location].keys()):
-                y_folder = ET.SubElement(l_folder, 'Folder')
-                name = ET.SubElement(y_folder, 'name')
-                name.text = year
-                for date in sorted(self.tree[location][year].keys()):
-                    d_folder = ET.SubElement(y_folder, 'Folder')
-                    name = ET.SubElement(d_folder, 'name')
-                    name.text = date
-                    for flight in self.tree[location][year][date]:
-                        d_folder = flight.make_tree(d_folder)
+    def iter_folders(self, palette=None, resolution=None, tolerance=None):
+        """
+        yields the folders (year, location, date) with all flights in chunks
+        """
+        return self.iter_tree(lambda flight: flight.iter_kml(palette, resolution, tolerance))
+
+    def iter_tree(self, render):
+        """
+        yields the folders (year, location, date) with the chunks returned
+        by render(flight) for every flight
+        """
+        self.group()
+        for year in sorted(self.tree.keys()):
+            yield '<Folder>' + kml.element('name', year)
+            for location in sorted(self.tree[year].keys()):
+                yield '<Folder>' + kml.element('name', location)
+                for date in sorted(self.tree[year][location].keys()):
+                    yield '<Folder>' + kml.element('name', date)
+                    for flight in self.tree[year][location][date]:
+                        for chunk in render(flight):
+                            yield chunk
+                    yield '</Folder>'
+                yield '</Folder>'
+            yield '</Folder>'
+
+    def write_lod_kmz(self, file_or_filename, palette=None, resolution=VARIO_RESOLUTION,
+                      tolerance=None, coarse_tolerance=LOD_COARSE_TOLERANCE,
+                      coarse_resolution=LOD_COARSE_RESOLUTION, lod_pixels=LOD_PIXELS):
+        """
+        writes a kmz file, where every flight is stored in its own kml file
+        in a coarse (simplified with coarse_tolerance and merged with
+        coarse_resolution) and a fine variant.
+        the main document only links them with regions covering the
+        flights, so a viewer loads just the visible flights. the fine
+        variant replaces the coarse one, when the region is larger than
+        lod_pixels on the screen
+        """
+        files = dict((id(flight), "flights/%04d" % n) for n, flight in enumerate(self.flights))
+
+        def links(flight):
+            name = files[id(flight)]
+            bounds = flight.bounds()
+            yield (
+                '<Folder>'
+                + kml.element('name', str(flight))
+                + kml.network_link(
+                    "coarse", name + "-coarse.kml",
+                    kml.region(*bounds, max_pixels=lod_pixels),
+                )
+                + kml.network_link(
+                    "fine", name + "-fine.kml",
+                    kml.region(*bounds, min_pixels=lod_pixels),
+                )
+                + '</Folder>'
+            )
+
+        entries = [("doc.kml", kml.document("Flights", self.iter_tree(links)))]
+        for flight in self.flights:
+            name = files[id(flight)]
+            entries.append((
+                name + "-coarse.kml",
+                flight.iter_document(palette, coarse_resolution, coarse_tolerance),
+            ))
+            entries.append((
+                name + "-fine.kml",
+                flight.iter_document(palette, resolution, tolerance),
+            ))
+        kml.write_entries(file_or_filename, entries)
 
 
 class Flight(object):
@@ -82,7 +265,19 @@ class Flight(object):
         ( 4.0, 186,   0, 186),
     ]
 
-    def __init__(self, file_or_filename, name, *args, **kwargs):
+    __slots__ = (
+        'location',
+        'pilot',
+        'glider',
+        'date',
+        'name',
+        'fixes',
+        'distances',
+        '_trig',
+        '_analytics',
+    )
+
+    def __init__(self, file_or_filename, name, bulk=True, distance_cache_size=DISTANCE_CACHE_SIZE, *args, **kwargs):
 
         self.location = None
         self.pilot = None
@@ -94,17 +289,132 @@ class Flight(object):
         else:
             self.name = name
 
-        self.time = []
-        self.lat = []
-        self.lon = []
-        self.gpsheight = []
-        self.barheight = []
-        self.cart = []
+        # one record per fix (igc.FIX_DTYPE), time in seconds since self.date
+        self.fixes = np.empty(0, dtype=igc.FIX_DTYPE)
+        # rows of the distance matrix, bounded to distance_cache_size bytes
+        self.distances = LRUCache(distance_cache_size)
+        self._trig = None
+        self._analytics = None
+
+        if file_or_filename is not None:
+            self.read_igc(file_or_filename, bulk=bulk)
+
+    @classmethod
+    def from_fixes(cls, fixes, name, location=None, pilot=None, glider=None, date=None, **kwargs):
+        """
+        returns a flight with decoded fixes (igc.FIX_DTYPE), e.g. loaded
+        from a cache, without parsing an igc file
+        """
+        flight = cls(None, name, **kwargs)
+        flight.fixes = np.asarray(fixes, dtype=igc.FIX_DTYPE)
+        flight.location = location
+        flight.pilot = pilot
+        flight.glider = glider
+        flight.date = date
+        return flight
+
+    @classmethod
+    def from_archive(cls, archive, i=0, **kwargs):
+        """
+        returns the flight i of a binary archive (see columnar.Archive),
+        its fixes are a view of the archive
+        """
+        info = archive.info[i]
+        return cls.from_fixes(
+            archive.fixes(i), info['name'],
+            location=info['location'],
+            pilot=info['pilot'],
+            glider=info['glider'],
+            date=info['date'],
+            **kwargs
+        )
+
+    def takeoff(self):
+        """
+        returns the position (latitude, longitude) of the first fix or None
+        """
+        if not self.datapoints:
+            return None
+        return float(self.lat[0]), float(self.lon[0])
+
+    def info(self):
+        """
+        returns the header information of the flight
+        """
+        return {
+            'name': self.name,
+            'location': self.location,
+            'pilot': self.pilot,
+            'glider': self.glider,
+            'date': self.date,
+        }
+
+    def write_columns(self, directory):
+        """
+        writes the fixes and the header information into a binary archive
+        (see columnar.write), which is read much faster than the igc file
+        """
+        columnar.write(directory, [(self.fixes, self.info())])
+
+    @classmethod
+    def read_columns(cls, directory, mmap=True, **kwargs):
+        """
+        returns the first flight of a binary archive
+        """
+        return cls.from_archive(columnar.Archive(directory, mmap), 0, **kwargs)
+
+    @property
+    def datapoints(self):
+        return len(self.fixes)
 
-        self.datapoints = 0
-        self.distances = {}
+    @property
+    def datarange(self):
+        return np.arange(self.datapoints)
 
-        self.read_igc(file_or_filename)
+    @property
+    def seconds(self):
+        return self.fixes['time']
+
+    @property
+    def lat(self):
+        return self.fixes['lat'] / float(igc.COORDINATE_SCALE)
+
+    @property
+    def lon(self):
+        return self.fixes['lon'] / float(igc.COORDINATE_SCALE)
+
+    @property
+    def barheight(self):
+        return self.fixes['barheight']
+
+    @property
+    def gpsheight(self):
+        return self.fixes['gpsheight']
+
+    @property
+    def valid(self):
+        return self.fixes['valid']
+
+    @property
+    def time(self):
+        """
+        the time of all fixes as datetime objects (created on every access)
+        """
+        return [self.get_time(i) for i in range(self.datapoints)]
+
+    def get_time(self, i):
+        return self.date + timedelta(seconds=int(self.fixes['time'][i]))
+
+    def bounds(self):
+        """
+        returns the bounding box (north, south, east, west) in degree
+        """
+        lat = self.fixes['lat']
+        lon = self.fixes['lon']
+        return tuple(
+            value / float(igc.COORDINATE_SCALE)
+            for value in (lat.max(), lat.min(), lon.max(), lon.min())
+        )
 
     def __str__(self):
         return self.name or "Trajectory"
@@ -112,58 +422,113 @@ class Flight(object):
     def __repr__(self):
         return "<%s: '%s' at 0x%x>" % (self.__class__.__name__, str(self), id(self))
 
+    def summary(self, turnpoints=FREE_DISTANCE_TURNPOINTS):
+        """
+        returns the key figures of the flight: the header information, the
+        duration (s), the maximum gps altitude (m), the maximum climb rate
+        of the smoothed altitude (m/s), the free distance (m) and the bounds.
+        the free distance is None with turnpoints=None, it is the slowest
+        figure of long flights
+        """
+        seconds = self.seconds
+        climb = self.get_analytics().climbs
+        north, south, east, west = self.bounds()
+        distance = None
+        if turnpoints is not None:
+            distance = float(self.calc_turning_points(turnpoints)[0])
+        return {
+            'date': self.date.date() if self.date else None,
+            'location': self.location,
+            'pilot': self.pilot,
+            'glider': self.glider,
+            'duration': int(seconds[-1] - seconds[0]),
+            'max_altitude': int(self.gpsheight.max()),
+            'max_climb': float(climb.max()) if len(climb) else 0.0,
+            'distance': distance,
+            'north': north,
+            'south': south,
+            'east': east,
+            'west': west,
+        }
+
     def color(self, value, alpha=255):
-        j = None
-        k = None
-
-        for c in range(len(self.colors)):
-            if self.colors[c][0] <= value:
-                if j == None or self.colors[j] <= self.colors[c]:
-                    j = c
-            if self.colors[c][0] >= value:
-                if k == None or self.colors[k] >= self.colors[c]:
-                    k = c
-
-        if j != None and k != None and j != k:
-            cdata = [self.colors[j][0], self.colors[k][0]]
-            mix = (value - min(cdata)) / (max(cdata) - min(cdata))
-
-            if self.colors[j][0] > self.colors[k][0]:
-                r = int(mix * self.colors[j][1] + self.colors[k][1] - mix * self.colors[k][1])
-                g = int(mix * self.colors[j][2] + self.colors[k][2] - mix * self.colors[k][2])
-                b = int(mix * self.colors[j][3] + self.colors[k][3] - mix * self.colors[k][3])
-            else:
-                r = int(mix * self.colors[k][1] + self.colors[j][1] - mix * self.colors[j][1])
-                g = int(mix * self.colors[k][2] + self.colors[j][2] - mix * self.colors[j][2])
-                b = int(mix * self.colors[k][3] + self.colors[j][3] - mix * self.colors[j][3])
+        return str(self.color_array([value], alpha)[0])
 
-        elif j != None and k == None:
-            r = self.colors[j][1]
-            g = self.colors[j][2]
-            b = self.colors[j][3]
+    @classmethod
+    def color_array(cls, values, alpha=255, palette=None):
+        """
+        returns the colors (aabbggrr) for an array of climb rates
+        """
+        return colors(values, palette or cls.colors, alpha)
 
-        else:
-            r = self.colors[k][1]
-            g = self.colors[k][2]
-            b = self.colors[k][3]
+    @classmethod
+    def vario_bins(cls, palette=None, resolution=VARIO_RESOLUTION):
+        """
+        returns the range of climb rate bins, which cover the palette
+        """
+        stops = [c[0] for c in palette or cls.colors]
+        return int(np.floor(min(stops) / resolution)), int(np.ceil(max(stops) / resolution))
 
-        return format(alpha, '02x') + format(b, '02x') + format(g, '02x') + format(r, '02x')
+    @classmethod
+    def iter_styles(cls, palette=None, resolution=VARIO_RESOLUTION):
+        """
+        yields the shared line styles for merged segments
+        """
+        if not resolution:
+            return
+        low, high = cls.vario_bins(palette, resolution)
+        bins = np.arange(low, high + 1)
+        style_colors = cls.color_array(bins * resolution, palette=palette)
+        yield ''.join([
+            '<Style id="vario%d"><LineStyle>' % n
+            + kml.element('color', color)
+            + kml.element('width', "2.5")
+            + '</LineStyle></Style>'
+            for n, color in enumerate(style_colors)
+        ])
 
-    def read_igc(self, file_or_filename):
+    def read_igc(self, file_or_filename, bulk=True):
         """
         reads igc data into the object
         """
 
-        if hasattr(file_or_filename, "readlines"):
-            file_obj = file_or_filename
-        else:
-            file_obj = open(file_or_filename, "r")
+        with instrument.stage('read_igc'):
+            if bulk:
+                # the file is memory-mapped (or its buffer is used) and the
+                # records are decoded directly from it
+                self.read_bulk(igc.buffer(file_or_filename))
+                file_obj = file_or_filename
+            elif hasattr(file_or_filename, "readlines"):
+                file_obj = file_or_filename
+                self.read_lines(file_obj.readlines())
+            else:
+                file_obj = open(file_or_filename, "rb")
+                self.read_lines(file_obj.readlines())
+        instrument.count('fixes', self.datapoints)
+
+        if hasattr(file_obj, "close"):
+            file_obj.close()
+
+    def read_bulk(self, buf):
+        """
+        decodes all fixed-width B-records at once
+        """
+        headers, self.fixes = igc.read_igc(buf)
+
+        for line in headers:
+            self.read_header(line)
 
-        search = r"B([0-9]{6})([0-9]{6})"
+    def read_lines(self, lines):
+        """
+        parses the igc file line by line
+        """
         timedelta_days = 0
         time_old = None
-        for line in file_obj.readlines():
-            line = line.strip().decode("latin1")
+        fixes = []
+        for line in lines:
+            line = line.strip()
+            if not isinstance(line, type("")):
+                line = line.decode("latin1")
             # line.decode("utf-8").strip()
             coord = re.match(r'B([0-9]{2})([0-9]{2})([0-9]{2})([0-9]{2})([0-9]{5})(N|S)([0-9]{3})([0-9]{5})(W|E)(A|V)([0-9-]{5})([0-9-]{5})', line)
             if coord:
@@ -175,308 +540,352 @@ class Flight(object):
                     timedelta_days += 1
                 time_old = time
 
-                lat = float(a[3]) + float(a[4]) / 60000
+                lat = int(a[3]) * igc.COORDINATE_SCALE + int(a[4])
                 if a[5] == "S":
                     lat *= -1
 
-                lon = float(a[6]) + float(a[7]) / 60000
+                lon = int(a[6]) * igc.COORDINATE_SCALE + int(a[7])
                 if a[8] == "W":
                     lon *= -1
 
                 barheight = int(a[10])
                 gpsheight = int(a[11])
 
-                self.time.append(self.date + time)
-                self.lat.append(lat)
-                self.lon.append(lon)
-                self.barheight.append(barheight)
-                self.gpsheight.append(gpsheight)
+                fixes.append((
+                    int(time.total_seconds()),
+                    lat,
+                    lon,
+                    barheight,
+                    gpsheight,
+                    a[9] == "A",
+                ))
                 continue
 
-            if "HPSITSITE" in line:
-                self.location = line.split(':',1)[1].strip()
+            if self.read_header(line):
                 continue
 
-            if "HOPLTPILOT" in line:
-                self.pilot = line.split(':',1)[1].strip()
-                continue
+            # TODO only log unparsed entries from igc file
+            logger.debug(line.strip())
 
-            if "HOGTYGLIDERTYPE" in line:
-                self.glider = line.split(':',1)[1].strip()
-                continue
+        columns = np.array(fixes, dtype=np.int64).reshape(-1, len(igc.FIX_DTYPE.names))
+        self.fixes = np.empty(len(columns), dtype=igc.FIX_DTYPE)
+        for n, column in enumerate(igc.FIX_DTYPE.names):
+            self.fixes[column] = columns[:, n]
+        self.fixes['barheight'] = igc.altitude(columns[:, 3])
+        self.fixes['gpsheight'] = igc.altitude(columns[:, 4])
 
-            date = re.match(r"HFDTE([0-9]{2})([0-9]{2})([0-9]{2})", line)
-            if date:
-                d,m,y = date.groups()
-                self.date = datetime(2000+int(y), int(m), int(d), tzinfo=utc)
-                continue
+    def read_header(self, line):
+        """
+        reads the header information from a line, returns True if the
+        line was consumed
+        """
+        if "HPSITSITE" in line:
+            self.location = line.split(':',1)[1].strip()
+            return True
 
-            # TODO only log unparsed entries from igc file
-            logger.debug(line.strip())
+        if "HOPLTPILOT" in line:
+            self.pilot = line.split(':',1)[1].strip()
+            return True
 
-        self.lon = np.array(self.lon)
-        self.lat = np.array(self.lat)
-        self.barheight = np.array(self.barheight)
-        self.gpsheight = np.array(self.gpsheight)
-
-        self.datapoints = len(self.lon)
-        self.datarange = np.arange(self.datapoints)
-
-        file_obj.close()
-
-    def make_tree(self, root):
-
-        root_folder = ET.SubElement(root, 'Folder')
-        name = ET.SubElement(root_folder, 'name')
-        name.text = str(self)
-
-        tracks_folder = ET.SubElement(root_folder, 'Folder')
-        data = ET.SubElement(tracks_folder, 'name')
-        data.text = "Tracks"
-        data = ET.SubElement(tracks_folder, 'open')
-        data.text = "1"
-        style = ET.SubElement(tracks_folder, 'Style')
-        style = ET.SubElement(style, 'ListStyle')
-        data = ET.SubElement(style, 'listItemType')
-        data.text = "radioFolder"
-        data = ET.SubElement(style, 'bgColor')
-        data.text = "00ffffff"
-        data = ET.SubElement(style, 'maxSnippetLines')
-        data.text = "2"
-
-        colored_folder = ET.SubElement(tracks_folder, 'Folder')
-        data = ET.SubElement(colored_folder, 'name')
-        data.text = "Colored"
-        data = ET.SubElement(colored_folder, 'visibility')
-        data.text = "1"
-
-        mono_folder = ET.SubElement(tracks_folder, 'Folder')
-        data = ET.SubElement(mono_folder, 'name')
-        data.text = "Mono (green)"
-        data = ET.SubElement(mono_folder, 'visibility')
-        data.text = "0"
-
-        shadow_folder = ET.SubElement(root_folder, 'Folder')
-        data = ET.SubElement(shadow_folder, 'name')
-        data.text = "Shadow"
+        if "HOGTYGLIDERTYPE" in line:
+            self.glider = line.split(':',1)[1].strip()
+            return True
 
-        # SHADOW
+        date = re.match(r"HFDTE([0-9]{2})([0-9]{2})([0-9]{2})", line)
+        if date:
+            d,m,y = date.groups()
+            self.date = datetime(2000+int(y), int(m), int(d), tzinfo=utc)
+            return True
 
-        marker = ET.SubElement(shadow_folder, 'Placemark')
-        data = ET.SubElement(marker, 'name')
-        style = ET.SubElement(marker, 'Style', id="ShadowLine")
-        style = ET.SubElement(style, 'LineStyle')
-        data = ET.SubElement(style, 'color')
-        data.text = '48000000'
-        data = ET.SubElement(style, 'width')
-        data.text = '2.0'
-        coordinates = ET.SubElement(marker, 'LineString')
-        data = ET.SubElement(coordinates, 'tessellate')
-        data.text = '1'
-        data = ET.SubElement(coordinates, 'coordinates')
-        data.text = ' '.join([
-            "%.8f,%.8f,%d" % (
-                self.lon[d],
-                self.lat[d],
-                1,
-            )
-            for d in range(len(self.time))
-        ])
+        return False
 
-        # Track (mono)
+    def make_tree(self, root, palette=None):
+        with instrument.stage('make_tree'):
+            root.append(ET.fromstring(''.join(self.iter_kml(palette))))
+        return root
 
-        marker = ET.SubElement(mono_folder, 'Placemark')
-        data = ET.SubElement(marker, 'name')
-        data.text = "Mono (green)"
-        data = ET.SubElement(marker, 'visibility')
-        data.text = "0"
-        style = ET.SubElement(marker, 'Style', id="MonoLine")
-        style = ET.SubElement(style, 'LineStyle')
-        data = ET.SubElement(style, 'color')
-        data.text = 'ff00ff00'
-        data = ET.SubElement(style, 'width')
-        data.text = '1.0'
-        coordinates = ET.SubElement(marker, 'LineString')
-        data = ET.SubElement(coordinates, 'tessellate')
-        data.text = '1'
-        data = ET.SubElement(coordinates, 'altitudeMode')
-        data.text = 'absolute'
-        data = ET.SubElement(coordinates, 'coordinates')
-        data.text = ' '.join([
-            "%.8f,%.8f,%d" % (
-                self.lon[d],
-                self.lat[d],
-                self.gpsheight[d],
-            )
-            for d in range(len(self.time))
-        ])
+    def iter_document(self, palette=None, resolution=VARIO_RESOLUTION, tolerance=None):
+        """
+        yields the flight as a complete kml document
+        """
+        return kml.document(str(self), chain(
+            self.iter_styles(palette, resolution),
+            self.iter_kml(palette, resolution, tolerance),
+        ))
+
+    def iter_kml(self, palette=None, resolution=None, tolerance=None):
+        """
+        yields the kml folder of the flight in chunks.
 
-        smooth_height = averages(self.gpsheight, 20, binom)
-        # speed = np.gradient(t.cart[0])**2 + np.gradient(t.cart[1])**2 + np.gradient(t.cart[2])**2 - np.gradient(t.gpsheight)**2
-        # speed *= speed > 0
-        # speed = np.sqrt(speed)*3.6
+        with a resolution (m/s) consecutive segments with the same climb
+        rate bin are merged into one line, which references the shared
+        styles from iter_styles. otherwise every segment gets its own
+        placemark.
+
+        with a tolerance (m) the track is simplified before it is rendered
+        """
+
+        lat = self.lat
+        lon = self.lon
+        gpsheight = self.gpsheight
+
+        smooth_height = self.get_analytics().smooth_height
+        deltas = self.get_analytics().deltas
+
+        if tolerance:
+            points = self.simplify(tolerance, deltas)
+            # mean climb rate per fix of the remaining segments
+            deltas = np.diff(smooth_height[points]) / np.diff(points)
+            lat = lat[points]
+            lon = lon[points]
+            gpsheight = gpsheight[points]
+
+        yield '<Folder>' + kml.element('name', str(self))
+
+        yield (
+            '<Folder>'
+            + kml.element('name', "Tracks")
+            + kml.element('open', "1")
+            + '<Style><ListStyle>'
+            + kml.element('listItemType', "radioFolder")
+            + kml.element('bgColor', "00ffffff")
+            + kml.element('maxSnippetLines', "2")
+            + '</ListStyle></Style>'
+        )
 
         # Track (color)
 
-        for d in range(1, len(self.time)):
-            delta = smooth_height[d] - smooth_height[d-1]
-
-            flight = ET.SubElement(colored_folder, 'Placemark')
-
-            data = ET.SubElement(flight, 'name')
-            # data.text = "%s | %s m | %s km/h | %.1f m/s" % ("time", "alt", "speed", delta)
-            data.text = "%.1f m/s" % delta
-            data = ET.SubElement(flight, 'Style')
-            style = ET.SubElement(data, 'LineStyle')
-            data = ET.SubElement(style, 'color')
-            data.text = self.color(delta)
-            data = ET.SubElement(style, 'width')
-            data.text = "2.5"
-            coord = ET.SubElement(flight, 'LineString')
-            data = ET.SubElement(coord, 'tessellate')
-            data.text = "1"
-            data = ET.SubElement(coord, 'altitudeMode')
-            data.text = "absolute"
-            data = ET.SubElement(coord, 'coordinates')
-            data.text = "%.8f,%.8f,%d %.8f,%.8f,%d"% (
-                self.lon[d-1],
-                self.lat[d-1],
-                self.gpsheight[d-1],
-                self.lon[d],
-                self.lat[d],
-                self.gpsheight[d],
-            )
+        yield (
+            '<Folder>'
+            + kml.element('name', "Colored")
+            + kml.element('visibility', "1")
+        )
 
-        return root
+        if resolution:
+            chunks = self.iter_merged_segments(lon, lat, gpsheight, deltas, palette, resolution)
+        else:
+            chunks = self.iter_segments(lon, lat, gpsheight, deltas, palette)
+        for chunk in chunks:
+            yield chunk
 
-    def max_turning_points(self, iterator, coords=None, distance=-1, count=0):
-        changed = False
-        keep = set()
-        data = set()
-        for test_coords in iterator:
-
-            for i in test_coords:
-                data.add(i)
-
-            new_distance = self.calc_turning_point_distance(test_coords)
-            if new_distance > distance:
-                coords = test_coords
-                changed = True
-                distance = new_distance
-            elif new_distance > (0.95 + 0.02 * count) * distance:
-                for i in test_coords:
-                    keep.add(i)
-
-        return coords, distance, keep, data, changed
-
-    def calc_turning_points(self, points, guess=0, maxiter=20):
-        count = 0
-        if guess < points + 2:
-            guess = points + 2
-        coords, distance, keep, data, changed = self.max_turning_points(
-            combinations(
-                np.uint16(np.arange(guess) * (self.datapoints - 1) / (guess - 1)), points + 2
-            )
+        yield '</Folder>'
+
+        # Track (mono)
+
+        yield (
+            '<Folder>'
+            + kml.element('name', "Mono (green)")
+            + kml.element('visibility', "0")
+            + '<Placemark>'
+            + kml.element('name', "Mono (green)")
+            + kml.element('visibility', "0")
+            + '<Style id="MonoLine"><LineStyle>'
+            + kml.element('color', "ff00ff00")
+            + kml.element('width', "1.0")
+            + '</LineStyle></Style>'
+            + '<LineString>'
+            + kml.element('tessellate', "1")
+            + kml.element('altitudeMode', "absolute")
+            + '<coordinates>'
         )
-        keep = set()
-        data = set()
-
-        while changed and count < maxiter:
-            iter_coords = keep.copy()
-            for n in range(len(coords)):
-
-                j = coords[n]
-                if n == 0:
-                    i = 0
-                    k = coords[n + 1]
-                elif n == (len(coords) - 1):
-                    i = coords[n - 1]
-                    k = self.datapoints - 1
-                else:
-                    i = coords[n - 1]
-                    k = coords[n + 1]
-
-                dist_i = self.get_distances(i)
-                dist_j = self.get_distances(j)
-                dist_k = self.get_distances(k)
-
-                iter_coords.add(j)
-
-                n_ik = (np.argmax((dist_i[i:k+1] + dist_k[i:k+1])) + i)
-                iter_coords.add(n_ik)
-
-                if n == 0:
-                    n_k = np.argmax(dist_k[0:k+1])
-                    iter_coords.add(n_k)
-                elif n == (len(coords) - 1):
-                    n_i = np.argmax(dist_i[i:k + 1]) + i
-                    iter_coords.add(n_i)
-
-                if i < j:
-                    n_ij = (np.argmax((dist_i[i:j+1] + dist_j[i:j+1])) + i)
-                    iter_coords.add(n_ij)
-
-                if j < k:
-                    n_jk = (np.argmax((dist_j[j:k+1] + dist_k[j:k+1])) + j)
-                    iter_coords.add(n_jk)
-
-            if not bool(iter_coords - data):
-                # no new items to process
-                logger.info("no new items to process")
-                break
-
-            coords, distance, keep, data, changed = self.max_turning_points(
-                combinations(sorted(iter_coords), points + 2), coords, distance, count
-            )
-            count += 1
+        for chunk in kml.coordinates(lon, lat, gpsheight):
+            yield chunk
+        yield '</coordinates></LineString></Placemark></Folder>'
 
-        return self.calc_turning_point_distance(coords), coords
+        yield '</Folder>'
 
-    def calc_turning_point_distance(self, coords):
-        d = 0
-        for n in range(len(coords) - 1):
-            i = coords[n]
-            j = coords[n+1]
-            d += self.get_distances(i)[j]
-        return d
+        # SHADOW
 
-    def get_distances(self, i):
-        if i in self.distances.keys():
-            return self.distances[i]
-        self.distances[i] = np.zeros(self.datapoints, np.float64)
-        for n in range(self.datapoints):
-            self.distances[i][n] = self.calc_distance(i, n)
-        return self.distances[i]
+        yield (
+            '<Folder>'
+            + kml.element('name', "Shadow")
+            + '<Placemark>'
+            + kml.element('name')
+            + '<Style id="ShadowLine"><LineStyle>'
+            + kml.element('color', "48000000")
+            + kml.element('width', "2.0")
+            + '</LineStyle></Style>'
+            + '<LineString>'
+            + kml.element('tessellate', "1")
+            + '<coordinates>'
+        )
+        for chunk in kml.coordinates(lon, lat, np.ones(len(lon), dtype=np.int8)):
+            yield chunk
+        yield '</coordinates></LineString></Placemark></Folder>'
 
-    def calc_FAI_distance(self, i, j):
-        # FAI earth-radius in meter
-        R = 6371000.0
+        yield '</Folder>'
+
+    def simplify(self, tolerance, deltas=None):
+        """
+        returns the indices of the fixes, which remain after a 3d
+        douglas-peucker simplification with the tolerance (m). the fixes,
+        where the climb rate (deltas per segment) changes between climb and
+        sink, are kept. changes of the colour bins are not: with fine bins
+        nearly every fix would be kept
+        """
+        if self.datapoints < 3:
+            return self.datarange
+
+        keep = None
+        if deltas is not None:
+            keep = simplify.transitions(deltas)
+        with instrument.stage('simplify'):
+            x, y, z = simplify.project(self.lat, self.lon, self.gpsheight)
+            points = np.flatnonzero(simplify.douglas_peucker(x, y, z, tolerance, keep))
+        instrument.count('simplified_points_dropped', self.datapoints - len(points))
+        logger.info(
+            "%s: simplified %d to %d points (%d dropped)",
+            self, self.datapoints, len(points), self.datapoints - len(points),
+        )
+        return points
+
+    def iter_segments(self, lon, lat, gpsheight, deltas, palette=None):
+        segment_colors = self.color_array(deltas, palette=palette)
+        instrument.count('placemarks', max(0, len(lon) - 1))
+
+        for n in range(1, len(lon), kml.CHUNK_SIZE):
+            yield ''.join([
+                '<Placemark>'
+                # "%s | %s m | %s km/h | %.1f m/s" % ("time", "alt", "speed", delta)
+                + kml.element('name', "%.1f m/s" % deltas[d-1])
+                + '<Style><LineStyle>'
+                + kml.element('color', segment_colors[d-1])
+                + kml.element('width', "2.5")
+                + '</LineStyle></Style>'
+                + '<LineString>'
+                + kml.element('tessellate', "1")
+                + kml.element('altitudeMode', "absolute")
+                + kml.element('coordinates', "%.8f,%.8f,%d %.8f,%.8f,%d" % (
+                    lon[d-1],
+                    lat[d-1],
+                    gpsheight[d-1],
+                    lon[d],
+                    lat[d],
+                    gpsheight[d],
+                ))
+                + '</LineString></Placemark>'
+                for d in range(n, min(n + kml.CHUNK_SIZE, len(lon)))
+            ])
+
+    def iter_merged_segments(self, lon, lat, gpsheight, deltas, palette=None, resolution=VARIO_RESOLUTION):
+        # a track with less than two fixes has no segments
+        if len(deltas) == 0:
+            return
+        low, high = self.vario_bins(palette, resolution)
+        bins = np.clip(np.round(deltas / resolution), low, high).astype(np.int32) - low
+
+        # segment i connects the fixes i and i + 1, a run of segments
+        # [start, end) the fixes start to end
+        change = np.flatnonzero(np.diff(bins)) + 1
+        starts = np.concatenate(([0], change))
+        ends = np.concatenate((change, [len(bins)]))
+        instrument.count('placemarks', len(starts))
+
+        chunk = []
+        size = 0
+        for start, end in zip(starts, ends):
+            chunk.append(
+                '<Placemark>'
+                + kml.element('name', "%.1f m/s" % deltas[start:end].mean())
+                + kml.element('styleUrl', "#vario%d" % bins[start])
+                + '<LineString>'
+                + kml.element('tessellate', "1")
+                + kml.element('altitudeMode', "absolute")
+                + '<coordinates>'
+                + ''.join(kml.coordinates(lon[start:end + 1], lat[start:end + 1], gpsheight[start:end + 1]))
+                + '</coordinates></LineString></Placemark>'
+            )
+            size += end - start
+            if size >= kml.CHUNK_SIZE:
+                yield ''.join(chunk)
+                chunk = []
+                size = 0
+        if chunk:
+            yield ''.join(chunk)
+
+    def calc_turning_points(self, points, model=None):
+        """
+        returns the maximum free distance with up to ``points`` turning
+        points and the indices of the start, the turning points and the end
+        (see optimize.free_distance), measured with the distance model
+        """
+        with instrument.stage('free_distance'):
+            distance, coords = optimize.free_distance(self.get_trig(), points, model=model)
+        return distance, tuple(coords)
+
+    def calc_fai_triangle(self):
+        """
+        returns the score of the best FAI triangle (perimeter minus closing
+        gap) and the indices of the start, the turning points and the end
+        (see scoring.triangle)
+        """
+        with instrument.stage('triangle'):
+            return scoring.fai_triangle(self.get_trig())
 
-        latx = np.radians(self.lat[i])
-        lonx = np.radians(self.lon[i])
+    def calc_flat_triangle(self):
+        """
+        returns the score of the best flat triangle and its indices
+        """
+        with instrument.stage('triangle'):
+            return scoring.flat_triangle(self.get_trig())
 
-        laty = np.radians(self.lat[j])
-        lony = np.radians(self.lon[j])
+    def calc_turning_point_distance(self, coords, model=None):
+        """
+        returns the length of the path through the fixes coords (see
+        calc_distance)
+        """
+        coords = np.asarray(coords, dtype=np.intp)
+        if len(coords) < 2:
+            return 0.0
+        return float(np.sum(self.calc_distance(coords[:-1], coords[1:], model)))
 
-        sinlat = np.sin((latx-laty)/2)
-        sinlon = np.sin((lonx-lony)/2)
+    def get_trig(self):
+        """
+        returns the terms of all fixes used for the distance computation
+        (see geodesy.trig), which are computed once
+        """
+        if self._trig is None:
+            self._trig = geodesy.trig(self.lat, self.lon)
+        return self._trig
 
-        return 2 * R * np.arcsin(np.sqrt(
-            sinlat * sinlat + sinlon * sinlon * np.cos(latx) * np.cos(laty)
-        ))
+    def get_analytics(self):
+        """
+        returns the speed, the climb rate, the glide ratio and the heading
+        of all fixes and the thermals and glides (see analytics.Analytics),
+        which are computed once
+        """
+        if self._analytics is None:
+            with instrument.stage('analytics'):
+                self._analytics = analytics.Analytics(self.seconds, self.gpsheight, self.get_trig())
+        return self._analytics
+
+    def get_distances(self, i):
+        """
+        returns the distances of the fix i to all fixes (FAI sphere). the
+        rows are kept in a cache bounded to distance_cache_size bytes
+        """
+        row = self.distances.get(i)
+        if row is None:
+            lat, lon, cos = self.get_trig()
+            row = geodesy.haversine(lat[i], lon[i], cos[i], lat, lon, cos)
+            self.distances.set(i, row)
+            instrument.count('distance_rows')
+        else:
+            instrument.count('distance_cache_hits')
+        return row
+
+    def calc_FAI_distance(self, i, j):
+        lat, lon, cos = self.get_trig()
+        return geodesy.haversine(lat[i], lon[i], cos[i], lat[j], lon[j], cos[j])
 
-    def calc_distance(self, i, j):
-        return self.calc_FAI_distance(i, j)
-
-        # # WGS84 - http://de.wikipedia.org/wiki/Erdellipsoid
-        # a = 6378137.
-        # n = 298.257223563 # = 1/f = a/(a-b)
-        # b = a*(1-1/n)
-        # e = np.sqrt(a**2 - b**2)/a # numerische Exzentrizität
-        # N = a/np.sqrt(1-e**2*np.sin(np.radians(self.lat))**2) # Krümmungsradius des Ersten Vertikals
-
-        # self.cart = (
-        #     (N+self.gpsheight)*np.cos(np.radians(self.lat))*np.cos(np.radians(self.lon)),
-        #     (N+self.gpsheight)*np.cos(np.radians(self.lat))*np.sin(np.radians(self.lon)),
-        #     (N*(1-e**2)+self.gpsheight)*np.sin(np.radians(self.lat)),
-        # )
+    def calc_distance(self, i, j, model=None):
+        """
+        returns the distance between the fixes i and j (indices or arrays
+        of indices) with the distance model ('fai', 'wgs84' or 'chord', see
+        geodesy.get_model)
+        """
+        model = geodesy.get_model(model)
+        if model is geodesy.FAI:
+            return self.calc_FAI_distance(i, j)
+        trig = self.get_trig()
+        return model.distance(model.terms(geodesy.take(trig, i)), model.terms(geodesy.take(trig, j)))
@@ -0,0 +1,370 @@
+#!/usr/bin/python
+# ex:set fileencoding=utf-8:
+
+from __future__ import unicode_literals
+
+import numpy as np
+
+from .geodesy import haversine
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+# the gap between start and finish must not exceed this part of the perimeter
+CLOSING = 0.2
+
+# every leg of a FAI triangle has at least this part of the perimeter
+FAI_MIN_LEG = 0.28
+
+# number of cells on the coarsest level, number of cells up to which the
+# closing gap is bounded per level, number of cells of the initial triangle
+# and number of triangles evaluated per chunk of triples
+CELLS = 64
+GAP_CELLS = 2048
+SEED_CELLS = 256
+SAMPLES = 128
+
+# number of gaps searched at once and number of triples bounded at once
+CHUNK = 1024
+MAX_TRIPLES = 2**20
+
+# the eight children of a triple of cells
+SPLIT = np.array([(x, y, z) for x in (0, 1) for y in (0, 1) for z in (0, 1)])
+
+# tolerance (m) for rounding errors when comparing bounds
+EPSILON = 1e-6
+
+
+class Levels(object):
+    """
+    cells of consecutive fixes: on level L a cell covers ``sizes[L]`` fixes
+    and is represented by its middle fix and the radius containing all its
+    fixes. the cell a on level L is split into 2a and 2a + 1 on level L + 1
+    """
+
+    def __init__(self, trig, cells=CELLS, gap_cells=GAP_CELLS, seed_cells=SEED_CELLS):
+        self.trig = trig
+        self.n = len(trig[0])
+
+        size = 1
+        while size * cells < self.n:
+            size *= 2
+
+        self.sizes = []
+        self.middle = []
+        self.radius = []
+        self.gap = []
+        self.gaps = {}
+        self.seed_level = 0
+        fixes = np.arange(self.n)
+        while size:
+            starts = np.arange(0, self.n, size)
+            middle = np.minimum(starts + size // 2, self.n - 1)
+            x = np.repeat(middle, size)[:self.n]
+            self.sizes.append(size)
+            self.middle.append(middle)
+            self.radius.append(np.maximum.reduceat(self.distance(x, fixes), starts))
+            if len(starts) <= gap_cells:
+                self.gap.append(self.gap_bounds(len(self.sizes) - 1))
+            if len(starts) <= seed_cells:
+                self.seed_level = len(self.sizes) - 1
+            size //= 2
+
+    def distance(self, x, y):
+        lat, lon, cos = self.trig
+        return haversine(lat[x], lon[x], cos[x], lat[y], lon[y], cos[y])
+
+    def pair_bounds(self, level, a, c):
+        """
+        returns the lower bounds of the distances between the cells up to a
+        and the cells from c on
+        """
+        middle = self.middle[level]
+        radius = self.radius[level]
+        D = self.distance(middle[:a + 1, None], middle[None, c:])
+        return np.maximum(D - radius[:a + 1, None] - radius[None, c:], 0.0)
+
+    def gap_bounds(self, level):
+        """
+        returns the lower bounds of the closing gap min d(s, f) with s in a
+        cell <= a and f in a cell >= c for all cells a, c on the level
+        """
+        G = self.pair_bounds(level, len(self.middle[level]) - 1, 0)
+        np.minimum.accumulate(G, axis=0, out=G)
+        np.minimum.accumulate(G[:, ::-1], axis=1, out=G[:, ::-1])
+        return G
+
+    def gap_bound(self, level, a, c):
+        # cells are nested, below the finest level with bounds its cells apply
+        shift = max(0, level - len(self.gap) + 1)
+        return self.gap[level - shift][a >> shift, c >> shift]
+
+    def closing_gap(self, i, k):
+        """
+        returns the minimum gap d(s, f) with s <= i and f >= k and (s, f).
+        the results are kept, as many triangles share their first and last
+        point
+        """
+        if (i, k) not in self.gaps:
+            self.gaps[i, k] = self._closing_gap(i, k)
+        return self.gaps[i, k]
+
+    def closing_gaps(self, i, k, chunk=CHUNK):
+        """
+        returns the minimum gaps for the arrays of fixes i and k. the gaps
+        are searched like in closing_gap for chunks of pairs (i, k) at once
+        """
+        gaps = self.distance(i, k)
+        first = self.sizes[0]
+        cells = np.arange(len(self.middle[0]))
+        lower = self.pair_bounds(0, len(cells) - 1, 0)
+        for start in range(0, len(gaps), chunk):
+            best = gaps[start:start + chunk]
+            q, x, y = np.nonzero(
+                (cells[None, :, None] <= (i[start:start + chunk] // first)[:, None, None])
+                & (cells[None, None, :] >= (k[start:start + chunk] // first)[:, None, None])
+                & (lower[None, :, :] < best[:, None, None])
+            )
+            for level, size in enumerate(self.sizes):
+                if level:
+                    q = np.repeat(q, 4)
+                    x = (2 * x[:, None] + (0, 0, 1, 1)).ravel()
+                    y = (2 * y[:, None] + (0, 1, 0, 1)).ravel()
+                    keep = (
+                        (x * size <= i[start + q]) & ((y + 1) * size > k[start + q])
+                        & (y < len(self.middle[level]))
+                    )
+                    q, x, y = q[keep], x[keep], y[keep]
+
+                middle = self.middle[level]
+                s = np.minimum(middle[x], i[start + q])
+                f = np.maximum(middle[y], k[start + q])
+                np.minimum.at(best, q, self.distance(s, f))
+
+                bound = self.distance(middle[x], middle[y]) - self.radius[level][x] - self.radius[level][y]
+                keep = bound < best[q]
+                q, x, y = q[keep], x[keep], y[keep]
+        return gaps
+
+    def _closing_gap(self, i, k):
+        # pairs of cells are split level by level, those which can not be
+        # closer than the closest pair of representatives are dropped
+        best = np.inf
+        result = (i, k)
+        x = np.arange(i // self.sizes[0] + 1)
+        y = np.arange(k // self.sizes[0], len(self.middle[0]))
+        x, y = [v.ravel() for v in np.meshgrid(x, y, indexing='ij')]
+        for level, size in enumerate(self.sizes):
+            if level:
+                x = (2 * x[:, None] + (0, 0, 1, 1)).ravel()
+                y = (2 * y[:, None] + (0, 1, 0, 1)).ravel()
+                keep = (x * size <= i) & ((y + 1) * size > k) & (y < len(self.middle[level]))
+                x, y = x[keep], y[keep]
+
+            # representatives clipped to the range are an upper bound of the
+            # gap, the radii bound it around the middle fixes of the cells
+            middle = self.middle[level]
+            s = np.minimum(middle[x], i)
+            f = np.maximum(middle[y], k)
+            d = self.distance(s, f)
+            n = d.argmin()
+            if d[n] < best:
+                best = d[n]
+                result = (int(s[n]), int(f[n]))
+
+            lower = self.distance(middle[x], middle[y]) - self.radius[level][x] - self.radius[level][y]
+            keep = lower < best
+            x, y = x[keep], y[keep]
+        return best, result
+
+
+def legs(levels, level, a, b, c):
+    """
+    returns the distances between the representatives and the radii of the
+    cells (a, b, c) on the level
+    """
+    middle = levels.middle[level]
+    radius = levels.radius[level]
+    d = (
+        levels.distance(middle[a], middle[b]),
+        levels.distance(middle[b], middle[c]),
+        levels.distance(middle[c], middle[a]),
+    )
+    r = (radius[a] + radius[b], radius[b] + radius[c], radius[c] + radius[a])
+    return d, r
+
+
+def upper_bounds(levels, level, a, b, c, closing, min_leg, best=0.0):
+    """
+    returns an upper bound of the score of all triangles with the turning
+    points in the cells (a, b, c) on the level, -inf if none is valid
+    """
+    d, r = legs(levels, level, a, b, c)
+    upper = [x + y for x, y in zip(d, r)]
+    lower = [np.maximum(x - y, 0.0) for x, y in zip(d, r)]
+    perimeter = sum(upper)
+    gap = levels.gap_bound(level, a, c)
+
+    if level >= len(levels.gap):
+        # below the levels with bounds of the gap, the exact gap from the
+        # end of a to the start of c is taken for the promising triples
+        size = levels.sizes[level]
+        refine = np.flatnonzero(perimeter - gap > best + EPSILON)
+        pairs, inverse = np.unique(a[refine] * len(levels.middle[level]) + c[refine], return_inverse=True)
+        x, y = divmod(pairs, len(levels.middle[level]))
+        exact = levels.closing_gaps(np.minimum((x + 1) * size, levels.n) - 1, y * size)
+        gap = gap.copy()
+        gap[refine] = exact[inverse.ravel()]
+
+    valid = gap <= closing * perimeter + EPSILON
+    if min_leg:
+        shortest = np.minimum(np.minimum(upper[0], upper[1]), upper[2])
+        valid &= shortest >= min_leg * sum(lower) - EPSILON
+    return np.where(valid, perimeter - gap, -np.inf)
+
+
+def estimates(levels, level, a, b, c, closing, min_leg):
+    """
+    returns the perimeters of the triangles between the representatives of
+    the cells minus the bound of their gap, -inf if they are not valid
+    """
+    d = legs(levels, level, a, b, c)[0]
+    perimeter = sum(d)
+    gap = levels.gap_bound(level, a, c)
+    valid = gap <= closing * perimeter
+    if min_leg:
+        valid &= np.minimum(np.minimum(d[0], d[1]), d[2]) >= min_leg * perimeter
+    return np.where(valid, perimeter - gap, -np.inf)
+
+
+def evaluate(levels, i, j, k, closing, min_leg):
+    """
+    returns the score of the triangle (i, j, k) and the start and finish
+    """
+    d = (levels.distance(i, j), levels.distance(j, k), levels.distance(k, i))
+    perimeter = sum(d)
+    if min_leg and min(d) < min_leg * perimeter:
+        return -np.inf, None
+    gap, (s, f) = levels.closing_gap(i, k)
+    if gap > closing * perimeter:
+        return -np.inf, None
+    return perimeter - gap, (s, i, j, k, f)
+
+
+def seed(levels, level, closing, min_leg):
+    """
+    returns the best triangle between the representatives of the cells on
+    the level. its closing gap is taken between representatives as well,
+    which is never smaller than the exact gap: the score is a lower bound
+    """
+    middle = levels.middle[level]
+    m = len(middle)
+    D = levels.distance(middle[:, None], middle[None, :])
+    G = np.minimum.accumulate(D, axis=0)
+    G = np.minimum.accumulate(G[:, ::-1], axis=1)[:, ::-1]
+    upper = np.triu(np.ones((m, m), dtype=np.bool_))
+
+    best = -np.inf
+    result = None
+    for i in range(m):
+        # legs i-j, j-k and k-i for all j <= k from i on
+        a = D[i, i:, None]
+        b = D[i:, i:]
+        c = D[None, i, i:]
+        perimeter = a + b + c
+        valid = upper[i:, i:] & (G[i, None, i:] <= closing * perimeter)
+        if min_leg:
+            valid &= np.minimum(np.minimum(a, b), c) >= min_leg * perimeter
+        score = np.where(valid, perimeter - G[i, None, i:], -np.inf)
+        n = score.argmax()
+        if score.flat[n] > best:
+            best = score.flat[n]
+            result = (middle[i], middle[i + n // score.shape[1]], middle[i + n % score.shape[1]])
+    return result
+
+
+def triangle(trig, closing=CLOSING, min_leg=None, samples=SAMPLES, max_triples=MAX_TRIPLES):
+    """
+    returns the score (perimeter minus closing gap) of the best closed
+    triangle over the fixes (as terms from geodesy.trig) and the indices of
+    the start, the three turning points and the finish. the gap between
+    start and finish must not exceed ``closing`` of the perimeter and every
+    leg must be at least ``min_leg`` of the perimeter (FAI triangles).
+
+    branch and bound over triples of cells: the triples of a level are
+    bounded with the radii of their cells and the bounds of the closing gap,
+    the best triangle between the representatives of a fine level and those
+    of the most promising triples give a lower bound. triples, which can not
+    exceed it, are dropped, the others are split into the triples of the
+    next level. on the last level the cells are single fixes, which are
+    evaluated in the order of their bounds. at most ``max_triples`` are
+    bounded at once, which bounds the memory
+    """
+    if len(trig[0]) < 3:
+        return 0.0, ()
+    levels = Levels(trig)
+
+    m = len(levels.middle[0])
+    a, b, c = np.nonzero(
+        (np.arange(m)[:, None, None] <= np.arange(m)[None, :, None])
+        & (np.arange(m)[None, :, None] <= np.arange(m)[None, None, :])
+    )
+
+    best = 0.0
+    result = ()
+    start = seed(levels, levels.seed_level, closing, min_leg)
+    if start is not None:
+        score, indices = evaluate(levels, start[0], start[1], start[2], closing, min_leg)
+        if score > best:
+            best, result = score, indices
+
+    # chunks of triples are processed depth first, the most promising first
+    last = len(levels.sizes) - 1
+    stack = [(0, a, b, c)]
+    while stack:
+        level, a, b, c = stack.pop()
+        upper = upper_bounds(levels, level, a, b, c, closing, min_leg, best)
+        middle = levels.middle[level]
+
+        if level < last:
+            # the representatives of the most promising triples
+            order = np.argsort(-estimates(levels, level, a, b, c, closing, min_leg))[:samples]
+        else:
+            order = np.argsort(-upper)
+        for n in order:
+            if upper[n] <= best + EPSILON:
+                if level == last:
+                    break
+                continue
+            score, indices = evaluate(levels, middle[a[n]], middle[b[n]], middle[c[n]], closing, min_leg)
+            if score > best:
+                best, result = score, indices
+
+        keep = np.flatnonzero(upper > best + EPSILON)
+        logger.debug(
+            "level %d: %d triples of cells with %d fixes, %.1f m, kept %d",
+            level, len(a), levels.sizes[level], best, len(keep),
+        )
+        if level == last or not len(keep):
+            continue
+
+        # split every cell of the remaining triples
+        keep = keep[np.argsort(upper[keep])]
+        count = len(levels.middle[level + 1])
+        for chunk in np.array_split(keep, -(-len(keep) * 8 // max_triples)):
+            x = (2 * a[chunk, None] + SPLIT[:, 0]).ravel()
+            y = (2 * b[chunk, None] + SPLIT[:, 1]).ravel()
+            z = (2 * c[chunk, None] + SPLIT[:, 2]).ravel()
+            valid = (x <= y) & (y <= z) & (z < count)
+            stack.append((level + 1, x[valid], y[valid], z[valid]))
+
+    return float(best), tuple(int(i) for i in result)
+
+
+def fai_triangle(trig, closing=CLOSING, min_leg=FAI_MIN_LEG):
+    return triangle(trig, closing, min_leg)
+
+
+def flat_triangle(trig, closing=CLOSING):
+    return triangle(trig, closing)
@@ -5,6 +5,19 @@ from __future__ import unicode_literals
 
 from rest_framework import serializers
 
+from .models import Track
+
 
 class TrackSerializer(serializers.Serializer):
     track = serializers.FileField(use_url=False)
+
+
+class TrackSummarySerializer(serializers.ModelSerializer):
+
+    class Meta:
+        model = Track
+        fields = (
+            'id', 'name', 'uploaded', 'date', 'site', 'pilot', 'glider',
+            'duration', 'max_altitude', 'max_climb', 'distance',
+            'north', 'south', 'east', 'west', 'status',
+        )
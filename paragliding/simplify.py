@@ -0,0 +1,85 @@
+#!/usr/bin/python
+# ex:set fileencoding=utf-8:
+
+from __future__ import unicode_literals
+
+import numpy as np
+
+from .geodesy import R
+
+
+def project(lat, lon, height):
+    """
+    projects the coordinates onto a local plane (equirectangular, in meter)
+    """
+    lat = np.radians(lat)
+    lon = np.radians(lon)
+    x = R * np.cos(np.mean(lat)) * (lon - lon[0])
+    y = R * (lat - lat[0])
+    return x, y, np.asarray(height, dtype=np.float64)
+
+
+def segment_distances(points, starts, ends):
+    """
+    returns the distance of every point to the segment (starts, ends)
+    """
+    a = points[starts]
+    ab = points[ends] - a
+    ap = points - a
+    length = np.einsum('ij,ij->i', ab, ab)
+    length[length == 0] = 1.0
+    t = np.clip(np.einsum('ij,ij->i', ap, ab) / length, 0.0, 1.0)
+    d = ap - t[:, None] * ab
+    return np.sqrt(np.einsum('ij,ij->i', d, d))
+
+
+def douglas_peucker(x, y, z, tolerance, keep=None):
+    """
+    returns a mask of the points retained by the douglas-peucker algorithm.
+
+    all segments are split at once: in each iteration the distance of every
+    point to its current segment is computed and each segment, which has a
+    point further away than the tolerance, is split at that point. points
+    in ``keep`` (mask or indices) are always retained
+    """
+    points = np.column_stack((x, y, z))
+    n = len(points)
+
+    mask = np.zeros(n, dtype=np.bool_)
+    if keep is not None:
+        mask[keep] = True
+    if n:
+        mask[[0, -1]] = True
+
+    while True:
+        kept = np.flatnonzero(mask)
+        if len(kept) < 2:
+            break
+        segment = np.searchsorted(kept, np.arange(n), 'right') - 1
+        segment[-1] = len(kept) - 2
+
+        distances = segment_distances(points, kept[segment], kept[segment + 1])
+        distances[mask] = 0.0
+
+        # farthest point of every segment
+        farthest = np.maximum.reduceat(distances, kept[:-1])
+        split = farthest > tolerance
+        if not split.any():
+            break
+
+        mask |= split[segment] & (distances == farthest[segment])
+
+    return mask
+
+
+def transitions(deltas, resolution=None):
+    """
+    returns the fixes, where the climb rate changes its bin (or its sign
+    without a resolution). deltas[i] belongs to the segment from fix i
+    to i + 1
+    """
+    if resolution:
+        bins = np.round(np.asarray(deltas) / resolution)
+    else:
+        bins = np.sign(deltas)
+    return np.flatnonzero(np.diff(bins)) + 1
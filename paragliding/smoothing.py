@@ -0,0 +1,199 @@
+#!/usr/bin/python
+# ex:set fileencoding=utf-8:
+
+from __future__ import unicode_literals
+
+import numpy as np
+import threading
+
+from math import factorial
+
+
+# kernels and edge matrices are computed once per (function, size)
+KERNELS = {}
+KERNELS_LOCK = threading.Lock()
+
+
+def moving(N):
+    return np.repeat(1.0, N) / N
+
+
+def binom(N):
+    """
+    binomial weights, calculated in log space, so large kernels do not
+    overflow
+    """
+    k = np.arange(N - 1, dtype=np.float64)
+    logs = np.concatenate(([0.0], np.cumsum(np.log((N - 1 - k) / (k + 1)))))
+    weight = np.exp(logs - logs.max())
+    return weight / weight.sum()
+
+
+def cached(key, function, *args):
+    """
+    returns the cached result of function(*args), the arrays are read-only
+    """
+    try:
+        return KERNELS[key]
+    except KeyError:
+        pass
+    result = function(*args)
+    for array in (result if isinstance(result, tuple) else (result,)):
+        array.setflags(write=False)
+    with KERNELS_LOCK:
+        return KERNELS.setdefault(key, result)
+
+
+def make_kernel(f, N):
+    weight = np.asarray(f(N), dtype=np.float64)
+    if len(weight) != N:
+        raise ValueError("the weight function returned %d weights instead of %d" % (len(weight), N))
+    return weight
+
+
+def kernel(f, N):
+    """
+    returns the weights f(N)
+    """
+    return cached(('kernel', f, N), make_kernel, f, N)
+
+
+def make_edges(f, N):
+    # row i holds the weights f(2i+1) of the i-th sample from the start
+    # (left) and from the end (right) of the data
+    half = N // 2
+    width = max(2 * half - 1, 0)
+    left = np.zeros((half, width))
+    right = np.zeros((half, width))
+    for i in range(half):
+        j = 2 * i + 1
+        weight = kernel(f, j)
+        left[i, :j] = weight
+        right[i, width - j:] = weight
+    return left, right
+
+
+def edges(f, N):
+    return cached(('edges', f, N), make_edges, f, N)
+
+
+def moving_sums(data, N):
+    """
+    sums of the windows used by np.convolve(data, moving(N), "same") in the
+    interior, calculated from the cumulative sum in linear time
+    """
+    # the offset keeps the cumulative sum small
+    offset = data[0]
+    sums = np.concatenate(([0.0], np.cumsum(data - offset)))
+    count = len(data) - 2 * (N // 2)
+    return (sums[N:N + count] - sums[:count]) / N + offset
+
+
+def averages(data, N, f):
+    """
+    calculate averages with a weight function. the interior is convolved
+    with f(N), the first and last N/2 samples are averaged with the
+    centered windows f(1), f(3), ... which fit into the data
+    """
+
+    if N < 2:
+        return data
+
+    data = np.asarray(data, dtype=np.float64)
+    if len(data) < N:
+        N = len(data)
+        if N < 2:
+            return data.copy()
+
+    half = N // 2
+    if f is moving:
+        result = np.empty(len(data))
+        result[half:len(data) - half] = moving_sums(data, N)
+    else:
+        result = np.convolve(data, kernel(f, N), "same")
+
+    if half:
+        left, right = edges(f, N)
+        width = left.shape[1]
+        result[:half] = left.dot(data[:width])
+        result[len(data) - half:] = right.dot(data[len(data) - width:])[::-1]
+
+    return result
+
+
+def exponential(data, alpha, blocksize=4096):
+    """
+    exponential smoothing y[i] = alpha * x[i] + (1 - alpha) * y[i-1],
+    starting with y[0] = x[0]. the recursion is solved block-wise with
+    cumulative sums, the blocks are short enough, that the scaled terms
+    keep their precision
+    """
+    data = np.asarray(data, dtype=np.float64)
+    if not 0 < alpha <= 1:
+        raise ValueError("alpha has to be in (0, 1]")
+    if alpha == 1 or not len(data):
+        return data.copy()
+
+    decay = 1.0 - alpha
+    # the terms of a block grow up to 1e8
+    size = int(min(blocksize, max(1, 18.0 / -np.log(decay))))
+    powers = decay ** np.arange(1, size + 1)
+
+    result = np.empty(len(data))
+    result[0] = last = data[0]
+    for start in range(1, len(data), size):
+        block = data[start:start + size]
+        scale = powers[:len(block)]
+        values = scale * (last + alpha * np.cumsum(block / scale))
+        result[start:start + size] = values
+        last = values[-1]
+    return result
+
+
+def make_savgol(window, order, deriv):
+    # least squares fit of a polynomial to the window, centered at 0
+    half = window // 2
+    x = np.arange(-half, half + 1, dtype=np.float64)
+    fit = np.linalg.pinv(np.vander(x, order + 1, increasing=True))
+
+    # derivatives of the fitted polynomial at the positions x
+    powers = np.arange(order + 1)
+    factor = np.array([
+        factorial(p) / factorial(p - deriv) if p >= deriv else 0.0 for p in powers
+    ])
+    exponent = np.maximum(powers - deriv, 0)
+    evaluate = factor * x[:, None] ** exponent
+    matrix = evaluate.dot(fit)
+    return matrix[half].copy(), matrix[:half].copy(), matrix[half + 1:].copy()
+
+
+def savgol(data, window, order, deriv=0, delta=1.0):
+    """
+    Savitzky-Golay filter: the value (or the derivative) of the polynomial
+    of the order, fitted to the window (odd) around every sample. the first
+    and last window/2 samples are evaluated from the fit of the first and
+    last window. delta is the spacing of the samples, e.g. savgol(height,
+    15, 2, deriv=1, delta=1.0) is the climb rate at 1 Hz
+    """
+    data = np.asarray(data, dtype=np.float64)
+    if window % 2 == 0 or window < 1:
+        raise ValueError("the window has to be odd")
+    if not len(data):
+        return data.copy()
+    if len(data) < window:
+        window = len(data) - 1 + len(data) % 2
+    order = min(order, window - 1)
+    if deriv > order:
+        return np.zeros(len(data))
+
+    center, left, right = cached(('savgol', window, order, deriv), make_savgol, window, order, deriv)
+    half = window // 2
+
+    result = np.empty(len(data))
+    result[half:len(data) - half] = np.convolve(data, center[::-1], "valid")
+    if half:
+        result[:half] = left.dot(data[:window])
+        result[len(data) - half:] = right.dot(data[len(data) - window:])
+    if deriv:
+        result /= delta ** deriv
+    return result
@@ -0,0 +1,230 @@
+#!/usr/bin/python
+# ex:set fileencoding=utf-8:
+
+from __future__ import unicode_literals
+
+import numpy as np
+
+from collections import Counter
+from math import cos
+from math import floor
+from math import radians
+
+from .geodesy import R
+
+
+# size (degree) of the cells of the grid index
+GRID_CELL = 0.1
+
+# take-offs closer than this (m) belong to the same site
+SITE_RADIUS = 1500.0
+
+# length (m) of one degree of latitude
+DEGREE = radians(1) * R
+
+
+def circle_bounds(lat, lon, radius):
+    """
+    returns the bounding box (north, south, east, west) of a circle with
+    the radius (m)
+    """
+    dlat = radius / DEGREE
+    dlon = radius / (DEGREE * max(cos(radians(lat)), 1e-6))
+    return lat + dlat, lat - dlat, lon + dlon, lon - dlon
+
+
+def box_distance(lat, lon, north, south, east, west):
+    """
+    returns a lower bound of the distance (m) between the point and the
+    bounding box
+    """
+    dlat = max(south - lat, 0.0, lat - north)
+    dlon = max(west - lon, 0.0, lon - east)
+    # the smallest scale of the longitude within the box
+    scale = min(cos(radians(north)), cos(radians(south)), cos(radians(lat)))
+    return DEGREE * np.hypot(dlat, dlon * max(scale, 0.0))
+
+
+class GridIndex(object):
+    """
+    a grid over latitude and longitude, where every cell lists the keys
+    of the flights passing through it. a flight is inserted with its
+    bounding box or, with its fixes, only into the cells its segments
+    cross. the longitude does not wrap at 180 degree
+    """
+
+    def __init__(self, cell=GRID_CELL):
+        self.cell = cell
+        self.cells = {}
+        self.bounds = {}
+
+    def __len__(self):
+        return len(self.bounds)
+
+    def __contains__(self, key):
+        return key in self.bounds
+
+    def cell_range(self, north, south, east, west):
+        return (
+            int(floor(south / self.cell)), int(floor(north / self.cell)),
+            int(floor(west / self.cell)), int(floor(east / self.cell)),
+        )
+
+    def insert(self, key, bounds, lat=None, lon=None):
+        """
+        adds the flight with its bounding box (north, south, east, west)
+        and optionally the latitude and longitude of its fixes (degree)
+        """
+        self.bounds[key] = tuple(bounds)
+        if lat is None or not len(lat):
+            bottom, top, left, right = self.cell_range(*bounds)
+            cells = [(row, col) for row in range(bottom, top + 1) for col in range(left, right + 1)]
+        else:
+            cells = self.track_cells(np.asarray(lat), np.asarray(lon))
+        for cell in cells:
+            self.cells.setdefault(cell, []).append(key)
+
+    def track_cells(self, lat, lon):
+        """
+        returns the cells crossed by the segments between the fixes
+        """
+        rows = np.floor(lat / self.cell).astype(np.int64)
+        cols = np.floor(lon / self.cell).astype(np.int64)
+        cells = set(zip(rows.tolist(), cols.tolist()))
+
+        # segments jumping over cells add the cells of their bounding box
+        jumps = np.flatnonzero((np.abs(np.diff(rows)) > 1) | (np.abs(np.diff(cols)) > 1))
+        for i in jumps.tolist():
+            for row in range(min(rows[i], rows[i + 1]), max(rows[i], rows[i + 1]) + 1):
+                for col in range(min(cols[i], cols[i + 1]), max(cols[i], cols[i + 1]) + 1):
+                    cells.add((row, col))
+        return cells
+
+    def candidates(self, north, south, east, west):
+        bottom, top, left, right = self.cell_range(north, south, east, west)
+        if (top - bottom + 1) * (right - left + 1) > len(self.cells):
+            # a large area: the cells are scanned instead
+            keys = set()
+            for (row, col), values in self.cells.items():
+                if bottom <= row <= top and left <= col <= right:
+                    keys.update(values)
+            return keys
+        keys = set()
+        for row in range(bottom, top + 1):
+            for col in range(left, right + 1):
+                keys.update(self.cells.get((row, col), ()))
+        return keys
+
+    def query(self, north, south, east, west):
+        """
+        returns the keys of the flights, which cross a cell of the box and
+        whose bounding box intersects it
+        """
+        result = []
+        for key in self.candidates(north, south, east, west):
+            n, s, e, w = self.bounds[key]
+            if n >= south and s <= north and e >= west and w <= east:
+                result.append(key)
+        return sorted(result)
+
+    def query_radius(self, lat, lon, radius):
+        """
+        returns the keys of the flights, which cross a cell of the circle
+        around the point and whose bounding box is closer than radius (m)
+        """
+        return [
+            key for key in self.query(*circle_bounds(lat, lon, radius))
+            if box_distance(lat, lon, *self.bounds[key]) <= radius
+        ]
+
+
+class Sites(object):
+    """
+    clusters take-off points into sites: points closer than the radius
+    (m), directly or through other points, belong to the same site. points
+    are added incrementally (union-find over a grid with cells of the
+    radius)
+    """
+
+    def __init__(self, radius=SITE_RADIUS):
+        self.radius = radius
+        self.cell = radius / DEGREE
+        self.points = {}
+        self.names = {}
+        self.parent = {}
+        self.grid = {}
+
+    def __len__(self):
+        return len(self.points)
+
+    def find(self, key):
+        root = key
+        while self.parent[root] != root:
+            root = self.parent[root]
+        # path compression
+        while self.parent[key] != root:
+            self.parent[key], key = root, self.parent[key]
+        return root
+
+    def add(self, key, lat, lon, name=None):
+        """
+        adds the take-off point of a flight with its site name (or None)
+        """
+        self.points[key] = (lat, lon)
+        self.names[key] = name
+        self.parent[key] = key
+
+        # the points of a row are searched with the column of the row
+        row = int(floor(lat / self.cell))
+        for r in range(row - 1, row + 2):
+            col = self.column(r, lon)
+            for c in range(col - 1, col + 2):
+                for other in self.grid.get((r, c), ()):
+                    if self.distance(key, other) <= self.radius:
+                        self.parent[self.find(other)] = self.find(key)
+        self.grid.setdefault((row, self.column(row, lon)), []).append(key)
+
+    def column(self, row, lon):
+        """
+        returns the column of the longitude in the row. the longitude is
+        scaled with the smallest scale of the row and its neighbours, so
+        the columns of points closer than the radius differ by at most one,
+        even far from the prime meridian
+        """
+        lat = min(max(abs((row - 1) * self.cell), abs((row + 2) * self.cell)), 90.0)
+        scale = max(cos(radians(lat)), 1e-6)
+        return int(floor(lon * scale / self.cell))
+
+    def distance(self, a, b):
+        (lat1, lon1), (lat2, lon2) = self.points[a], self.points[b]
+        dlat = radians(lat2 - lat1)
+        dlon = radians(lon2 - lon1) * cos(radians((lat1 + lat2) / 2))
+        return R * np.hypot(dlat, dlon)
+
+    def clusters(self):
+        """
+        returns the keys of the points per site
+        """
+        result = {}
+        for key in self.points:
+            result.setdefault(self.find(key), []).append(key)
+        return list(result.values())
+
+    def site_names(self):
+        """
+        returns the name of the site of every key: the most common name
+        given in the cluster or its mean position
+        """
+        result = {}
+        for keys in self.clusters():
+            names = Counter(self.names[key] for key in keys if self.names[key])
+            if names:
+                # ties are decided alphabetically
+                name = sorted(names.items(), key=lambda item: (-item[1], item[0]))[0][0]
+            else:
+                lat = sum(self.points[key][0] for key in keys) / len(keys)
+                lon = sum(self.points[key][1] for key in keys) / len(keys)
+                name = "%.3f, %.3f" % (lat, lon)
+            for key in keys:
+                result[key] = name
+        return result
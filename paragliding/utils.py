@@ -4,41 +4,49 @@
 from __future__ import unicode_literals
 
 import numpy as np
-from math import factorial
 
+# the smoothing functions were moved to the smoothing module
+from .smoothing import averages  # noqa
+from .smoothing import binom  # noqa
+from .smoothing import moving  # noqa
 
-def averages(data, N, f):
-    """
-    calculate averages with a weight function
-    """
-
-    if N < 2:
-        return data
-
-    if len(data) < N:
-        N = len(data)
-
-    weight = f(N)
-
-    if len(weight) != N:
-        print("ERROR")
-        exit()
 
-    averages = np.convolve(data, weight, "same")
-    for i in range(0, N / 2):
-        j = 2 * i + 1
-        weight = f(j)
-        averages[i] = np.sum(data[:j] * weight)
-        averages[-i-1] = np.sum(data[-j:] * weight)
+HEX = ['%02x' % i for i in range(256)]
 
-    return averages
 
-
-def moving(N):
-    return np.repeat(1.0, N)/N
-
-
-def binom(N):
-    return np.array([
-        factorial(N-1) / factorial(i) / factorial(N-1-i) / 2.**(N-1) for i in range(N)
+def colors(values, palette, alpha=255):
+    """
+    maps all values to aabbggrr-strings, interpolating linearly between the
+    stops of the palette, a sorted list of (value, red, green, blue)
+    """
+    values = np.asarray(values, dtype=np.float64)
+    palette = np.asarray(palette, dtype=np.float64)
+    stops = palette[:, 0]
+
+    # enclosing stops: j is the last stop <= value, k the first stop >= value
+    j = np.searchsorted(stops, values, 'right') - 1
+    k = np.searchsorted(stops, values, 'left')
+    above = k == len(stops)
+    below = j < 0
+    k[above] = j[above]
+    j[below] = k[below]
+
+    lower = palette[j, 1:]
+    upper = palette[k, 1:]
+    span = stops[k] - stops[j]
+    outside = span == 0
+    span[outside] = 1.0
+    mix = (values - stops[j]) / span
+    mix[outside] = 0.0
+    mix = mix[:, None]
+    rgb = (mix * upper + lower - mix * lower).astype(np.uint32)
+
+    packed = (np.uint32(alpha) << 24) | (rgb[:, 2] << 16) | (rgb[:, 1] << 8) | rgb[:, 0]
+
+    # only the distinct colors are formatted
+    unique, inverse = np.unique(packed, return_inverse=True)
+    strings = np.array([
+        HEX[c >> 24] + HEX[c >> 16 & 255] + HEX[c >> 8 & 255] + HEX[c & 255]
+        for c in unique.tolist()
     ])
+    return strings[inverse.reshape(-1)]
@@ -4,62 +4,384 @@
 from __future__ import unicode_literals
 
 # from django.utils.translation import ugettext_lazy as _
-from django.http import HttpResponse
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connections
+from django.db import transaction
+from django.http import FileResponse
+from django.http import StreamingHttpResponse
 from django.template.response import SimpleTemplateResponse
 from django.views.decorators.csrf import csrf_exempt
 
+from rest_framework import status
 from rest_framework import viewsets
+from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
+from rest_framework.pagination import PageNumberPagination
 from rest_framework.parsers import MultiPartParser
 from rest_framework.response import Response
 
-import xml.etree.ElementTree as ET
+import functools
+import hashlib
+import json
+import os
+import threading
 
-from zipfile import ZipFile
-from zipfile import ZIP_DEFLATED
-
-
-try:
-    from StringIO import StringIO
-except ImportError:
-    from io import StringIO
+from datetime import datetime
 
+from . import instrument
+from .batch import CONVERTER_VERSION
+from .jobs import DONE
+from .jobs import JobQueue
+from .kml import stream_kmz
+from .models import Track
 from .serializers import TrackSerializer
+from .serializers import TrackSummarySerializer
 from .parsers import Flight
+from .parsers import VARIO_RESOLUTION
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+# total size (bytes) of the kmz files in the cache and seconds they are kept
+KMZ_CACHE_MAX_BYTES = 256 * 2**20
+KMZ_CACHE_TIMEOUT = 7 * 24 * 3600
+
+# serializes the updates of the index of the kmz cache in this process
+kmz_cache_lock = threading.Lock()
+
+
+class KmzCache(object):
+    """
+    kmz files in a django cache with a budget in bytes. the keys and sizes
+    of the stored files are kept in the cache as well, the oldest files are
+    deleted, until a new one fits into the budget. files larger than the
+    budget are not stored. concurrent processes may lose entries of the
+    index, which then only expire with the timeout
+    """
+    INDEX_KEY = "paragliding:kmz:index"
+
+    def __init__(self, cache, max_bytes=KMZ_CACHE_MAX_BYTES, timeout=KMZ_CACHE_TIMEOUT):
+        self.cache = cache
+        self.max_bytes = max_bytes
+        self.timeout = timeout
+
+    def get(self, key):
+        return self.cache.get(key)
+
+    def set(self, key, data):
+        if len(data) > self.max_bytes:
+            return
+        with kmz_cache_lock:
+            # (key, bytes) in the order the files were stored
+            index = [entry for entry in self.cache.get(self.INDEX_KEY, []) if entry[0] != key]
+            nbytes = sum(size for name, size in index)
+            while index and nbytes + len(data) > self.max_bytes:
+                name, size = index.pop(0)
+                self.cache.delete(name)
+                nbytes -= size
+            index.append((key, len(data)))
+            self.cache.set(key, data, self.timeout)
+            self.cache.set(self.INDEX_KEY, index, None)
+
+
+def kmz_cache():
+    """
+    returns the cache for kmz files or None if it is disabled. it is only
+    enabled with PARAGLIDING_KMZ_CACHE, an alias of django's CACHES, which
+    should not be shared with other data (e.g. a FileBasedCache keeps the
+    files on disk). PARAGLIDING_KMZ_CACHE_MAX_BYTES bounds its size
+    """
+    alias = getattr(settings, 'PARAGLIDING_KMZ_CACHE', None)
+    if alias is None:
+        return None
+    return KmzCache(
+        caches[alias],
+        getattr(settings, 'PARAGLIDING_KMZ_CACHE_MAX_BYTES', KMZ_CACHE_MAX_BYTES),
+        getattr(settings, 'PARAGLIDING_KMZ_CACHE_TIMEOUT', KMZ_CACHE_TIMEOUT),
+    )
+
+
+def kmz_cache_key(file_obj, name, resolution, tolerance):
+    """
+    returns the cache key of the upload rendered with the options
+    """
+    digest = hashlib.sha1()
+    for chunk in file_obj.chunks():
+        digest.update(chunk)
+    file_obj.seek(0)
+    # the name of the flight is rendered into the kml
+    digest.update(json.dumps([name, resolution, tolerance, CONVERTER_VERSION]).encode('utf-8'))
+    return "paragliding:kmz:%s" % digest.hexdigest()
+
+
+def store_chunks(chunks, cache, key):
+    """
+    yields the chunks and stores them in the kmz cache at the end, unless
+    they exceed its budget
+    """
+    data = []
+    size = 0
+    for chunk in chunks:
+        if data is not None:
+            data.append(chunk)
+            size += len(chunk)
+            if size > cache.max_bytes:
+                data = None
+        yield chunk
+    if data is not None:
+        cache.set(key, b''.join(data))
+
+
+def kmz_response(chunks, name):
+    response = StreamingHttpResponse(chunks, content_type="application/vnd.google-earth.kmz")
+    response['Content-Disposition'] = "attachment; filename=%s" % name + '.kmz'
+    return response
+
+
+def instrumented(view):
+    """
+    with PARAGLIDING_INSTRUMENT the stages and counters of the view (see
+    instrument) are recorded, returned in a Server-Timing header and
+    logged. the stages of a streamed response, which run after the header
+    was sent, are only logged
+    """
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        if not getattr(settings, 'PARAGLIDING_INSTRUMENT', False):
+            return view(*args, **kwargs)
+
+        recorder = instrument.Recorder()
+        with recorder:
+            response = view(*args, **kwargs)
+        if recorder.timers:
+            response['Server-Timing'] = recorder.server_timing()
+
+        def log(recorder):
+            logger.info("%s: %s", view.__name__, recorder.summary())
+
+        if getattr(response, 'streaming', False):
+            response.streaming_content = instrument.recording(recorder, response.streaming_content, log)
+        else:
+            log(recorder)
+        return response
+    return wrapper
 
 
 @csrf_exempt
+@instrumented
 def parse_igc_file(request, template_name="paragliding/base.html"):
 
     if request.method == 'POST' and request.FILES:
         file_obj = request.FILES.get('track', None)
 
+        resolution = getattr(settings, 'PARAGLIDING_VARIO_RESOLUTION', VARIO_RESOLUTION)
+        tolerance = getattr(settings, 'PARAGLIDING_SIMPLIFY_TOLERANCE', None)
+
+        # repeated uploads are answered with the stored kmz file
+        name = file_obj.name[:-4] if file_obj.name[-4:] == ".igc" else file_obj.name
+        cache = kmz_cache()
+        if cache is not None:
+            with instrument.stage('kmz_cache'):
+                key = kmz_cache_key(file_obj, name, resolution, tolerance)
+                data = cache.get(key)
+            if data is not None:
+                instrument.count('kmz_cache_hits')
+                return kmz_response([data], name)
+            instrument.count('kmz_cache_misses')
+
         flight = Flight(file_obj, file_obj.name)
 
-        data = ET.tostring(flight.make_tree(
-            ET.Element('kml', xmlns="http://earth.google.com/kml/2.2")
+        # the kml is rendered and compressed while the response is sent
+        chunks = stream_kmz(flight.name + '.kml', flight.iter_document(
+            resolution=resolution,
+            tolerance=tolerance,
         ))
+        if cache is not None:
+            chunks = store_chunks(chunks, cache, key)
+        return kmz_response(chunks, flight.name)
 
-        inmemory_file = StringIO()
-        with ZipFile(inmemory_file, 'w', ZIP_DEFLATED) as zipfile:
-            zipfile.writestr(flight.name + '.kml', data)
-        data = inmemory_file.getvalue()
-        inmemory_file.close()
+    return SimpleTemplateResponse(template_name)
 
-        response = HttpResponse(content_type="application/vnd.google-earth.kmz")
-        response['Content-Disposition'] = "attachment; filename=%s" % flight.name + '.kmz'
-        response.write(data)
 
-        return response
+queue = None
+queue_lock = threading.Lock()
+
+
+def get_queue():
+    """
+    returns the job queue of this process, which is created on first use
+    """
+    global queue
+    with queue_lock:
+        if queue is None:
+            queue = JobQueue(
+                workers=getattr(settings, 'PARAGLIDING_JOB_WORKERS', None),
+                processes=getattr(settings, 'PARAGLIDING_JOB_PROCESSES', True),
+            )
+    return queue
+
+
+def job_finished(pk, method='finish_job'):
+    """
+    returns the callback of the job queue, which stores the result of the
+    job with the track (Track.finish_job or Track.finish_distance). it runs
+    in a thread of the queue
+    """
+    def finished(result, error):
+        try:
+            getattr(Track.objects.get(pk=pk), method)(result, error)
+        finally:
+            # the connections of the thread are not closed by a request
+            connections.close_all()
+    return finished
+
+
+def job_options():
+    """
+    returns the options of the conversion jobs from the settings
+    """
+    return {
+        'resolution': getattr(settings, 'PARAGLIDING_VARIO_RESOLUTION', VARIO_RESOLUTION),
+        'tolerance': getattr(settings, 'PARAGLIDING_SIMPLIFY_TOLERANCE', None),
+    }
+
+
+def submit_job(track):
+    """
+    submits the conversion job of the stored track (a storage with local
+    paths is required) and the measurement of its free distance. the track
+    fails, if the job can not be submitted
+    """
+    try:
+        get_queue().submit(
+            job_finished(track.pk),
+            track.igc.path,
+            os.path.basename(track.igc.name),
+            measured=job_finished(track.pk, 'finish_distance'),
+            **job_options()
+        )
+    except Exception as e:
+        logger.exception("submitting the job of %s failed", track)
+        track.finish_job(error="the job could not be submitted: %s" % e)
 
-    return SimpleTemplateResponse(template_name)
+
+class TrackPagination(PageNumberPagination):
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 1000
+
+
+# query parameters of the track list: (parameter, lookup, type)
+TRACK_FILTERS = (
+    ('date_from', 'date__gte', 'date'),
+    ('date_to', 'date__lte', 'date'),
+    ('site', 'site', 'str'),
+    ('pilot', 'pilot', 'str'),
+    ('glider', 'glider', 'str'),
+    ('min_duration', 'duration__gte', 'int'),
+    ('min_altitude', 'max_altitude__gte', 'int'),
+    ('min_climb', 'max_climb__gte', 'float'),
+    ('min_distance', 'distance__gte', 'float'),
+)
+
+TRACK_ORDERING = ('date', 'duration', 'max_altitude', 'max_climb', 'distance', 'uploaded')
+
+
+def filter_tracks(queryset, params):
+    """
+    filters the tracks by the query parameters (TRACK_FILTERS, bbox as
+    west,south,east,north for tracks intersecting it and ordering)
+    """
+    for param, lookup, kind in TRACK_FILTERS:
+        value = params.get(param)
+        if value in (None, ''):
+            continue
+        try:
+            if kind == 'date':
+                value = datetime.strptime(value, "%Y-%m-%d").date()
+            elif kind == 'int':
+                value = int(value)
+            elif kind == 'float':
+                value = float(value)
+        except ValueError:
+            raise ValidationError({param: "invalid value %r" % value})
+        queryset = queryset.filter(**{lookup: value})
+
+    bbox = params.get('bbox')
+    if bbox:
+        try:
+            west, south, east, north = [float(value) for value in bbox.split(',')]
+        except ValueError:
+            raise ValidationError({'bbox': "expected west,south,east,north"})
+        queryset = queryset.filter(north__gte=south, south__lte=north, east__gte=west, west__lte=east)
+
+    ordering = params.get('ordering')
+    if ordering:
+        if ordering.lstrip('-') not in TRACK_ORDERING:
+            raise ValidationError({'ordering': "one of %s" % ', '.join(TRACK_ORDERING)})
+        queryset = queryset.order_by(ordering, '-id')
+    return queryset
 
 
 class TrackViewSet(viewsets.ViewSet):
     """
+    lists the stored tracks by their summaries. POST a track to store it
+    and to create a conversion job, GET the job (by the id of the track)
+    for its status and download the kmz file, when it is done. the state
+    of the job is stored with the track, so any process of the server
+    answers for it. the jobs of a restarted server are run by the
+    requeue_tracks command
     """
+    parser_classes = (MultiPartParser,)
+    pagination_class = TrackPagination
 
     def get_serializer(self, *args, **kwargs):
         return TrackSerializer(*args, **kwargs)
 
     def list(self, request):
-        return Response([])
+        queryset = filter_tracks(Track.objects.all(), request.query_params)
+        paginator = self.pagination_class()
+        page = paginator.paginate_queryset(queryset, request, view=self)
+        return paginator.get_paginated_response(TrackSummarySerializer(page, many=True).data)
+
+    @instrumented
+    def create(self, request):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        file_obj = serializer.validated_data['track']
+
+        # the summary is computed by the job
+        track = Track(igc=file_obj, user=request.user if request.user.is_authenticated else None)
+        track.save()
+
+        # the worker reads the stored file, once the track is committed
+        transaction.on_commit(lambda: submit_job(track))
+        data = track.job()
+        data['track'] = TrackSummarySerializer(track).data
+        return Response(data, status=status.HTTP_202_ACCEPTED)
+
+    def get_track(self, pk):
+        try:
+            return Track.objects.get(pk=pk)
+        except (Track.DoesNotExist, ValueError):
+            return None
+
+    def retrieve(self, request, pk=None):
+        track = self.get_track(pk)
+        if track is None:
+            return Response({'detail': "job not found"}, status=status.HTTP_404_NOT_FOUND)
+        return Response(track.job())
+
+    @action(detail=True, methods=['get'])
+    def download(self, request, pk=None):
+        track = self.get_track(pk)
+        if track is None:
+            return Response({'detail': "job not found"}, status=status.HTTP_404_NOT_FOUND)
+        if track.status != DONE:
+            return Response(track.job(), status=status.HTTP_409_CONFLICT)
+
+        response = FileResponse(track.kmz.open('rb'), content_type="application/vnd.google-earth.kmz")
+        response['Content-Disposition'] = "attachment; filename=%s" % track.kmz_filename
+        return response
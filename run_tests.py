@@ -0,0 +1,13 @@
+#!/usr/bin/python
+# ex:set fileencoding=utf-8:
+
+from __future__ import unicode_literals
+
+import sys
+import unittest
+
+
+if __name__ == '__main__':
+    suite = unittest.defaultTestLoader.discover('tests', top_level_dir='.')
+    result = unittest.TextTestRunner(verbosity=1).run(suite)
+    sys.exit(not result.wasSuccessful())
@@ -0,0 +1,111 @@
+#!/usr/bin/python
+# ex:set fileencoding=utf-8:
+
+from __future__ import unicode_literals
+
+import os
+import shutil
+import tempfile
+import unittest
+
+try:
+    from unittest import mock
+except ImportError:
+    import mock
+
+from benchmarks.synthetic import igc
+from paragliding import batch
+from paragliding.parsers import Flight
+
+
+COARSE = (None, 0.5, 50.0)
+FINE = (None, 0.1, None)
+
+
+class ResultCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.cache = os.path.join(self.directory, 'cache')
+        self.filename = self.write('flight.igc', igc(0.2, seed=1))
+
+    def write(self, name, data):
+        path = os.path.join(self.directory, name)
+        with open(path, 'wb') as f:
+            f.write(data)
+        return path
+
+    def convert(self, variants, filename=None):
+        """
+        converts the file in this process, returns the rendered flight and
+        the number of parsed files and rendered variants
+        """
+        parse = mock.Mock(side_effect=batch.parse)
+        render = mock.Mock(side_effect=Flight.iter_kml)
+
+        def iter_kml(flight, *args):
+            return render(flight, *args)
+
+        with mock.patch.object(batch, 'parse', parse), mock.patch.object(Flight, 'iter_kml', iter_kml):
+            flight, error = batch.convert(filename or self.filename, variants, self.cache)
+        self.assertIsNone(error)
+        return flight, parse.call_count, render.call_count
+
+    def document(self, flight, arguments):
+        return ''.join(flight.iter_document(*arguments))
+
+    def test_reuse(self):
+        uncached, error = batch.convert(self.filename, [COARSE, FINE])
+
+        flight, parsed, rendered = self.convert([COARSE])
+        self.assertEqual((parsed, rendered), (1, 1))
+
+        # only the missing variant is rendered from the cached fixes
+        flight, parsed, rendered = self.convert([COARSE, FINE])
+        self.assertEqual((parsed, rendered), (0, 1))
+
+        flight, parsed, rendered = self.convert([FINE, COARSE])
+        self.assertEqual((parsed, rendered), (0, 0))
+        for arguments in (COARSE, FINE):
+            self.assertEqual(self.document(flight, arguments), self.document(uncached, arguments))
+        self.assertEqual(flight.bounds(), uncached.bounds())
+        self.assertEqual(flight.date, uncached.date)
+
+    def test_renamed(self):
+        self.convert([COARSE])
+        renamed = os.path.join(self.directory, 'renamed.igc')
+        os.rename(self.filename, renamed)
+
+        # the name is rendered into the kml: the variant is rendered again
+        # from the cached fixes
+        flight, parsed, rendered = self.convert([COARSE], renamed)
+        self.assertEqual((parsed, rendered), (0, 1))
+        self.assertEqual(str(flight), 'renamed')
+        self.assertIn('renamed', self.document(flight, COARSE))
+
+    def test_changed(self):
+        cache = batch.ResultCache(self.cache)
+        key = cache.key(self.filename)
+        self.convert([COARSE])
+
+        changed = self.write('flight.igc', igc(0.2, seed=2))
+        self.assertNotEqual(cache.key(changed), key)
+        flight, parsed, rendered = self.convert([COARSE], changed)
+        self.assertEqual((parsed, rendered), (1, 1))
+        self.assertEqual(len(os.listdir(os.path.join(self.cache, key[:2], key))), 3)
+
+        # an other version of the converter has its own keys
+        other = batch.ResultCache(self.cache, version=batch.CONVERTER_VERSION + 1)
+        self.assertNotEqual(other.key(changed), cache.key(changed))
+
+    def test_convert_all(self):
+        other = self.write('other.igc', igc(0.1, seed=4))
+        broken = self.write('broken.igc', b'no igc')
+        filenames = [self.filename, other, broken]
+        log, errors = batch.convert_all(filenames, [COARSE], workers=0, cache=self.cache)
+        self.assertEqual(len(log.flights), 2)
+        self.assertEqual([filename for filename, error in errors], [broken])
+
+        cached, errors = batch.convert_all(filenames, [COARSE], workers=0, cache=self.cache)
+        self.assertEqual(''.join(cached.iter_document(*COARSE)), ''.join(log.iter_document(*COARSE)))
@@ -0,0 +1,78 @@
+#!/usr/bin/python
+# ex:set fileencoding=utf-8:
+
+from __future__ import unicode_literals
+
+import unittest
+
+import numpy as np
+
+from paragliding.cache import LRUCache
+
+
+def row(value, n=10):
+    # 80 bytes
+    return np.full(n, value, dtype=np.float64)
+
+
+class LRUCacheTest(unittest.TestCase):
+
+    def test_eviction_order(self):
+        cache = LRUCache(3 * 80)
+        for key in range(3):
+            cache.set(key, row(key))
+        # 0 is used, so 1 is the least recently used
+        self.assertEqual(cache.get(0)[0], 0)
+        cache.set(3, row(3))
+        self.assertEqual(sorted(cache.data), [0, 2, 3])
+        cache.set(4, row(4))
+        self.assertEqual(sorted(cache.data), [0, 3, 4])
+        self.assertEqual(cache.evictions, 2)
+
+    def test_byte_budget(self):
+        cache = LRUCache(1000)
+        for key in range(20):
+            cache.set(key, row(key, n=key + 1))
+            self.assertLessEqual(cache.nbytes, 1000)
+            self.assertEqual(cache.nbytes, sum(value.nbytes for value in cache.data.values()))
+        # a large value evicts several small ones
+        cache.set('large', row(0, n=100))
+        self.assertEqual(list(cache.data), [19, 'large'])
+        self.assertEqual(cache.nbytes, 20 * 8 + 800)
+
+    def test_replace(self):
+        cache = LRUCache(1000)
+        cache.set(0, row(0))
+        cache.set(0, row(1, n=20))
+        self.assertEqual(len(cache), 1)
+        self.assertEqual(cache.nbytes, 160)
+        self.assertEqual(cache.get(0)[0], 1)
+        self.assertEqual(cache.evictions, 0)
+
+    def test_oversized(self):
+        cache = LRUCache(100)
+        cache.set(0, row(0))
+        cache.set(1, row(1, n=20))
+        # not stored, the other values are kept
+        self.assertNotIn(1, cache)
+        self.assertIn(0, cache)
+        self.assertEqual(cache.nbytes, 80)
+        # a key replaced by an oversized value is dropped
+        cache.set(0, row(0, n=20))
+        self.assertEqual(len(cache), 0)
+        self.assertEqual(cache.nbytes, 0)
+
+    def test_counters(self):
+        cache = LRUCache(1000)
+        self.assertIsNone(cache.get(0))
+        self.assertEqual(cache.get(0, 'default'), 'default')
+        cache.set(0, row(0))
+        cache.get(0)
+        cache.get(0)
+        stats = cache.stats()
+        self.assertEqual((stats['hits'], stats['misses'], stats['evictions']), (2, 2, 0))
+        self.assertEqual((stats['items'], stats['bytes'], stats['max_bytes']), (1, 80, 1000))
+
+        cache.clear()
+        self.assertEqual((len(cache), cache.nbytes), (0, 0))
+        self.assertEqual(cache.hits, 2)
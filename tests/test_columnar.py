@@ -0,0 +1,51 @@
+#!/usr/bin/python
+# ex:set fileencoding=utf-8:
+
+from __future__ import unicode_literals
+
+import shutil
+import tempfile
+import unittest
+
+from io import BytesIO
+
+import numpy as np
+
+from benchmarks.synthetic import igc
+from paragliding import columnar
+from paragliding.parsers import Flight
+from paragliding.parsers import FlightLog
+
+
+class ArchiveTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.log = FlightLog()
+        for seed in range(3):
+            self.log.add_flight(Flight(BytesIO(igc(0.2, 1.0, seed=seed)), "flight%d.igc" % seed))
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_round_trip(self):
+        self.log.write_columns(self.directory)
+        for mmap in (True, False):
+            log = FlightLog.read_columns(self.directory, mmap=mmap)
+            for flight, other in zip(self.log.flights, log.flights):
+                self.assertEqual(flight.name, other.name)
+                self.assertEqual(flight.pilot, other.pilot)
+                self.assertTrue((flight.fixes == other.fixes).all())
+
+    def test_fixes_are_mapped(self):
+        self.log.write_columns(self.directory)
+        archive = columnar.Archive(self.directory)
+        self.assertIsInstance(archive.data, np.memmap)
+        for i in range(len(archive)):
+            flight = Flight.from_archive(archive, i)
+            self.assertTrue(np.shares_memory(flight.fixes, archive.data))
+            self.assertFalse(flight.fixes.flags.writeable)
+
+    def test_empty(self):
+        FlightLog().write_columns(self.directory)
+        self.assertEqual(len(FlightLog.read_columns(self.directory).flights), 0)
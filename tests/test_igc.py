@@ -0,0 +1,157 @@
+#!/usr/bin/python
+# ex:set fileencoding=utf-8:
+
+from __future__ import unicode_literals
+
+import unittest
+
+from io import BytesIO
+
+import numpy as np
+
+from benchmarks.synthetic import coordinate
+from benchmarks.synthetic import igc as synthetic_igc
+from paragliding import igc
+from paragliding.parsers import Flight
+
+
+HEADER = (
+    b"AXXX001 test\r\n"
+    b"HFDTE150716\r\n"
+    b"HOPLTPILOT:Test Pilot\r\n"
+    b"HOGTYGLIDERTYPE:Test Glider\r\n"
+    b"HPSITSITE:Test Site\r\n"
+)
+
+
+def record(seconds, lat, lon, barheight, gpsheight, valid=True):
+    """
+    returns a B-record (without line break)
+    """
+    seconds %= 86400
+    return ("B%02d%02d%02d%s%s%s%s%s000" % (
+        seconds // 3600, seconds // 60 % 60, seconds % 60,
+        coordinate(lat, 2, "N", "S"),
+        coordinate(lon, 3, "E", "W"),
+        "A" if valid else "V",
+        altitude(barheight),
+        altitude(gpsheight),
+    )).encode("latin1")
+
+
+def altitude(value):
+    return "%05d" % value if value >= 0 else "-%04d" % -value
+
+
+def random_records(seed, n, start=36000):
+    """
+    returns n random B-records in all hemispheres, with negative altitudes
+    and invalid fixes
+    """
+    random = np.random.RandomState(seed)
+    lat = random.uniform(-89, 89, n)
+    lon = random.uniform(-179, 179, n)
+    height = random.randint(-999, 9999, (2, n))
+    valid = random.uniform(size=n) > 0.2
+    seconds = start + np.cumsum(random.randint(1, 5, n))
+    return [
+        record(seconds[i], lat[i], lon[i], height[0, i], height[1, i], valid[i])
+        for i in range(n)
+    ]
+
+
+def parse(data, bulk):
+    return Flight(BytesIO(data), "test.igc", bulk=bulk)
+
+
+class ParserTest(unittest.TestCase):
+
+    def assertSameFlight(self, data):
+        lines = parse(data, False)
+        bulk = parse(data, True)
+        self.assertTrue(lines.datapoints)
+        self.assertTrue(np.array_equal(lines.fixes, bulk.fixes))
+        for attr in ('date', 'location', 'pilot', 'glider'):
+            self.assertEqual(getattr(lines, attr), getattr(bulk, attr))
+        return bulk
+
+    def test_bulk_matches_lines(self):
+        records = random_records(0, 500)
+        flight = self.assertSameFlight(HEADER + b"".join(r + b"\r\n" for r in records))
+        self.assertEqual(flight.datapoints, 500)
+        self.assertTrue((flight.fixes['lat'] < 0).any() and (flight.fixes['lon'] < 0).any())
+        self.assertTrue((flight.fixes['gpsheight'] < 0).any())
+        self.assertFalse(flight.fixes['valid'].all())
+        self.assertEqual(flight.pilot, "Test Pilot")
+
+    def test_synthetic(self):
+        self.assertSameFlight(synthetic_igc(0.5, seed=1, lat=-33.5, lon=-70.5))
+
+    def test_fields(self):
+        data = HEADER + record(3661, -12.5, -45.25, -12, -7, valid=False) + b"\r\n"
+        for bulk in (True, False):
+            fix = parse(data, bulk).fixes[0]
+            self.assertEqual(fix['time'], 3661)
+            self.assertEqual(fix['lat'], -750000)
+            self.assertEqual(fix['lon'], -2715000)
+            self.assertEqual(fix['barheight'], -12)
+            self.assertEqual(fix['gpsheight'], -7)
+            self.assertFalse(fix['valid'])
+
+    def test_day_rollover(self):
+        seconds = [86398, 86399, 86400, 86401, 90000]
+        data = HEADER + b"".join(record(s, 47, 11, 1000, 1000) + b"\r\n" for s in seconds)
+        flight = self.assertSameFlight(data)
+        self.assertEqual(flight.fixes['time'].tolist(), seconds)
+
+    def test_no_trailing_newline(self):
+        records = random_records(1, 10)
+        for separator in (b"\r\n", b"\n"):
+            flight = self.assertSameFlight(HEADER + separator.join(records))
+            self.assertEqual(flight.datapoints, 10)
+
+    def test_invalid_lines(self):
+        records = random_records(2, 5)
+        broken = records[3][:14] + b"X" + records[3][15:]
+        data = HEADER + b"\r\n".join([
+            records[0], records[1][:20], b"LXXX comment", records[2], broken, records[4],
+        ]) + b"\r\n"
+        flight = self.assertSameFlight(data)
+        self.assertEqual(flight.datapoints, 3)
+
+
+class ChunkTest(unittest.TestCase):
+
+    def test_chunk_boundaries(self):
+        records = random_records(3, 40)
+        data = HEADER + b"".join(r + b"\r\n" for r in records)
+        headers, fixes = igc.read_igc(data)
+        self.assertEqual(len(fixes), 40)
+        # every chunk size splits the records at other positions
+        for chunk_size in range(1, 3 * igc.B_RECORD_LENGTH):
+            chunk_headers, chunk_fixes = igc.read_igc(data, chunk_size)
+            self.assertEqual(chunk_headers, headers)
+            self.assertTrue(np.array_equal(chunk_fixes, fixes), chunk_size)
+
+    def test_default_chunk_size(self):
+        # a record crosses the boundaries of the default chunks
+        data = HEADER + b"".join(r + b"\r\n" for r in random_records(6, 997)) * 250
+        self.assertGreater(len(data), 2 * igc.CHUNK_SIZE)
+        headers, fixes = igc.read_igc(data)
+        self.assertEqual(len(fixes), 997 * 250)
+        self.assertTrue(np.array_equal(igc.read_igc(data, len(data))[1], fixes))
+
+    def test_chunks_without_trailing_newline(self):
+        data = HEADER + b"\r\n".join(random_records(4, 20))
+        fixes = igc.decode_b_records(data)
+        self.assertEqual(len(fixes), 20)
+        for chunk_size in (1, 7, igc.B_RECORD_LENGTH, 100, len(data)):
+            self.assertTrue(np.array_equal(igc.decode_b_records(data, chunk_size), fixes))
+
+    def test_chunks(self):
+        data = igc.as_buffer(HEADER + b"\r\n".join(random_records(5, 20)))
+        for size in (1, 10, 100, 10000):
+            parts = list(igc.chunks(data, size))
+            self.assertEqual(b"".join(part.tobytes() for part in parts), data.tobytes())
+            for part in parts[:-1]:
+                self.assertEqual(part[-1], ord("\n"))
@@ -0,0 +1,74 @@
+#!/usr/bin/python
+# ex:set fileencoding=utf-8:
+
+from __future__ import unicode_literals
+
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+from benchmarks import synthetic
+from paragliding import jobs
+
+
+def die():
+    os._exit(1)
+
+
+def answer():
+    return 42
+
+
+class JobQueueTest(unittest.TestCase):
+
+    def setUp(self):
+        self.queue = jobs.JobQueue(workers=1)
+        self.results = []
+        self.done = threading.Event()
+
+    def tearDown(self):
+        self.queue.shutdown()
+
+    def finished(self, result, error):
+        self.results.append((result, error))
+        self.done.set()
+
+    def wait(self):
+        self.assertTrue(self.done.wait(60))
+        self.done.clear()
+
+    def test_broken_pool(self):
+        self.queue.run(self.finished, 'die', die, ())
+        self.wait()
+        self.assertIsNone(self.results[0][0])
+        self.assertTrue(self.results[0][1])
+
+        # the broken pool is replaced
+        self.queue.run(self.finished, 'answer', answer, ())
+        self.wait()
+        self.assertEqual(self.results[1], (42, None))
+
+    def test_shutdown(self):
+        self.queue.shutdown()
+        self.assertRaises(RuntimeError, self.queue.run, self.finished, 'answer', answer, ())
+
+    def test_measured(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, 'flight.igc')
+        with open(path, 'wb') as f:
+            f.write(synthetic.igc(hours=0.1))
+
+        order = []
+        self.queue.submit(
+            lambda result, error: order.append(('kmz', result[1]['distance'], error)),
+            path, 'flight.igc',
+            measured=lambda distance, error: (order.append(('distance', distance, error)), self.done.set()),
+        )
+        self.wait()
+        self.assertEqual([step[0] for step in order], ['kmz', 'distance'])
+        self.assertIsNone(order[0][1])
+        self.assertGreater(order[1][1], 0)
+        self.assertIsNone(order[1][2])
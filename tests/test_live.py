@@ -0,0 +1,109 @@
+#!/usr/bin/python
+# ex:set fileencoding=utf-8:
+
+from __future__ import unicode_literals
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from io import BytesIO
+
+import numpy as np
+
+from benchmarks.synthetic import igc
+from paragliding import geodesy
+from paragliding import optimize
+from paragliding.live import Buffer
+from paragliding.live import LiveFlight
+from paragliding.parsers import Flight
+
+
+def pieces(data, seed, count=40):
+    """
+    splits the data at random positions (within lines as well)
+    """
+    random = np.random.RandomState(seed)
+    cuts = np.sort(random.randint(0, len(data), count))
+    return [data[a:b] for a, b in zip(np.concatenate(([0], cuts)), np.concatenate((cuts, [len(data)])))]
+
+
+class LiveFlightTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        # 20 minutes across midnight, without a trailing newline
+        cls.data = igc(1 / 3., seed=3, start=86400 - 600).rstrip()
+        cls.flight = Flight(BytesIO(cls.data), "live.igc")
+
+    def assertSameFlight(self, live):
+        flight = self.flight
+        self.assertTrue(np.array_equal(live.fixes, flight.fixes))
+        self.assertEqual(live.pilot, flight.pilot)
+        self.assertEqual(live.date, flight.date)
+        analytics = flight.get_analytics()
+        self.assertTrue(np.allclose(live.smooth_height, analytics.smooth_height, rtol=0, atol=1e-6))
+        self.assertTrue(np.allclose(live.vario, analytics.vario, rtol=0, atol=1e-6))
+
+    def test_random_chunks(self):
+        self.assertGreater(self.flight.seconds[-1], 86400)
+        for seed in range(5):
+            live = LiveFlight("live.igc", capacity=16)
+            parts = pieces(self.data, seed)
+            for i, part in enumerate(parts):
+                live.feed(part, final=i == len(parts) - 1)
+            self.assertSameFlight(live)
+
+    def test_best_distance(self):
+        live = LiveFlight("live.igc")
+        for part in pieces(self.data, 10, count=8):
+            live.feed(part)
+            # the distance is scored while the flight grows
+            if live.datapoints:
+                distance, path = live.best_distance()
+                fixes = np.arange(live.datapoints)
+                expected = optimize.best_path(optimize.pairwise(live.get_trig(), fixes, fixes), 4)[0]
+                self.assertAlmostEqual(distance, expected, delta=1e-6)
+        live.feed(b"", final=True)
+        self.assertSameFlight(live)
+
+        distance, path = live.best_distance()
+        expected, coords = self.flight.calc_turning_points(3)
+        self.assertAlmostEqual(distance, expected, delta=1e-6)
+        self.assertEqual(len(path), 5)
+        self.assertAlmostEqual(
+            optimize.path_distance(geodesy.get_model('fai'), self.flight.get_trig(), path), distance, delta=1e-6,
+        )
+
+    def test_growing_file(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, "live.igc")
+
+        live = LiveFlight("live.igc")
+        with open(path, "wb") as f:
+            for part in pieces(self.data + b"\r\n", 20, count=10):
+                f.write(part)
+                f.flush()
+                live.update(path)
+        self.assertSameFlight(live)
+
+        # a replaced file is read again
+        with open(path, "wb") as f:
+            f.write(self.data[:len(self.data) // 2])
+        live.update(path)
+        self.assertLess(live.datapoints, self.flight.datapoints)
+        self.assertTrue(np.array_equal(live.fixes, self.flight.fixes[:live.datapoints]))
+
+
+class BufferTest(unittest.TestCase):
+
+    def test_extend(self):
+        buf = Buffer(np.int64, capacity=1)
+        for n in range(1, 50):
+            buf.extend(np.arange(n))
+        self.assertEqual(len(buf), sum(range(1, 50)))
+        self.assertEqual(buf.values[-49:].tolist(), list(range(49)))
+        buf.resize(3)
+        self.assertEqual(buf.values.tolist(), [0, 0, 1])
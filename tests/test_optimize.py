@@ -0,0 +1,117 @@
+#!/usr/bin/python
+# ex:set fileencoding=utf-8:
+
+from __future__ import unicode_literals
+
+import time
+import tracemalloc
+import unittest
+
+import numpy as np
+
+from paragliding import geodesy
+from paragliding import optimize
+
+
+def trig(x, y):
+    """
+    returns the trig terms of the positions x, y (m) around 47N 11E
+    """
+    return geodesy.trig(47 + y / 111195., 11 + x / (111195. * np.cos(np.radians(47))))
+
+
+def circling(seed, n, radius=60.0):
+    """
+    a local flight: circles of 25 s drifting around one place
+    """
+    random = np.random.RandomState(seed)
+    a = np.arange(n) * 2 * np.pi / 25.
+    x, y = np.cumsum(random.normal(0, 0.3, (2, n)), axis=1)
+    return trig(
+        x + radius * np.cos(a) + random.normal(0, 3, n),
+        y + radius * np.sin(a) + random.normal(0, 3, n),
+    )
+
+
+def ridge(seed, n, length=2000.0):
+    """
+    a local flight: beats along a ridge at 9 m/s
+    """
+    random = np.random.RandomState(seed)
+    s = (np.arange(n) * 9.0) % (2 * length)
+    x = np.where(s < length, s, 2 * length - s)
+    y = 50 * np.sin(np.arange(n) / 60.) + np.cumsum(random.normal(0, 0.5, n))
+    return trig(x + random.normal(0, 3, n), y + random.normal(0, 3, n))
+
+
+def walk(seed, n):
+    random = np.random.RandomState(seed)
+    x, y = np.cumsum(random.normal(0, 30, (2, n)), axis=1)
+    return trig(x, y)
+
+
+def brute(model, trig, legs):
+    # the dynamic programming over all fixes
+    terms = model.terms(trig)
+    fixes = np.arange(len(trig[0]))
+    return optimize.best_path(model.pairwise(terms, fixes, fixes), legs)[0]
+
+
+class FreeDistanceTest(unittest.TestCase):
+
+    def tracks(self):
+        for seed in range(12):
+            n = 100 + 40 * seed
+            yield seed, (circling, ridge, walk)[seed % 3](seed, n)
+
+    def test_free_distance(self):
+        random = np.random.RandomState(0)
+        for seed, track in self.tracks():
+            for name in ('fai', 'wgs84'):
+                model = geodesy.get_model(name)
+                turnpoints = random.randint(0, 5)
+                expected = brute(model, track, turnpoints + 1)
+                distance, path = optimize.free_distance(
+                    track, turnpoints, max_candidates=random.randint(10, 100),
+                    max_cells=random.randint(3, 40), model=name,
+                )
+                self.assertAlmostEqual(distance, expected, delta=1e-3, msg="%s %s" % (seed, name))
+                self.assertEqual(len(path), turnpoints + 2)
+                self.assertEqual(path, sorted(path))
+                self.assertAlmostEqual(
+                    optimize.path_distance(model, track, path), distance, delta=1e-3,
+                )
+
+    def test_forward_clustered(self):
+        random = np.random.RandomState(1)
+        model = geodesy.get_model('fai')
+        for seed, track in self.tracks():
+            legs = random.randint(1, 6)
+            terms = model.terms(track)
+            F, back = optimize.forward_clustered(
+                model, terms, track, legs, size=random.randint(2, 20),
+                branching=random.randint(2, 6), block=random.randint(5, 100),
+                max_pairs=random.randint(10, 1000),
+            )
+            distance, path = optimize.backtrack(F, back)
+            self.assertAlmostEqual(distance, brute(model, track, legs), delta=1e-6, msg=seed)
+            self.assertAlmostEqual(optimize.path_distance(model, track, path), distance, delta=1e-6)
+
+    def test_duplicates(self):
+        track = walk(3, 200)
+        repeated = geodesy.take(track, np.repeat(np.arange(200), 3))
+        distance, path = optimize.free_distance(repeated, 3, max_candidates=20, max_cells=10)
+        self.assertAlmostEqual(distance, brute(geodesy.get_model('fai'), track, 4), delta=1e-6)
+
+    def test_local_flight(self):
+        # two hours circling at 1 Hz can not be reduced by cells (before
+        # the clusters: 15 s and 520 MB)
+        track = circling(0, 7200)
+        tracemalloc.start()
+        start = time.time()
+        optimize.free_distance(track, 3)
+        elapsed = time.time() - start
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        self.assertLess(elapsed, 10)
+        self.assertLess(peak, 150 * 2**20)
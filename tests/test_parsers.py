@@ -0,0 +1,49 @@
+#!/usr/bin/python
+# ex:set fileencoding=utf-8:
+
+from __future__ import unicode_literals
+
+import unittest
+
+from io import BytesIO
+
+from benchmarks.synthetic import igc
+from paragliding.parsers import Flight
+
+
+def flight(fixes):
+    """
+    returns a flight with the header and the first fixes of a synthetic
+    flight
+    """
+    lines = igc(0.01).splitlines(True)
+    return Flight(BytesIO(b''.join(
+        [line for line in lines if not line.startswith(b'B')]
+        + [line for line in lines if line.startswith(b'B')][:fixes]
+    )), "short.igc")
+
+
+class ShortFlightTest(unittest.TestCase):
+
+    def test_document(self):
+        for fixes in (0, 1, 2):
+            for tolerance in (None, 10.0):
+                document = "".join(flight(fixes).iter_document(tolerance=tolerance))
+                self.assertTrue(document.endswith("</kml>"))
+                self.assertEqual(document.count("<styleUrl>#vario"), max(fixes - 1, 0))
+
+
+class DistanceTest(unittest.TestCase):
+
+    def test_turning_point_distance(self):
+        flight = Flight(BytesIO(igc(0.5, seed=2)), "distance.igc")
+        distance, coords = flight.calc_turning_points(3)
+        self.assertAlmostEqual(flight.calc_turning_point_distance(coords), distance, delta=1e-6)
+        self.assertAlmostEqual(
+            flight.calc_turning_point_distance(coords),
+            sum(flight.get_distances(i)[j] for i, j in zip(coords[:-1], coords[1:])),
+            delta=1e-6,
+        )
+        self.assertEqual(flight.calc_turning_point_distance(coords[:1]), 0.0)
+        wgs84, coords = flight.calc_turning_points(3, model='wgs84')
+        self.assertAlmostEqual(flight.calc_turning_point_distance(coords, model='wgs84'), wgs84, delta=1e-3)
@@ -0,0 +1,96 @@
+#!/usr/bin/python
+# ex:set fileencoding=utf-8:
+
+from __future__ import unicode_literals
+
+import unittest
+
+import numpy as np
+
+from paragliding import geodesy
+from paragliding import scoring
+
+
+def track(seed, n, noise=400.0):
+    """
+    returns the trig terms of a noisy triangle flight with n fixes
+    """
+    random = np.random.RandomState(seed)
+    corners = np.array([[0, 0], [1, 0.2], [0.5, 1], [0.05, 0.02]]) * random.uniform(3000, 8000)
+    corners += random.normal(0, 300, corners.shape)
+    t = np.linspace(0, 3, n)
+    leg = np.minimum(t.astype(int), 2)
+    f = (t - leg)[:, None]
+    xy = corners[leg] * (1 - f) + corners[leg + 1] * f + random.normal(0, noise, (n, 2))
+    lat = 47 + xy[:, 1] / 111195.
+    lon = 11 + xy[:, 0] / (111195. * np.cos(np.radians(47)))
+    return geodesy.trig(lat, lon)
+
+
+def distances(trig):
+    lat, lon, cos = trig
+    return geodesy.haversine(lat[:, None], lon[:, None], cos[:, None], lat[None, :], lon[None, :], cos[None, :])
+
+
+def gaps(D):
+    # G[i, k] = min d(s, f) with s <= i and f >= k
+    G = np.minimum.accumulate(D, axis=0)
+    return np.minimum.accumulate(G[:, ::-1], axis=1)[:, ::-1]
+
+
+def brute_triangle(trig, closing, min_leg):
+    D = distances(trig)
+    G = gaps(D)
+    n = len(D)
+    best = 0.0
+    for i in range(n):
+        a = D[i, i:, None]
+        b = D[i:, i:]
+        c = D[None, i, i:]
+        perimeter = a + b + c
+        valid = np.triu(np.ones((n - i, n - i), dtype=np.bool_)) & (G[i, None, i:] <= closing * perimeter)
+        if min_leg:
+            valid &= np.minimum(np.minimum(a, b), c) >= min_leg * perimeter
+        if valid.any():
+            best = max(best, (perimeter - G[i, None, i:])[valid].max())
+    return best
+
+
+class ClosingGapTest(unittest.TestCase):
+
+    def test_closing_gap(self):
+        for seed in range(10):
+            trig = track(seed, 600)
+            levels = scoring.Levels(trig, cells=8, gap_cells=16)
+            G = gaps(distances(trig))
+            random = np.random.RandomState(seed)
+            for n in range(50):
+                i = random.randint(0, levels.n // 4)
+                k = random.randint(3 * levels.n // 4, levels.n)
+                gap, (s, f) = levels.closing_gap(i, k)
+                self.assertAlmostEqual(gap, G[i, k], places=6)
+                self.assertTrue(s <= i and f >= k)
+                self.assertAlmostEqual(levels.distance(s, f), gap, places=6)
+
+    def test_closing_gaps(self):
+        for seed in range(10):
+            trig = track(seed, 600)
+            levels = scoring.Levels(trig, cells=8, gap_cells=16)
+            G = gaps(distances(trig))
+            random = np.random.RandomState(seed)
+            i = random.randint(0, levels.n // 2, 200)
+            k = random.randint(levels.n // 2, levels.n, 200)
+            np.testing.assert_allclose(levels.closing_gaps(i, k, chunk=64), G[i, k], atol=1e-6)
+
+
+class TriangleTest(unittest.TestCase):
+
+    def test_triangle(self):
+        for seed in range(6):
+            trig = track(seed, 200, noise=200.0)
+            for min_leg in (None, scoring.FAI_MIN_LEG):
+                score, indices = scoring.triangle(trig, min_leg=min_leg)
+                self.assertAlmostEqual(score, brute_triangle(trig, scoring.CLOSING, min_leg), places=3)
+                if indices:
+                    s, i, j, k, f = indices
+                    self.assertTrue(s <= i <= j <= k <= f)
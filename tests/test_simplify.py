@@ -0,0 +1,49 @@
+#!/usr/bin/python
+# ex:set fileencoding=utf-8:
+
+from __future__ import unicode_literals
+
+import unittest
+
+from io import BytesIO
+
+from benchmarks.synthetic import igc
+from paragliding import instrument
+from paragliding import simplify
+from paragliding.parsers import Flight
+
+
+class SimplifyTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.flight = Flight(BytesIO(igc(3.0, 1.0)), "simplify.igc")
+
+    def test_transitions_are_kept(self):
+        deltas = self.flight.get_analytics().deltas
+        points = self.flight.simplify(10.0, deltas)
+        self.assertTrue(set(simplify.transitions(deltas).tolist()) <= set(points.tolist()))
+        self.assertEqual(points[0], 0)
+        self.assertEqual(points[-1], self.flight.datapoints - 1)
+
+    def test_points_kept_by_default(self):
+        deltas = self.flight.get_analytics().deltas
+        x, y, z = simplify.project(self.flight.lat, self.flight.lon, self.flight.gpsheight)
+        for tolerance in (10.0, 50.0):
+            plain = simplify.douglas_peucker(x, y, z, tolerance).sum()
+            points = self.flight.simplify(tolerance, deltas)
+            # the pinned transitions add only a few points
+            self.assertLess(len(points), 2 * plain)
+            self.assertLess(len(points), self.flight.datapoints // 10)
+
+    def test_document_shrinks(self):
+        full = "".join(self.flight.iter_document())
+        simplified = "".join(self.flight.iter_document(tolerance=10.0))
+        self.assertLess(len(simplified), len(full) // 5)
+
+    def test_dropped_points_counted(self):
+        recorder = instrument.Recorder()
+        with recorder:
+            points = self.flight.simplify(10.0)
+        self.assertEqual(recorder.counters['simplified_points_dropped'], self.flight.datapoints - len(points))
+        self.assertIn('simplify', recorder.timers)
@@ -0,0 +1,119 @@
+#!/usr/bin/python
+# ex:set fileencoding=utf-8:
+
+from __future__ import unicode_literals
+
+import unittest
+
+from math import factorial
+
+import numpy as np
+
+from paragliding import smoothing
+
+
+def old_averages(data, N, f):
+    # the loop of the former utils.averages (with integer division)
+    if N < 2:
+        return data
+    if len(data) < N:
+        N = len(data)
+    averages = np.convolve(data, f(N), "same")
+    for i in range(0, N // 2):
+        j = 2 * i + 1
+        weight = f(j)
+        averages[i] = np.sum(data[:j] * weight)
+        averages[-i - 1] = np.sum(data[-j:] * weight)
+    return averages
+
+
+def old_binom(N):
+    return np.array([
+        factorial(N - 1) / factorial(i) / factorial(N - 1 - i) / 2. ** (N - 1) for i in range(N)
+    ])
+
+
+def polyfit_savgol(data, window, order, deriv, delta):
+    # fits the polynomial to every window with np.polyfit
+    half = window // 2
+    x = np.arange(-half, half + 1, dtype=np.float64)
+    result = np.empty(len(data))
+    for i in range(len(data)):
+        start = min(max(i - half, 0), len(data) - window)
+        poly = np.polyder(np.polyfit(x, data[start:start + window], order), deriv)
+        result[i] = np.polyval(poly, i - start - half)
+    return result / delta ** deriv
+
+
+class AveragesTest(unittest.TestCase):
+
+    def test_old_edges(self):
+        random = np.random.RandomState(0)
+        for n in (1, 2, 3, 5, 10, 100):
+            data = np.cumsum(random.normal(0, 1, n)) + 1000
+            for N in (1, 2, 3, 4, 5, 10, 21, 150):
+                for f in (smoothing.moving, smoothing.binom):
+                    expected = old_averages(data, N, f)
+                    result = smoothing.averages(data, N, f)
+                    self.assertEqual(len(result), n)
+                    self.assertTrue(np.allclose(result, expected, rtol=0, atol=1e-9), (n, N, f))
+
+    def test_binom(self):
+        for N in (1, 2, 5, 20):
+            self.assertTrue(np.allclose(smoothing.binom(N), old_binom(N)))
+        weight = smoothing.binom(2000)
+        self.assertTrue(np.isfinite(weight).all())
+        self.assertAlmostEqual(weight.sum(), 1.0)
+
+    def test_kernel_size(self):
+        self.assertRaises(ValueError, smoothing.averages, np.arange(10.), 5, lambda N: np.ones(N - 1))
+
+
+class ExponentialTest(unittest.TestCase):
+
+    def reference(self, data, alpha):
+        result = np.empty(len(data))
+        result[0] = data[0]
+        for i in range(1, len(data)):
+            result[i] = alpha * data[i] + (1 - alpha) * result[i - 1]
+        return result
+
+    def test_recursion(self):
+        random = np.random.RandomState(1)
+        data = np.cumsum(random.normal(0, 1, 20000)) + 1500
+        for alpha in (1e-4, 0.01, 0.3, 0.9, 1.0):
+            expected = self.reference(data, alpha)
+            self.assertTrue(np.allclose(smoothing.exponential(data, alpha), expected, rtol=0, atol=1e-6), alpha)
+            self.assertTrue(np.allclose(smoothing.exponential(data, alpha, blocksize=7), expected, rtol=0, atol=1e-6))
+
+    def test_short(self):
+        self.assertEqual(len(smoothing.exponential([], 0.5)), 0)
+        self.assertEqual(smoothing.exponential([3.0], 0.5).tolist(), [3.0])
+        self.assertRaises(ValueError, smoothing.exponential, [1.0], 0)
+        self.assertRaises(ValueError, smoothing.exponential, [1.0], 1.5)
+
+
+class SavgolTest(unittest.TestCase):
+
+    def test_polyfit(self):
+        random = np.random.RandomState(2)
+        data = np.cumsum(random.normal(0, 1, 200)) + 1000
+        for window, order in ((5, 2), (15, 2), (15, 3), (21, 4)):
+            for deriv, delta in ((0, 1.0), (1, 1.0), (1, 0.2), (2, 0.5)):
+                expected = polyfit_savgol(data, window, order, deriv, delta)
+                result = smoothing.savgol(data, window, order, deriv, delta)
+                self.assertTrue(np.allclose(result, expected, rtol=0, atol=1e-6), (window, order, deriv))
+
+    def test_polynomial(self):
+        # a polynomial of the order is reproduced, the edges included
+        x = np.arange(50, dtype=np.float64)
+        data = 0.01 * x ** 2 - x + 3
+        self.assertTrue(np.allclose(smoothing.savgol(data, 11, 2), data))
+        self.assertTrue(np.allclose(smoothing.savgol(data, 11, 2, deriv=1), 0.02 * x - 1))
+
+    def test_short(self):
+        data = np.array([1.0, 2.0, 4.0])
+        self.assertTrue(np.allclose(smoothing.savgol(data, 15, 2), data))
+        self.assertEqual(len(smoothing.savgol([], 15, 2)), 0)
+        self.assertTrue(np.allclose(smoothing.savgol(data, 15, 1, deriv=2), 0))
+        self.assertRaises(ValueError, smoothing.savgol, data, 4, 2)
@@ -0,0 +1,61 @@
+#!/usr/bin/python
+# ex:set fileencoding=utf-8:
+
+from __future__ import unicode_literals
+
+import unittest
+
+import numpy as np
+
+from paragliding import spatial
+
+
+def brute_clusters(sites):
+    # union of all pairs closer than the radius
+    keys = list(sites.points)
+    parent = dict((key, key) for key in keys)
+
+    def find(key):
+        while parent[key] != key:
+            key = parent[key]
+        return key
+
+    for n, a in enumerate(keys):
+        for b in keys[n + 1:]:
+            if sites.distance(a, b) <= sites.radius:
+                parent[find(a)] = find(b)
+    result = {}
+    for key in keys:
+        result.setdefault(find(key), []).append(key)
+    return sorted(sorted(keys) for keys in result.values())
+
+
+class SitesTest(unittest.TestCase):
+
+    def test_close_pair_far_from_the_prime_meridian(self):
+        sites = spatial.Sites()
+        sites.add(0, 48.607, -152.440)
+        sites.add(1, 48.616, -152.442)
+        self.assertLess(sites.distance(0, 1), sites.radius)
+        self.assertEqual(sites.find(0), sites.find(1))
+
+    def test_close_pairs(self):
+        random = np.random.RandomState(0)
+        for n in range(2000):
+            lat = random.uniform(-70, 70)
+            lon = random.uniform(-179, 179)
+            sites = spatial.Sites()
+            sites.add(0, lat, lon)
+            # a second point up to 1.2 km away in any direction
+            angle = random.uniform(0, 2 * np.pi)
+            distance = random.uniform(0, 1200) / spatial.DEGREE
+            sites.add(1, lat + distance * np.cos(angle), lon + distance * np.sin(angle) / np.cos(np.radians(lat)))
+            self.assertEqual(sites.distance(0, 1) <= sites.radius, sites.find(0) == sites.find(1))
+
+    def test_clusters(self):
+        random = np.random.RandomState(1)
+        for lon in (11.0, -152.4, 179.5):
+            sites = spatial.Sites()
+            for key in range(300):
+                sites.add(key, 48.6 + random.normal(0, 0.05), lon + random.normal(0, 0.05))
+            self.assertEqual(sorted(sorted(keys) for keys in sites.clusters()), brute_clusters(sites))
@@ -4,28 +4,71 @@
 from __future__ import unicode_literals
 
 import argparse
-import os
+import sys
 
-from zipfile import ZipFile
-from zipfile import ZIP_DEFLATED
+from paragliding.batch import convert_all
+from paragliding.batch import find_igc_files
+from paragliding.kml import write_kmz
+from paragliding.parsers import LOD_COARSE_RESOLUTION
+from paragliding.parsers import LOD_COARSE_TOLERANCE
+from paragliding.parsers import VARIO_RESOLUTION
 
-from paragliding.parsers import FlightLog
-from paragliding.parsers import Flight
+
+def progress(done, total, filename, error):
+    sys.stderr.write("[%d/%d] %s%s\n" % (done, total, filename, " failed" if error else ""))
 
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(description='Process a directory with igc files')
     parser.add_argument('dir', metavar='<dir>', type=str, help='directory')
+    parser.add_argument(
+        '--resolution', type=float, default=VARIO_RESOLUTION,
+        help='merge segments with the same climb rate (m/s), 0 renders every segment',
+    )
+    parser.add_argument(
+        '--tolerance', type=float, default=None,
+        help='simplify the tracks with this tolerance (m)',
+    )
+    parser.add_argument(
+        '--lod', action='store_true',
+        help='store every flight in a coarse and a fine variant, which are loaded by region',
+    )
+    parser.add_argument(
+        '--workers', type=int, default=None,
+        help='number of worker processes (default: one per cpu), 0 converts the files in this process',
+    )
+    parser.add_argument(
+        '--cache', metavar='<dir>', type=str, default=None,
+        help='reuse the results of unchanged files from this directory',
+    )
+    parser.add_argument(
+        '--quiet', action='store_true',
+        help='do not report the progress',
+    )
     args = parser.parse_args()
 
-    flights = FlightLog()
-    for path, dirs, files in os.walk(args.dir):
-        for file in files:
-            if file[-4:] == ".igc":
-                f = Flight(os.path.join(path, file), file)
-                flights.add_flight(f)
-    flights.make_tree()
-    flights.write('test.kml')
-    with ZipFile('test.kmz', 'w', ZIP_DEFLATED) as myzip:
-        myzip.write('test.kml')
-    os.remove('test.kml')
+    variants = [(None, args.resolution, args.tolerance)]
+    if args.lod:
+        variants.append((None, LOD_COARSE_RESOLUTION, LOD_COARSE_TOLERANCE))
+
+    flights, errors = convert_all(
+        find_igc_files(args.dir),
+        variants,
+        workers=args.workers,
+        progress=None if args.quiet else progress,
+        cache=args.cache,
+    )
+
+    if args.lod:
+        flights.write_lod_kmz('test.kmz', resolution=args.resolution, tolerance=args.tolerance)
+    else:
+        write_kmz('test.kmz', 'test.kml', flights.iter_document(
+            resolution=args.resolution,
+            tolerance=args.tolerance,
+        ))
+
+    for filename, error in errors:
+        sys.stderr.write("%s:\n%s\n" % (filename, error))
+    if errors:
+        sys.stderr.write("%d of %d files failed\n" % (len(errors), len(errors) + len(flights.flights)))
+        sys.exit(1)